@@ -0,0 +1,329 @@
+"""Micro-benchmarks of the data layer hot paths.
+
+Runs each hot path many times against a seeded synthetic database, offscreen,
+and reports latency percentiles per call along with the Python memory each
+call allocates. Allocations are measured in a separate, shorter pass with
+tracemalloc, which only sees Python objects and slows everything down.
+
+--save writes the results as JSON, --compare reads such a file and exits with
+an error if any median got slower than THRESHOLD times the saved one.
+
+Usage: python benchmarks/hot_paths.py [--size N] [--save FILE] [--compare FILE] [NAMES...]
+"""
+
+import argparse
+from collections.abc import Callable
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import partial
+import json
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PySide6 import QtCore, QtSql, QtWidgets
+from PySide6.QtCore import Qt
+
+from pypos.__main__ import build_database, load_resources
+from pypos.cart import CartTotals
+from pypos.common import adjust_value, calculate_margin, current_cart
+from pypos.db_executor import shutdown_executor
+from pypos.inventory import ProductInfoDialog
+from pypos.inventory_model import InventoryModel
+from pypos.read_cache import forget_connection
+from pypos.reports import ReportsWindow
+
+from synthetic import RATE, create_database
+
+DEFAULT_SIZE = 100_000
+CARTED = 50
+SALES = 10_000
+ITERATIONS = 200
+ALLOCATION_ITERATIONS = 20
+THRESHOLD = 1.2
+TIMEOUT = 60
+
+
+@dataclass
+class Benchmark:
+    name: str
+    run: Callable[[], object]
+    # Called before each run, not timed
+    setup: Callable[[], object] | None = None
+    # Calls made by each run, times are reported per call
+    calls: int = 1
+    iterations: int = ITERATIONS
+
+
+def wait_for(condition: Callable[[], bool]) -> None:
+    deadline = time.perf_counter() + TIMEOUT
+
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Condition not reached")
+
+        QtCore.QCoreApplication.processEvents()
+
+
+def measure(benchmark: Benchmark) -> dict:
+    times = []
+
+    for _ in range(benchmark.iterations):
+        if benchmark.setup is not None:
+            benchmark.setup()
+
+        start = time.perf_counter()
+        benchmark.run()
+        times.append((time.perf_counter() - start) / benchmark.calls)
+
+    allocated = []
+    peaks = []
+
+    tracemalloc.start()
+
+    for _ in range(min(benchmark.iterations, ALLOCATION_ITERATIONS)):
+        if benchmark.setup is not None:
+            benchmark.setup()
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        benchmark.run()
+        after, peak = tracemalloc.get_traced_memory()
+
+        allocated.append((after - before) / benchmark.calls)
+        peaks.append((peak - before) / benchmark.calls)
+
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(times, n=100, method="inclusive")
+
+    return {
+        "p50_us": percentiles[49] * 1e6,
+        "p90_us": percentiles[89] * 1e6,
+        "p99_us": percentiles[98] * 1e6,
+        "max_us": max(times) * 1e6,
+        "kept_bytes": statistics.mean(allocated),
+        "peak_bytes": statistics.mean(peaks),
+    }
+
+
+def model_benchmarks() -> list[Benchmark]:
+    model = InventoryModel()
+    model.set_visible_rows(30)
+    root = QtCore.QModelIndex()
+
+    model.load_data()
+
+    def fetch_more():
+        # Reloaded whenever everything was read, fetches must have rows left
+        if not model.canFetchMore(root):
+            model.load_data()
+
+    roles = (
+        Qt.ItemDataRole.DisplayRole,
+        Qt.ItemDataRole.UserRole,
+        Qt.ItemDataRole.DecorationRole,
+    )
+    page = [model.index(row, column) for row in range(64) for column in range(4)]
+
+    def read_page():
+        for index in page:
+            for role in roles:
+                model.data(index, role)
+
+    return [
+        Benchmark(
+            "InventoryModel.fetchMore", lambda: model.fetchMore(root), fetch_more
+        ),
+        Benchmark("InventoryModel.data", read_page, calls=len(page) * len(roles)),
+    ]
+
+
+def conversion_benchmarks() -> list[Benchmark]:
+    rate = Decimal(RATE)
+    values = [Decimal(n * 37) / 100 for n in range(1, 1001)]
+    pairs = [("VED", "USD"), ("USD", "VED"), ("USD", "USD")]
+
+    def convert():
+        for n, value in enumerate(values):
+            source, target = pairs[n % len(pairs)]
+            adjust_value(source, target, value, rate)
+
+    def margins():
+        for n, value in enumerate(values):
+            # Every hundredth purchase value is zero
+            calculate_margin(value * 2, values[n - 1] * (n % 100 != 0))
+
+    return [
+        Benchmark("adjust_value", convert, calls=len(values)),
+        Benchmark("calculate_margin", margins, calls=len(values)),
+    ]
+
+
+def cart_benchmarks() -> list[Benchmark]:
+    totals = CartTotals()
+    cart_id = current_cart()
+    rate = Decimal(RATE)
+    db = QtSql.QSqlDatabase.database()
+
+    def refresh():
+        # The work refresh hands to the executor, then showing its result
+        totals.show_totals(CartTotals.compute_totals(cart_id, rate, db))
+
+    return [
+        # Carts change between refreshes, their totals are never cached
+        Benchmark(
+            "CartTotals.refresh",
+            refresh,
+            lambda: forget_connection(db.connectionName()),
+        )
+    ]
+
+
+def report_benchmarks() -> list[Benchmark]:
+    window = ReportsWindow()
+    wait_for(window.progress.isHidden)
+
+    def load_report():
+        window.load_report()
+        wait_for(window.progress.isHidden)
+
+    return [Benchmark("ReportsWindow.load_report", load_report, iterations=50)]
+
+
+def product_benchmarks(size: int) -> list[Benchmark]:
+    dialogs: list[ProductInfoDialog] = []
+    counter = 0
+
+    def fill(dialog: ProductInfoDialog, n: int) -> None:
+        dialog.purchase_value.setValue(10 + n % 100)
+        dialog.sell_value.setValue(15 + n % 100)
+        dialog.quantity.setValue(n % 50)
+
+    def new_product():
+        nonlocal counter
+        counter += 1
+
+        dialog = ProductInfoDialog()
+        dialog.name.setText(f"Producto de prueba {counter}")
+        fill(dialog, counter)
+        dialogs[:] = [dialog]
+
+    def existing_product():
+        nonlocal counter
+        counter += 1
+
+        dialog = ProductInfoDialog(counter % size + 1)
+        fill(dialog, counter)
+        dialogs[:] = [dialog]
+
+    return [
+        Benchmark(
+            "ProductInfoDialog.accept (insert)",
+            lambda: dialogs[0].accept(),
+            new_product,
+        ),
+        Benchmark(
+            "ProductInfoDialog.accept (update)",
+            lambda: dialogs[0].accept(),
+            existing_product,
+        ),
+    ]
+
+
+def report(results: dict[str, dict], baseline: dict[str, dict] | None) -> bool:
+    """Print the results, False if any median regressed from `baseline`."""
+    header = (
+        f"{'benchmark':>34} {'p50':>11} {'p90':>11} {'p99':>11} {'max':>11}"
+        f" {'kept B':>9} {'peak B':>9}"
+    )
+    if baseline is not None:
+        header += f" {'vs saved':>9}"
+
+    print(header)
+
+    ok = True
+
+    for name, result in results.items():
+        line = (
+            f"{name:>34} {result['p50_us']:>9.1f}us {result['p90_us']:>9.1f}us"
+            f" {result['p99_us']:>9.1f}us {result['max_us']:>9.1f}us"
+            f" {result['kept_bytes']:>9.0f} {result['peak_bytes']:>9.0f}"
+        )
+
+        if baseline is not None and name in baseline:
+            ratio = result["p50_us"] / baseline[name]["p50_us"]
+            line += f" {ratio:>8.2f}x"
+
+            if ratio > THRESHOLD:
+                line += "  SLOWER"
+                ok = False
+
+        print(line)
+
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Data layer micro-benchmarks")
+    parser.add_argument("names", nargs="*", help="only run benchmarks named so")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--save", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    baseline = None
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())["results"]
+
+    app = QtWidgets.QApplication([])
+    app.setOrganizationName("mamg22")
+    app.setApplicationName("pypos-benchmarks")
+    QtCore.QSettings().setValue("USD-VED-rate", RATE)
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = create_database(
+            Path(tmp_dir) / "hot-paths.db", args.size, carted=CARTED, sales=SALES
+        )
+
+        db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
+        db.setDatabaseName(str(db_path))
+        db.open()
+        build_database()
+        load_resources()
+
+        for make_benchmarks in (
+            model_benchmarks,
+            conversion_benchmarks,
+            cart_benchmarks,
+            report_benchmarks,
+            partial(product_benchmarks, args.size),
+        ):
+            for benchmark in make_benchmarks():
+                if args.names and benchmark.name not in args.names:
+                    continue
+
+                results[benchmark.name] = measure(benchmark)
+
+        shutdown_executor()
+        db.close()
+
+    ok = report(results, baseline)
+
+    if args.save is not None:
+        args.save.write_text(
+            json.dumps({"size": args.size, "results": results}, indent=2) + "\n"
+        )
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
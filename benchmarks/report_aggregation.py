@@ -0,0 +1,112 @@
+"""Inventory report benchmark.
+
+Compares the original per-row report computation against the SQL aggregate
+and the trigger maintained InventoryTotals, checking all of them agree.
+
+Usage: python benchmarks/report_aggregation.py [SIZES...]
+"""
+
+from decimal import Decimal
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+from PySide6 import QtCore, QtSql
+
+from pypos.common import (
+    CURRENCY_FACTOR,
+    QUANTITY_FACTOR,
+    adjust_value,
+    checked_query,
+)
+from pypos.reports import inventory_totals
+
+from synthetic import create_database
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+RATE = "36.52"
+
+
+def row_scan_totals() -> tuple[Decimal, Decimal]:
+    """The report as computed before InventoryTotals, one product at a time."""
+    query = QtSql.QSqlQuery()
+
+    with checked_query(query) as check:
+        check.exec("""\
+        SELECT purchase_currency, purchase_value, sell_currency, sell_value, quantity
+        FROM Products p
+            INNER JOIN Inventory i
+            ON p.id = i.product
+        """)
+
+    total_cost_VED = Decimal(0)
+    total_value_VED = Decimal(0)
+
+    while query.next():
+        purchase_currency = query.value(0)
+        purchase_value = Decimal(query.value(1)) / CURRENCY_FACTOR
+        sell_currency = query.value(2)
+        sell_value = Decimal(query.value(3)) / CURRENCY_FACTOR
+        quantity = Decimal(query.value(4)) / QUANTITY_FACTOR
+
+        total_cost_VED += (
+            adjust_value(purchase_currency, "VED", purchase_value) * quantity
+        )
+        total_value_VED += adjust_value(sell_currency, "VED", sell_value) * quantity
+
+    return total_cost_VED, total_value_VED
+
+
+def best_of(func, repeat: int) -> tuple[float, tuple[Decimal, Decimal]]:
+    best = float("inf")
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    app = QtCore.QCoreApplication([])
+    app.setOrganizationName("mamg22")
+    app.setApplicationName("pypos-benchmarks")
+    QtCore.QSettings().setValue("USD-VED-rate", RATE)
+
+    print(f"{'rows':>10} {'row scan':>12} {'aggregate':>12} {'totals':>12}  equal")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            db_path = create_database(Path(tmp_dir) / f"report-{size}.db", size)
+
+            db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
+            db.setDatabaseName(str(db_path))
+            db.open()
+
+            repeat = 1 if size >= 1_000_000 else 3
+
+            scan_time, scan = best_of(row_scan_totals, repeat)
+            aggregate_time, aggregate = best_of(
+                lambda: inventory_totals(aggregate=True), repeat
+            )
+            totals_time, totals = best_of(inventory_totals, 100)
+
+            print(
+                f"{size:>10} {scan_time * 1000:>10.2f}ms "
+                f"{aggregate_time * 1000:>10.2f}ms {totals_time * 1000:>10.3f}ms"
+                f"  {scan == aggregate == totals}"
+            )
+
+            connection_name = db.connectionName()
+            db.close()
+            del db
+            QtSql.QSqlDatabase.removeDatabase(connection_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Inventory model row memory benchmark.
+
+Compares the memory taken by loaded inventory rows stored as one dataclass per
+row, as the model did before, against the columnar ProductRows, both with the
+id to row map the model keeps next to them.
+
+Usage: python benchmarks/row_memory.py [SIZES...]
+"""
+
+from dataclasses import dataclass
+from decimal import Decimal
+import sys
+import tracemalloc
+
+from pypos.common import CURRENCY_FACTOR, QUANTITY_FACTOR
+from pypos.inventory_model import ProductRows
+
+from synthetic import product_rows
+
+DEFAULT_SIZES = [10_000, 100_000]
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    """A loaded row as stored before ProductRows."""
+
+    id: int
+    name: str
+    sell_currency: str
+    sell_value: Decimal
+    quantity: Decimal
+    in_cart: Decimal | None
+
+
+def load_rows(size: int) -> list[tuple]:
+    """Rows as the model's load query returns them.
+
+    Names are kept encoded, each store decodes them as reading the query would
+    create them, so they are counted.
+    """
+    rows = []
+
+    for n, (
+        row_id,
+        name,
+        _,
+        _,
+        _,
+        sell_currency,
+        sell_value,
+        quantity,
+    ) in enumerate(product_rows(size)):
+        in_cart = 1000 if n % 100 == 0 else None
+        rows.append(
+            (row_id, name.encode(), quantity, sell_currency, sell_value, in_cart)
+        )
+
+    return rows
+
+
+def dataclass_store(rows: list[tuple]) -> tuple:
+    products = []
+    id_index_map = {}
+
+    for row_id, name, quantity, sell_currency, sell_value, in_cart in rows:
+        id_index_map[row_id] = len(products)
+        products.append(
+            Product(
+                row_id,
+                name.decode(),
+                sell_currency,
+                Decimal(sell_value) / CURRENCY_FACTOR,
+                Decimal(quantity) / QUANTITY_FACTOR,
+                Decimal(in_cart) / QUANTITY_FACTOR if in_cart else None,
+            )
+        )
+
+    return products, id_index_map
+
+
+def columnar_store(rows: list[tuple]) -> tuple:
+    products = ProductRows()
+    id_index_map = {}
+
+    for row_id, name, *values in rows:
+        id_index_map[row_id] = len(products)
+        products.append(row_id, name.decode(), *values)
+
+    return products, id_index_map
+
+
+def measure(store, size: int) -> tuple[float, float]:
+    """Bytes per row taken by the rows and by the id map."""
+    rows = load_rows(size)
+
+    tracemalloc.start()
+
+    before = tracemalloc.get_traced_memory()[0]
+    products, id_index_map = store(rows)
+    total = tracemalloc.get_traced_memory()[0] - before
+
+    del id_index_map
+    without_map = tracemalloc.get_traced_memory()[0] - before
+
+    tracemalloc.stop()
+    del products
+
+    return without_map / size, (total - without_map) / size
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(
+        f"{'rows':>10} {'storage':>10} {'bytes/row':>10} {'id map':>10} {'total':>10}"
+    )
+
+    for size in sizes:
+        for label, store in (
+            ("dataclass", dataclass_store),
+            ("columnar", columnar_store),
+        ):
+            row_bytes, map_bytes = measure(store, size)
+
+            print(
+                f"{size:>10} {label:>10} {row_bytes:>10.1f} {map_bytes:>10.1f}"
+                f" {row_bytes + map_bytes:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
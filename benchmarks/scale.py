@@ -0,0 +1,234 @@
+"""Application scale benchmark.
+
+Generates databases of each size, with items in the cart and recorded sales,
+and measures the main window against them offscreen: time to the first paint
+and to the first inventory load, search latency while typing typical queries,
+the cost of scrolling to the end of the inventory and of first viewing the
+cart. Each database is measured in a process of its own.
+
+Results are printed as JSON, to compare between commits.
+
+Usage: python benchmarks/scale.py [--carted N] [--sales N] [--output FILE] [SIZES...]
+"""
+
+import argparse
+from collections.abc import Callable
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+from PySide6 import QtCore, QtSql, QtWidgets
+
+from pypos.__main__ import MainWindow, build_database, load_resources
+from pypos.db_executor import shutdown_executor
+
+from synthetic import RATE, create_database
+
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_CARTED = 20
+DEFAULT_SALES = 10_000
+# Typed one key at a time, the last one has no exact match
+QUERIES = ["arroz", "arroz bla", "cafe ext", "1kg 5", "jabon 12u 99", "arros blamco"]
+TIMEOUT = 60
+
+
+def wait_for(condition: Callable[[], bool]) -> float:
+    """Process events until `condition` holds, returning when it did."""
+    deadline = time.perf_counter() + TIMEOUT
+
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Condition not reached")
+
+        QtCore.QCoreApplication.processEvents()
+
+    return time.perf_counter()
+
+
+def ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def measure(db_path: str) -> dict:
+    app = QtWidgets.QApplication([])
+    app.setOrganizationName("mamg22")
+    app.setApplicationName("pypos-benchmarks")
+    QtCore.QSettings().setValue("USD-VED-rate", RATE)
+
+    db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
+    db.setDatabaseName(db_path)
+    db.open()
+    build_database()
+    load_resources()
+
+    results = {}
+
+    start = time.perf_counter()
+    window = MainWindow()
+    window.resize(800, 600)
+
+    table = window.inventory.inventory_table
+    model = table.model
+    load_times = []
+    load_data = model.load_data
+
+    def timed_load_data():
+        load_start = time.perf_counter()
+        load_data()
+        load_times.append(time.perf_counter() - load_start)
+
+    model.load_data = timed_load_data
+
+    window.show()
+
+    results["first_paint_ms"] = ms(wait_for(lambda: window.painted) - start)
+    results["inventory_loaded_ms"] = ms(wait_for(lambda: bool(load_times)) - start)
+    results["first_load_data_ms"] = ms(load_times[0])
+
+    searches = []
+    search = window.inventory.topbar.search_submitted
+
+    for query in QUERIES:
+        keystrokes = []
+
+        for end in range(1, len(query) + 1):
+            key_start = time.perf_counter()
+            search.emit(query[:end])
+            keystrokes.append(time.perf_counter() - key_start)
+
+        searches.append(
+            {
+                "query": query,
+                "matches": model.result_size,
+                "fuzzy": model.fuzzy,
+                "last_key_ms": ms(keystrokes[-1]),
+                "mean_key_ms": ms(sum(keystrokes) / len(keystrokes)),
+                "max_key_ms": ms(max(keystrokes)),
+            }
+        )
+
+    results["searches"] = searches
+
+    search.emit("")
+    wait_for(lambda: True)
+
+    fetches = 0
+
+    def count_fetch():
+        nonlocal fetches
+        fetches += 1
+
+    model.rowsInserted.connect(count_fetch)
+    root = QtCore.QModelIndex()
+
+    scroll_start = time.perf_counter()
+
+    while model.canFetchMore(root):
+        table.table.scrollToBottom()
+        QtCore.QCoreApplication.processEvents()
+
+    results["scroll_to_end"] = {
+        "ms": ms(time.perf_counter() - scroll_start),
+        "rows": model.rowCount(),
+        "fetches": fetches,
+    }
+
+    cart_start = time.perf_counter()
+    window.show_cart()
+    results["first_cart_view_ms"] = ms(
+        wait_for(lambda: window.cart is not None) - cart_start
+    )
+
+    shutdown_executor()
+
+    return results
+
+
+def git_revision() -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        # Not run from a checkout, no revision to tag results with
+        check=False,
+    )
+
+    return result.stdout.strip() or None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Application scale benchmark")
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--carted", type=int, default=DEFAULT_CARTED)
+    parser.add_argument("--sales", type=int, default=DEFAULT_SALES)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        json.dump(measure(args.measure), sys.stdout)
+        return
+
+    runs = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(
+            os.environ,
+            QT_QPA_PLATFORM="offscreen",
+            # Keeps the benchmark's settings away from the user's
+            XDG_CONFIG_HOME=tmp_dir,
+        )
+
+        for size in args.sizes:
+            create_start = time.perf_counter()
+            db_path = create_database(
+                Path(tmp_dir) / f"scale-{size}.db",
+                size,
+                carted=args.carted,
+                sales=args.sales,
+            )
+            create_time = time.perf_counter() - create_start
+
+            result = subprocess.run(
+                [sys.executable, __file__, "--measure", str(db_path)],
+                env=env,
+                stdout=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+
+            run = {
+                "products": size,
+                "carted": args.carted,
+                "sales": args.sales,
+                "create_s": round(create_time, 2),
+                **json.loads(result.stdout),
+            }
+            runs.append(run)
+
+            print(
+                f"{size} products: first paint {run['first_paint_ms']}ms, "
+                f"loaded {run['inventory_loaded_ms']}ms, "
+                f"scroll to end {run['scroll_to_end']['ms']}ms",
+                file=sys.stderr,
+            )
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "runs": runs,
+    }
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Product search benchmark.
+
+Compares the SQL search of InventoryModel, counting the matches and reading the
+first page, against the in-memory SearchIndex, checking both give the same
+products in the same order. Also shows how long the index takes to load and
+the memory it takes.
+
+Usage: python benchmarks/search_index.py [SIZES...]
+"""
+
+from pathlib import Path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PySide6 import QtCore, QtSql
+from unidecode import unidecode
+
+from pypos.common import checked_query
+from pypos.inventory_model import InventoryModel
+from pypos.search_index import SearchIndex
+
+from synthetic import create_database
+
+DEFAULT_SIZES = [10_000, 100_000, 500_000]
+QUERIES = ["a", "ar", "arroz", "arroz bla", "cafe ext", "1kg 5", "jabon 12u 99"]
+PAGE_SIZE = 64
+
+
+def like_pattern(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace("%", "\\%")
+        .replace("_", "\\_")
+        .replace(" ", "%")
+    )
+
+
+def sql_search(pattern: str, limit: int | None = PAGE_SIZE) -> tuple[int, list[int]]:
+    """Number of matches and ids of the first ones, as InventoryModel reads them."""
+    query = QtSql.QSqlQuery()
+
+    with checked_query(query) as check:
+        check(
+            query.prepare(
+                "SELECT count(id) FROM Products " + InventoryModel.WHERE_CLAUSE
+            )
+        )
+        query.bindValue(":name_simplified", pattern)
+        check.exec()
+        check(query.next())
+
+        count = query.value(0)
+
+        check(
+            query.prepare(
+                "SELECT id FROM Products "
+                + InventoryModel.WHERE_CLAUSE
+                + InventoryModel.ORDER_CLAUSE
+                + ("" if limit is None else f"LIMIT {limit}")
+            )
+        )
+        query.bindValue(":name_simplified", pattern)
+        check.exec()
+
+    ids = []
+
+    while query.next():
+        ids.append(query.value(0))
+
+    return count, ids
+
+
+def best_of(func, repeat: int):
+    best = float("inf")
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    app = QtCore.QCoreApplication([])
+    app.setOrganizationName("mamg22")
+    app.setApplicationName("pypos-benchmarks")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            db_path = create_database(Path(tmp_dir) / f"search-{size}.db", size)
+
+            db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
+            db.setDatabaseName(str(db_path))
+            db.open()
+
+            start = time.perf_counter()
+            index = SearchIndex.load(db)
+            load_time = time.perf_counter() - start
+
+            # Loaded again, tracing allocations makes loading much slower
+            del index
+            tracemalloc.start()
+            index = SearchIndex.load(db)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            print(
+                f"{size} products, index loaded in {load_time:.2f}s, "
+                f"{memory / 2**20:.1f} MiB"
+            )
+            print(f"{'query':>14} {'matches':>8} {'sql':>10} {'index':>10}  equal")
+
+            for text in QUERIES:
+                text = unidecode(text).lower()
+                pattern = like_pattern(text)
+
+                sql_time, (count, _) = best_of(
+                    lambda pattern=pattern: sql_search(pattern), 3
+                )
+                index_time, ids = best_of(
+                    lambda index=index, text=text: index.search(text), 3
+                )
+
+                if ids is None:
+                    # Left to SQL by the index
+                    print(f"{text:>14} {count:>8} {sql_time * 1000:>8.2f}ms {'-':>10}")
+                    continue
+
+                _, all_ids = sql_search(pattern, limit=None)
+
+                print(
+                    f"{text:>14} {count:>8} {sql_time * 1000:>8.2f}ms "
+                    f"{index_time * 1000:>8.2f}ms  {ids == all_ids}"
+                )
+
+            print()
+
+            del index
+            connection_name = db.connectionName()
+            db.close()
+            del db
+            QtSql.QSqlDatabase.removeDatabase(connection_name)
+
+
+if __name__ == "__main__":
+    main()
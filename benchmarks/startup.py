@@ -0,0 +1,119 @@
+"""Application startup benchmark.
+
+Starts the application offscreen against a synthetic database, with
+PYPOS_STARTUP_TIMES=exit so it quits once started, under `python -X importtime`.
+Shows the slowest imports, as `-X importtime` breaks them down, and the time to
+each startup milestone, the first paint among them. Best of several runs.
+
+Usage: python benchmarks/startup.py [SIZES...]
+"""
+
+from collections import defaultdict
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+import tempfile
+
+from synthetic import create_database
+
+DEFAULT_SIZES = [10_000, 100_000]
+RUNS = 5
+SLOWEST_IMPORTS = 15
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+MILESTONE_LINE = re.compile(r"startup:\s+([\d.]+) ms .*\) (.+)")
+
+
+def run_application(data_dir: Path, config_dir: Path) -> str:
+    env = dict(
+        os.environ,
+        QT_QPA_PLATFORM="offscreen",
+        PYPOS_STARTUP_TIMES="exit",
+        PYTHONPATH=str(SRC_DIR),
+        XDG_DATA_HOME=str(data_dir),
+        XDG_CONFIG_HOME=str(config_dir),
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "pypos"],
+        env=env,
+        # Away from the repository root, its pypos.py would be imported instead
+        cwd=data_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return result.stderr
+
+
+def parse(output: str) -> tuple[dict[str, int], dict[str, float]]:
+    """Cumulative microseconds of top level imports and ms to each milestone."""
+    imports = {}
+    milestones = {}
+
+    for line in output.splitlines():
+        if match := IMPORT_LINE.match(line):
+            _, cumulative, indent, name = match.groups()
+
+            # Only those made by the application or the interpreter, the
+            # imports they make are counted in theirs
+            if len(indent) == 1:
+                imports[name] = int(cumulative)
+        elif match := MILESTONE_LINE.match(line):
+            elapsed, milestone = match.groups()
+            milestones[milestone] = float(elapsed)
+
+    return imports, milestones
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            data_dir = Path(tmp_dir) / f"data-{size}"
+            config_dir = Path(tmp_dir) / f"config-{size}"
+
+            app_dir = data_dir / "mamg22" / "pypos"
+            app_dir.mkdir(parents=True)
+            create_database(app_dir / "products.db", size)
+
+            best_imports: dict[str, int] = defaultdict(lambda: sys.maxsize)
+            best_milestones: dict[str, float] = defaultdict(lambda: float("inf"))
+
+            for _ in range(RUNS):
+                imports, milestones = parse(run_application(data_dir, config_dir))
+
+                for name, cumulative in imports.items():
+                    best_imports[name] = min(best_imports[name], cumulative)
+
+                for milestone, elapsed in milestones.items():
+                    best_milestones[milestone] = min(
+                        best_milestones[milestone], elapsed
+                    )
+
+            print(f"{size} products, best of {RUNS}")
+            print(f"{'import':>30} {'cumulative':>12}")
+
+            slowest = sorted(best_imports.items(), key=lambda item: -item[1])
+
+            for name, cumulative in slowest[:SLOWEST_IMPORTS]:
+                print(f"{name:>30} {cumulative / 1000:>10.1f}ms")
+
+            print(f"{'milestone':>30} {'elapsed':>12}")
+
+            for milestone, elapsed in sorted(
+                best_milestones.items(), key=lambda item: item[1]
+            ):
+                print(f"{milestone:>30} {elapsed:>10.1f}ms")
+
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Synthetic pypos databases for benchmarks.
+
+Databases are written directly with sqlite3 using the application schema, so
+generating a million products takes seconds instead of the minutes it would
+take through the GUI code paths.
+"""
+
+from decimal import Decimal
+from pathlib import Path
+import random
+import sqlite3
+import time
+
+from unidecode import unidecode
+
+from pypos.__main__ import MIGRATIONS, SCHEMA
+from pypos.common import adjust_value
+
+WORDS = """
+    Arroz Harina Azúcar Café Leche Aceite Pasta Sal Atún Sardina Jabón Champú
+    Detergente Galleta Refresco Jugo Queso Mantequilla Mayonesa Salsa Vinagre
+    Avena Caraota Lenteja Maíz Papel Servilleta Vela Fósforo Cloro Desinfectante
+    Crema Cepillo Pila Bombillo Cable
+""".split()
+VARIANTS = """
+    Blanco Integral Light Grande Pequeño Familiar Dulce Picante Natural Premium
+    Económico Extra Suave Fuerte
+""".split()
+UNITS = "1kg 500g 250g 1L 2L 500ml 12u 6u Unidad".split()
+CURRENCIES = ["VED", "USD"]
+RATE = "36.52"
+# Sales are spread over this many days up to now
+SALE_DAYS = 365
+MAX_SALE_ITEMS = 8
+
+# Rollup buckets of every sale, as sales.record_sale adds them one by one
+SALE_BUCKETS = """\
+    SELECT id AS sale, 'day' AS period,
+        date(time, 'unixepoch', 'localtime') AS start
+    FROM Sales
+    UNION ALL
+    SELECT id, 'week', date(time, 'unixepoch', 'localtime', 'weekday 0', '-6 days')
+    FROM Sales
+    UNION ALL
+    SELECT id, 'month', date(time, 'unixepoch', 'localtime', 'start of month')
+    FROM Sales
+"""
+
+
+def product_rows(products: int, seed: int = 0):
+    rng = random.Random(seed)
+
+    for i in range(products):
+        name = " ".join(
+            (rng.choice(WORDS), rng.choice(VARIANTS), rng.choice(UNITS), str(i))
+        )
+        purchase_value = rng.randint(100, 5_000_00)
+        sell_value = purchase_value + purchase_value * rng.randint(5, 60) // 100
+
+        yield (
+            i + 1,
+            name,
+            unidecode(name).lower(),
+            rng.choice(CURRENCIES),
+            purchase_value,
+            rng.choice(CURRENCIES),
+            sell_value,
+            rng.randint(0, 500) * 1000,
+        )
+
+
+def sale_rows(rows: list[tuple], sales: int, seed: int = 0):
+    """(sale, time, items) for `sales` sales of products from `rows`.
+
+    Items are SaleItems rows without the sale id, cost computed at RATE.
+    """
+    rng = random.Random(seed)
+    rate = Decimal(RATE)
+    end = int(time.time())
+    start = end - SALE_DAYS * 24 * 60 * 60
+
+    for sale_id in range(1, sales + 1):
+        sale_time = start + (end - start) * sale_id // sales
+        items = []
+
+        for row in rng.sample(rows, min(rng.randint(1, MAX_SALE_ITEMS), len(rows))):
+            product_id, name, _, purchase_currency, purchase_value = row[:5]
+            sell_currency, sell_value = row[5:7]
+            quantity = rng.randint(1, 5) * 1000
+
+            cost = adjust_value(
+                purchase_currency,
+                sell_currency,
+                Decimal(purchase_value * quantity),
+                rate,
+            ).to_integral_value()
+
+            items.append(
+                (
+                    product_id,
+                    name,
+                    quantity,
+                    purchase_currency,
+                    purchase_value,
+                    sell_currency,
+                    sell_value,
+                    int(cost),
+                )
+            )
+
+        yield sale_id, sale_time, items
+
+
+def create_database(
+    path: Path | str,
+    products: int,
+    seed: int = 0,
+    carted: int = 0,
+    sales: int = 0,
+) -> Path:
+    """Create a database at `path` holding `products` products with stock.
+
+    `carted` of them are put in the current cart, and `sales` sales of them
+    are recorded over the last SALE_DAYS days, with their rollups.
+    """
+    path = Path(path)
+    path.unlink(missing_ok=True)
+
+    db = sqlite3.connect(path)
+
+    for statement in SCHEMA:
+        db.execute(statement)
+
+    db.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+    rows = list(product_rows(products, seed))
+
+    # Filling the name grams product by product is much slower than in one go,
+    # the trigger and indexes are created again from SCHEMA
+    db.execute("DROP TRIGGER NameGrams_products_insert")
+    db.execute("DROP INDEX NameGrams_product")
+    db.execute("DROP INDEX SaleItems_product")
+
+    with db:
+        db.executemany(
+            """\
+            INSERT INTO Products(id, name, name_simplified, purchase_currency,
+                purchase_value, sell_currency, sell_value)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (row[:7] for row in rows),
+        )
+        db.executemany(
+            "INSERT INTO Inventory(product, quantity) VALUES (?, ?)",
+            ((row[0], row[7]) for row in rows),
+        )
+        db.execute("""\
+            INSERT OR IGNORE INTO NameGrams(gram, product)
+                SELECT substr(' ' || name_simplified || ' ', i, 3), id
+                FROM Products
+                    INNER JOIN GramPositions
+                    ON i <= length(name_simplified)
+                ORDER BY 1, 2
+            """)
+
+        if carted:
+            rng = random.Random(seed)
+            db.execute("INSERT INTO Carts(id) VALUES (1)")
+            db.executemany(
+                "INSERT INTO Cart(cart, product, quantity) VALUES (1, ?, ?)",
+                (
+                    (row[0], rng.randint(1, 5) * 1000)
+                    for row in rng.sample(rows, min(carted, len(rows)))
+                ),
+            )
+
+        if sales:
+            insert_sales(db, rows, sales, seed)
+        # Nobody is watching the bulk load, don't leave it to be replayed
+        db.execute("DELETE FROM ChangeLog")
+
+    for statement in SCHEMA:
+        db.execute(statement)
+
+    db.commit()
+    db.close()
+
+    return path
+
+
+def insert_sales(db: sqlite3.Connection, rows: list[tuple], sales: int, seed: int):
+    sale_records = []
+    item_records = []
+
+    for sale_id, sale_time, items in sale_rows(rows, sales, seed):
+        sale_records.append((sale_id, sale_time, RATE))
+        item_records.extend((sale_id, *item) for item in items)
+
+    db.executemany("INSERT INTO Sales(id, time, rate) VALUES (?, ?, ?)", sale_records)
+    db.executemany(
+        """\
+        INSERT INTO SaleItems(sale, product, name, quantity, purchase_currency,
+            purchase_value, sell_currency, sell_value, cost)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        item_records,
+    )
+
+    db.execute(
+        "INSERT INTO Rates(effective_at, rate) VALUES (?, ?)",
+        (sale_records[0][1], RATE),
+    )
+    db.execute(f"""\
+        INSERT INTO SalesRollup(period, start, currency, revenue, cost)
+            SELECT b.period, b.start, i.sell_currency,
+                sum(i.sell_value * i.quantity), sum(i.cost)
+            FROM SaleItems i
+                INNER JOIN ({SALE_BUCKETS}) b
+                ON b.sale = i.sale
+            GROUP BY b.period, b.start, i.sell_currency
+        """)
+    db.execute(f"""\
+        INSERT INTO ProductSalesRollup(period, start, product, name, units)
+            SELECT b.period, b.start, i.product, max(i.name), sum(i.quantity)
+            FROM SaleItems i
+                INNER JOIN ({SALE_BUCKETS}) b
+                ON b.sale = i.sale
+            GROUP BY b.period, b.start, i.product
+        """)
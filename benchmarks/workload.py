@@ -0,0 +1,462 @@
+"""Cashier workload replay.
+
+Works a day of sales through the main window offscreen, the way a cashier
+would: typing searches one key at a time, selecting the product found, adding
+it to the cart with some quantity, now and then changing the units of an item
+in the cart, accepting the sale and every so often opening the reports. Dialogs
+are answered as soon as they show up.
+
+Each action is timed until the application is idle again, its database jobs
+and refreshes done, and the queries issued meanwhile are counted. The
+latencies and query counts of each kind of action are printed, along with
+the statements issued the most over the day, those the query log saw take the
+most time and the reads repeated with the same values among the last ones.
+
+Usage: python benchmarks/workload.py [--sales N] [--items N] [--unit-changes P] [--reports N] [--pace SECONDS] [--search-index] [--output FILE]
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from collections.abc import Callable
+import json
+from pathlib import Path
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from PySide6 import QtCore, QtSql, QtWidgets
+from PySide6.QtCore import Qt
+from PySide6.QtTest import QTest
+
+from pypos.__main__ import MainWindow, build_database, load_resources
+from pypos.common import DecimalInputDialog
+from pypos.db_executor import DbJob, shutdown_executor
+from pypos.query_log import (
+    RECENT_QUERIES,
+    recent_queries,
+    reset_query_log,
+    statement_stats,
+)
+from pypos.refresh import refresh_coordinator
+from pypos.reports import ReportsWindow
+
+from scale import git_revision
+from synthetic import RATE, create_database
+
+DEFAULT_SIZE = 20_000
+DEFAULT_HISTORY = 10_000
+DEFAULT_SALES = 500
+DEFAULT_ITEMS = 3
+DEFAULT_UNIT_CHANGES = 0.25
+DEFAULT_REPORTS = 100
+# Only products with this many units in stock are sold, so none runs out
+MIN_STOCK = 50_000
+MOST_ISSUED = 10
+MOST_COSTLY = 10
+MOST_REPEATED = 10
+TIMEOUT = 60
+
+
+class QueryCounter:
+    """Counts the statements executed through QSqlQuery, on every thread."""
+
+    def __init__(self) -> None:
+        self.statements: Counter[str] = Counter()
+        self.total = 0
+        self.lock = threading.Lock()
+
+        exec_ = QtSql.QSqlQuery.exec
+        counter = self
+
+        def counted_exec(query: QtSql.QSqlQuery, *args):
+            result = exec_(query, *args)
+
+            with counter.lock:
+                counter.statements[args[0] if args else query.lastQuery()] += 1
+                counter.total += 1
+
+            return result
+
+        QtSql.QSqlQuery.exec = counted_exec
+
+
+def idle() -> bool:
+    return not DbJob.pending and not refresh_coordinator().timer.isActive()
+
+
+def settle() -> None:
+    """Process events until no database job or refresh is left to finish."""
+    deadline = time.perf_counter() + TIMEOUT
+
+    while True:
+        QtCore.QCoreApplication.processEvents()
+
+        # Results of jobs just finished may still be queued
+        if idle():
+            QtCore.QCoreApplication.processEvents()
+
+            if idle():
+                return
+
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Application didn't settle")
+
+
+def wait(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.005)
+
+
+class DialogAnswerer(QtCore.QObject):
+    """Answers modal dialogs as soon as they are shown."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.quantity: float | None = None
+
+    def expect(self, quantity: float | None = None) -> None:
+        """Enter `quantity` in the next dialog asking for one."""
+        self.quantity = quantity
+
+    def eventFilter(self, watched: QtCore.QObject, event: QtCore.QEvent) -> bool:
+        if event.type() != QtCore.QEvent.Type.Show:
+            return False
+
+        Queued = Qt.ConnectionType.QueuedConnection
+
+        # Answered once control gets back to the dialog's event loop
+        if isinstance(watched, DecimalInputDialog):
+            if self.quantity is not None:
+                watched.spinbox.setValue(self.quantity)
+
+            QtCore.QMetaObject.invokeMethod(watched, "accept", Queued)
+        elif isinstance(watched, QtWidgets.QMessageBox):
+            yes = watched.button(QtWidgets.QMessageBox.StandardButton.Yes)
+
+            if yes is not None:
+                QtCore.QMetaObject.invokeMethod(yes, "click", Queued)
+            else:
+                QtCore.QMetaObject.invokeMethod(watched, "accept", Queued)
+
+        return False
+
+
+class Cashier:
+    def __init__(
+        self,
+        window: MainWindow,
+        products: list[tuple[int, str]],
+        queries: QueryCounter,
+        answerer: DialogAnswerer,
+        rng: random.Random,
+        pace: float,
+    ) -> None:
+        self.window = window
+        self.products = products
+        self.queries = queries
+        self.answerer = answerer
+        self.rng = rng
+        self.pace = pace
+
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.issued: dict[str, list[int]] = defaultdict(list)
+
+    def act(self, action: str, do: Callable[[], object]) -> None:
+        if self.pace:
+            wait(self.pace)
+
+        issued = self.queries.total
+        start = time.perf_counter()
+
+        do()
+        settle()
+
+        self.latencies[action].append(time.perf_counter() - start)
+        self.issued[action].append(self.queries.total - issued)
+
+    def quantity(self) -> float:
+        # Mostly whole units, sometimes weighed
+        if self.rng.random() < 0.8:
+            return self.rng.randint(1, 5)
+
+        return round(self.rng.uniform(0.1, 3), 3)
+
+    def sell_item(self, product_id: int, name: str) -> None:
+        inventory = self.window.inventory
+        search_bar = inventory.topbar.search_bar
+
+        words = name.split()
+        # First word and the number closing every synthetic name
+        text = f"{words[0]} {words[-1]}"
+
+        self.act(
+            "clear search",
+            lambda: QTest.keyClick(
+                search_bar, Qt.Key.Key_A, Qt.KeyboardModifier.ControlModifier
+            ),
+        )
+
+        for char in text:
+            self.act("keystroke", lambda char=char: QTest.keyClicks(search_bar, char))
+
+        self.act("select", lambda: inventory.inventory_table.focus_product(product_id))
+
+        def add_to_cart():
+            self.answerer.expect(self.quantity())
+            inventory.product_actions.to_cart_button.click()
+
+        self.act("add to cart", add_to_cart)
+
+    def change_units(self, product_id: int) -> None:
+        cart = self.window.cart_widget()
+
+        def change():
+            cart.cart_table.focus_item(product_id)
+            self.answerer.expect(self.quantity())
+            cart.cart_actions.units_button.click()
+
+        self.act("change units", change)
+
+    def open_reports(self) -> None:
+        def open_and_load():
+            self.window.show_reports()
+            reports = self.window.findChild(ReportsWindow)
+
+            while not reports.progress.isHidden():
+                QtCore.QCoreApplication.processEvents()
+
+        self.act("open reports", open_and_load)
+
+        for reports in self.window.findChildren(ReportsWindow):
+            reports.close()
+
+    def work_sale(self, items: int, change_units: bool) -> None:
+        carted = self.rng.sample(self.products, items)
+
+        for product_id, name in carted:
+            self.sell_item(product_id, name)
+
+        self.act("view cart", self.window.show_cart)
+
+        if change_units:
+            self.change_units(self.rng.choice(carted)[0])
+
+        def accept():
+            self.answerer.expect()
+            self.window.cart_widget().cart_actions.accept_button.click()
+
+        self.act("accept sale", accept)
+
+        self.act(
+            "view inventory",
+            lambda: self.window.tabs.setCurrentWidget(self.window.inventory),
+        )
+
+
+def percentile(values: list[float], n: int) -> float:
+    if len(values) < 2:
+        return values[0]
+
+    return statistics.quantiles(values, n=100, method="inclusive")[n - 1]
+
+
+def summary(cashier: Cashier) -> dict[str, dict]:
+    results = {}
+
+    for action, latencies in cashier.latencies.items():
+        issued = cashier.issued[action]
+        results[action] = {
+            "count": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "max_ms": round(max(latencies) * 1000, 3),
+            "total_s": round(sum(latencies), 3),
+            "queries_mean": round(statistics.mean(issued), 2),
+            "queries_total": sum(issued),
+        }
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cashier workload replay")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument(
+        "--history", type=int, default=DEFAULT_HISTORY, help="sales already made"
+    )
+    parser.add_argument("--sales", type=int, default=DEFAULT_SALES)
+    parser.add_argument(
+        "--items", type=int, default=DEFAULT_ITEMS, help="mean items per sale"
+    )
+    parser.add_argument(
+        "--unit-changes",
+        type=float,
+        default=DEFAULT_UNIT_CHANGES,
+        help="share of sales changing the units of an item",
+    )
+    parser.add_argument(
+        "--reports",
+        type=int,
+        default=DEFAULT_REPORTS,
+        help="open the reports every this many sales, 0 for never",
+    )
+    parser.add_argument("--pace", type=float, default=0, help="seconds between actions")
+    parser.add_argument(
+        "--search-index", action="store_true", help="search through the index"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication([])
+    app.setOrganizationName("mamg22")
+    app.setApplicationName("pypos-benchmarks")
+    QtCore.QSettings().setValue("USD-VED-rate", RATE)
+    QtCore.QSettings().setValue("search_index", args.search_index)
+
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = create_database(
+            Path(tmp_dir) / "workload.db", args.size, sales=args.history
+        )
+
+        with sqlite3.connect(db_path) as conn:
+            products = conn.execute(
+                "SELECT id, name_simplified FROM Products p "
+                "INNER JOIN Inventory i ON i.product = p.id "
+                "WHERE i.quantity >= ?",
+                (MIN_STOCK,),
+            ).fetchall()
+
+        conn.close()
+
+        db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
+        db.setDatabaseName(str(db_path))
+        db.open()
+        build_database()
+        load_resources()
+
+        queries = QueryCounter()
+        answerer = DialogAnswerer()
+        app.installEventFilter(answerer)
+
+        window = MainWindow()
+        window.resize(800, 600)
+        window.show()
+
+        # Started, with the inventory shown and the search indexes loaded
+        while window.inventory.inventory_table.model.rowCount() == 0:
+            QtCore.QCoreApplication.processEvents()
+
+        settle()
+
+        cashier = Cashier(window, products, queries, answerer, rng, args.pace)
+        # Only the day's statements, not those run while starting
+        reset_query_log()
+        day_start = time.perf_counter()
+
+        for sale in range(1, args.sales + 1):
+            items = rng.randint(1, 2 * args.items - 1)
+            cashier.work_sale(items, rng.random() < args.unit_changes)
+
+            if args.reports and sale % args.reports == 0:
+                cashier.open_reports()
+
+        day_time = time.perf_counter() - day_start
+        costly = sorted(
+            statement_stats().items(), key=lambda item: item[1].total, reverse=True
+        )[:MOST_COSTLY]
+        # Same statement and values, a cache could have answered them
+        repeated = Counter(
+            (record.statement, record.bindings)
+            for record in recent_queries()
+            if record.ok and record.rows is None
+        )
+
+        shutdown_executor()
+        window.close()
+        db.close()
+
+    results = summary(cashier)
+
+    print(
+        f"{'action':>16} {'count':>7} {'p50':>10} {'p90':>10} {'p99':>10}"
+        f" {'max':>10} {'total':>9} {'queries':>8}"
+    )
+
+    for action, result in results.items():
+        print(
+            f"{action:>16} {result['count']:>7} {result['p50_ms']:>8.2f}ms"
+            f" {result['p90_ms']:>8.2f}ms {result['p99_ms']:>8.2f}ms"
+            f" {result['max_ms']:>8.2f}ms {result['total_s']:>8.2f}s"
+            f" {result['queries_mean']:>8.1f}"
+        )
+
+    print(f"{args.sales} sales in {day_time:.2f}s, {queries.total} queries")
+    print()
+    print(f"{'times':>8} statement")
+
+    for statement, times in queries.statements.most_common(MOST_ISSUED):
+        print(f"{times:>8} {' '.join(statement.split())[:100]}")
+
+    print()
+    print(f"{'times':>8} {'failed':>7} {'total':>10} {'slowest':>10} statement")
+
+    for statement, stats in costly:
+        print(
+            f"{stats.count:>8} {stats.failed:>7} {stats.total * 1000:>8.2f}ms"
+            f" {stats.slowest * 1000:>8.2f}ms {' '.join(statement.split())[:100]}"
+        )
+
+    print()
+    print(f"Reads repeated with the same values, last {RECENT_QUERIES} statements")
+    print(f"{'times':>8} statement")
+
+    for (statement, _), times in repeated.most_common(MOST_REPEATED):
+        if times < 2:
+            break
+
+        print(f"{times:>8} {' '.join(statement.split())[:100]}")
+
+    if args.output is not None:
+        report = {
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "products": args.size,
+            "history": args.history,
+            "sales": args.sales,
+            "items": args.items,
+            "unit_changes": args.unit_changes,
+            "reports": args.reports,
+            "pace": args.pace,
+            "search_index": args.search_index,
+            "seed": args.seed,
+            "day_s": round(day_time, 3),
+            "queries": queries.total,
+            "actions": results,
+            "statements": [
+                {
+                    "statement": " ".join(statement.split()),
+                    "count": stats.count,
+                    "failed": stats.failed,
+                    "total_ms": round(stats.total * 1000, 3),
+                    "slowest_ms": round(stats.slowest * 1000, 3),
+                }
+                for statement, stats in costly
+            ],
+        }
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
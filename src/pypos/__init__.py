@@ -0,0 +1,2 @@
+# First, so startup times include importing everything else
+from . import startup as startup
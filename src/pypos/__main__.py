@@ -1,18 +1,29 @@
+from __future__ import annotations
+
 from datetime import datetime
 from pathlib import Path
 import sys
-from typing import cast
+from typing import TYPE_CHECKING, cast
+
+from PySide6 import QtCore, QtGui, QtWidgets, QtSql
+from PySide6.QtCore import Qt
 
-from PySide6 import QtCore, QtWidgets, QtSql
 
+from . import inventory, startup, tracing
+from .changes import ChangeMonitor
+from .completion import load_completion_index
+from .common import QueryCheckFail, checked_query, forget_carted
+from .rates import rate_history
+from .refresh import CART, INVENTORY, PREVIEW, RATES, invalidate
+from .search_index import load_search_index
+from .tracing import traced
 
-from . import inventory, settings
-from .cart import CartWidget
-from .common import checked_query
-from .converter import ConverterDialog
-from .help import HelpDialog
-from .reports import ReportsWindow
-from . import resources as resources  # Only for the side effects
+# Dialogs and the cart are imported when first shown, most sessions never
+# open some of them
+if TYPE_CHECKING:
+    from .cart import CartWidget
+
+startup.mark("imports")
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -20,14 +31,20 @@ class MainWindow(QtWidgets.QMainWindow):
         super().__init__()
 
         self.inventory = inventory.InventoryWidget()
-        self.cart = CartWidget()
+
+        # Built into its tab when first viewed
+        self.cart: CartWidget | None = None
+        self.cart_tab = QtWidgets.QWidget()
+        cart_layout = QtWidgets.QVBoxLayout(self.cart_tab)
+        cart_layout.setContentsMargins(0, 0, 0, 0)
 
         self.tabs = QtWidgets.QTabWidget()
         self.tabs.tabBar().setExpanding(True)
         self.tabs.tabBar().setDocumentMode(True)
 
         self.tabs.addTab(self.inventory, "&Inventario")
-        self.tabs.addTab(self.cart, "&Carrito")
+        self.tabs.addTab(self.cart_tab, "&Carrito")
+        self.tabs.currentChanged.connect(self.tab_changed)
 
         self.setCentralWidget(self.tabs)
 
@@ -59,6 +76,11 @@ class MainWindow(QtWidgets.QMainWindow):
         rate_action.triggered.connect(self.show_rate_window)
         settings_action = options_menu.addAction("&Configuración...")
         settings_action.triggered.connect(self.show_settings_window)
+        options_menu.addSeparator()
+        self.tracing_action = options_menu.addAction("&Grabar traza de rendimiento")
+        self.tracing_action.setCheckable(True)
+        self.tracing_action.setChecked(tracing.tracing_enabled())
+        self.tracing_action.toggled.connect(self.toggle_tracing)
 
         help_menu = QtWidgets.QMenu("A&yuda")
         general_help_action = help_menu.addAction("&General")
@@ -72,14 +94,72 @@ class MainWindow(QtWidgets.QMainWindow):
         self.menuBar().addMenu(options_menu)
         self.menuBar().addMenu(help_menu)
 
-        self.inventory.cart_item.connect(self.cart.refresh)
-        self.inventory.view_in_cart.connect(self.cart.view_in_cart)
-        self.inventory.view_in_cart.connect(self.show_cart)
+        self.inventory.cart_item.connect(self.refresh_cart)
+        self.inventory.view_in_cart.connect(self.view_in_cart)
+
+        # Changes made by other instances of the application
+        self.changes = ChangeMonitor(self)
+        self.changes.products_changed.connect(self.inventory.update_products)
+        self.changes.products_added.connect(self.refresh_inventory)
+        self.changes.products_removed.connect(self.inventory.remove_products)
+        self.changes.cart_changed.connect(forget_carted)
+        self.changes.cart_changed.connect(self.inventory.update_products)
+        self.changes.cart_changed.connect(self.refresh_cart)
+        self.changes.rates_changed.connect(self.rates_changed)
+        self.changes.reset.connect(forget_carted)
+        self.changes.reset.connect(self.refresh_inventory)
+        self.changes.reset.connect(self.refresh_cart)
+
+        self.painted = False
+
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        super().paintEvent(event)
+
+        if not self.painted:
+            self.painted = True
+            startup.mark("first paint")
+            # Once the frame is out, so the window shows up before any data
+            QtCore.QTimer.singleShot(0, self.load_initial_data)
+
+    @QtCore.Slot()
+    @traced
+    def load_initial_data(self) -> None:
+        self.inventory.inventory_table.refresh_table()
+        startup.mark("inventory loaded")
+        startup.report()
+
+        # Loaded in the background, searches go through SQL until it's ready
+        load_search_index()
+
+    def cart_widget(self) -> CartWidget:
+        if self.cart is None:
+            from .cart import CartWidget
 
-        self.cart.sale_completed.connect(self.inventory.refresh)
-        self.cart.item_deleted.connect(self.inventory.refresh)
-        self.cart.item_updated.connect(self.inventory.update_item)
-        self.cart.view_in_inventory.connect(self.focus_inventory_item)
+            self.cart = CartWidget()
+            self.cart_tab.layout().addWidget(self.cart)
+
+            self.cart.sale_completed.connect(self.refresh_inventory)
+            self.cart.cart_switched.connect(self.refresh_inventory)
+            self.cart.item_deleted.connect(self.inventory.invalidate_product)
+            self.cart.item_updated.connect(self.inventory.invalidate_product)
+            self.cart.view_in_inventory.connect(self.focus_inventory_item)
+
+        return self.cart
+
+    @QtCore.Slot(int)
+    @traced
+    def tab_changed(self, index: int) -> None:
+        if self.tabs.widget(index) is self.cart_tab:
+            self.cart_widget()
+
+    @QtCore.Slot()
+    def refresh_inventory(self) -> None:
+        invalidate(INVENTORY)
+
+    @QtCore.Slot()
+    def refresh_cart(self) -> None:
+        # Nothing to do before the cart is built, it loads when it is
+        invalidate(CART)
 
     @QtCore.Slot()
     def update_rate(self) -> None:
@@ -115,21 +195,67 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.exchange_rate.setText(label)
 
+    @QtCore.Slot()
+    def rates_changed(self) -> None:
+        # The rate itself is kept in the settings, which another process wrote
+        QtCore.QSettings().sync()
+        rate_history.load()
+
+        self.update_rate()
+        self.rate_applied()
+
+    def rate_applied(self) -> None:
+        invalidate(RATES)
+        invalidate(PREVIEW)
+        invalidate(CART)
+
     @QtCore.Slot()
     def show_rate_window(self) -> None:
+        from . import settings
+
         rate_dialog = settings.ExchangeRateWindow()
         result = rate_dialog.exec()
         if result == rate_dialog.DialogCode.Accepted:
             self.update_rate()
-            self.inventory.refresh()
-            self.cart.do_refresh()
+            self.rate_applied()
 
     @QtCore.Slot()
     def show_settings_window(self) -> None:
+        from . import settings
+
         settings_dialog = settings.SettingsWindow()
         result = settings_dialog.exec()
         if result == settings_dialog.DialogCode.Accepted:
-            pass
+            load_search_index()
+            load_completion_index()
+
+    @QtCore.Slot(bool)
+    def toggle_tracing(self, checked: bool) -> None:
+        if checked:
+            tracing.start_tracing()
+            self.statusBar().showMessage("Grabando traza de rendimiento", 5000)
+            return
+
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Guardar traza", "pypos-trace.json", "Traza JSON (*.json)"
+        )
+
+        if path:
+            try:
+                spans = tracing.stop_tracing(path)
+            except OSError as e:
+                QtWidgets.QMessageBox.warning(
+                    self, "Error", f"No se pudo guardar la traza: {e.strerror}"
+                )
+            else:
+                self.statusBar().showMessage(
+                    f"Traza guardada: {spans} intervalos", 5000
+                )
+                return
+
+        # Still recording, the trace can be saved later
+        with QtCore.QSignalBlocker(self.tracing_action):
+            self.tracing_action.setChecked(True)
 
     @QtCore.Slot(int)
     def focus_inventory_item(self, product_id: int) -> None:
@@ -138,12 +264,21 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.Slot()
     def show_cart(self) -> None:
-        self.tabs.setCurrentWidget(self.cart)
+        self.tabs.setCurrentWidget(self.cart_tab)
+
+    @QtCore.Slot(int)
+    def view_in_cart(self, product_id: int) -> None:
+        self.show_cart()
+        self.cart_widget().view_in_cart(product_id)
 
     @QtCore.Slot()
     def show_reports(self) -> None:
-        reports_window = ReportsWindow()
-        reports_window.exec()
+        from .reports import ReportsWindow
+
+        reports_window = ReportsWindow(self)
+        reports_window.setModal(False)
+        reports_window.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        reports_window.show()
 
     @QtCore.Slot()
     def bye(self):
@@ -151,24 +286,63 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @QtCore.Slot()
     def show_inventory_help(self) -> None:
+        from .help import HelpDialog
+
         HelpDialog.inventory_help()
 
     @QtCore.Slot()
     def show_cart_help(self) -> None:
+        from .help import HelpDialog
+
         HelpDialog.cart_help()
 
     @QtCore.Slot()
     def show_general_help(self) -> None:
+        from .help import HelpDialog
+
         HelpDialog.general_help()
 
     @QtCore.Slot()
     def show_converter(self) -> None:
+        from .converter import ConverterDialog
+
         dialog = ConverterDialog(self)
         dialog.show()
 
 
+# Tables logged in ChangeLog and the column identifying their rows there
+CHANGE_LOGGED_TABLES = {
+    "Products": "id",
+    "Inventory": "product",
+    "Cart": "product",
+    "Rates": "effective_at",
+}
+
+
+def change_log_triggers() -> list[str]:
+    triggers = []
+
+    for table, key in CHANGE_LOGGED_TABLES.items():
+        for event, op, row in (
+            ("INSERT", "I", "NEW"),
+            ("UPDATE", "U", "NEW"),
+            ("DELETE", "D", "OLD"),
+        ):
+            triggers.append(f"""\
+CREATE TRIGGER IF NOT EXISTS ChangeLog_{table.lower()}_{event.lower()}
+AFTER {event} ON {table}
+BEGIN
+    INSERT INTO ChangeLog(tbl, row_id, op) VALUES ('{table}', {row}.{key}, '{op}');
+END;
+""")
+
+    return triggers
+
+
 SCHEMA: list[str] = [
     "PRAGMA foreign_keys = on;",
+    # Lets reports read from their own connection while sales are written
+    "PRAGMA journal_mode = WAL;",
     """\
 CREATE TABLE IF NOT EXISTS Products (
     id INTEGER PRIMARY KEY NOT NULL,
@@ -188,23 +362,374 @@ CREATE TABLE IF NOT EXISTS Inventory (
     FOREIGN KEY (product) REFERENCES Products(id)
         ON DELETE CASCADE
 );
+""",
+    """\
+CREATE TABLE IF NOT EXISTS Carts (
+    id INTEGER PRIMARY KEY NOT NULL,
+    created INTEGER NOT NULL DEFAULT (unixepoch())
+);
 """,
     """\
 CREATE TABLE IF NOT EXISTS Cart (
-    product INTEGER NOT NULL PRIMARY KEY,
+    cart INTEGER NOT NULL,
+    product INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (cart, product),
+    FOREIGN KEY (cart) REFERENCES Carts(id)
+        ON DELETE CASCADE,
+    FOREIGN KEY (product) REFERENCES Products(id)
+        ON DELETE RESTRICT
+);
+""",
+    "CREATE INDEX IF NOT EXISTS Cart_product ON Cart(product);",
+    # Trigrams of the simplified names, padded with a space on each side, for
+    # fuzzy_search. Names are only indexed up to GramPositions' last position
+    """\
+CREATE TABLE IF NOT EXISTS GramPositions (
+    i INTEGER PRIMARY KEY NOT NULL
+);
+""",
+    """\
+INSERT OR IGNORE INTO GramPositions(i)
+    WITH RECURSIVE positions(i) AS (
+        SELECT 1 UNION ALL SELECT i + 1 FROM positions WHERE i < 256
+    )
+    SELECT i FROM positions;
+""",
+    """\
+CREATE TABLE IF NOT EXISTS NameGrams (
+    gram TEXT NOT NULL,
+    product INTEGER NOT NULL,
+    PRIMARY KEY (gram, product)
+) WITHOUT ROWID;
+""",
+    "CREATE INDEX IF NOT EXISTS NameGrams_product ON NameGrams(product);",
+    """\
+CREATE TRIGGER IF NOT EXISTS NameGrams_products_insert
+AFTER INSERT ON Products
+BEGIN
+    INSERT OR IGNORE INTO NameGrams(gram, product)
+        SELECT substr(' ' || NEW.name_simplified || ' ', i, 3), NEW.id
+        FROM GramPositions WHERE i <= length(NEW.name_simplified);
+END;
+""",
+    """\
+CREATE TRIGGER IF NOT EXISTS NameGrams_products_update
+AFTER UPDATE OF name_simplified ON Products
+BEGIN
+    DELETE FROM NameGrams WHERE product = OLD.id;
+    INSERT OR IGNORE INTO NameGrams(gram, product)
+        SELECT substr(' ' || NEW.name_simplified || ' ', i, 3), NEW.id
+        FROM GramPositions WHERE i <= length(NEW.name_simplified);
+END;
+""",
+    """\
+CREATE TRIGGER IF NOT EXISTS NameGrams_products_delete
+AFTER DELETE ON Products
+BEGIN
+    DELETE FROM NameGrams WHERE product = OLD.id;
+END;
+""",
+    # Running totals of purchase cost ('cost') and sell value ('value') of the
+    # whole inventory by currency, kept in units of
+    # 1 / (CURRENCY_FACTOR * QUANTITY_FACTOR) by the triggers below
+    """\
+CREATE TABLE IF NOT EXISTS InventoryTotals (
+    kind TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (kind, currency)
+) WITHOUT ROWID;
+""",
+    """\
+CREATE TRIGGER IF NOT EXISTS InventoryTotals_inventory_insert
+AFTER INSERT ON Inventory
+BEGIN
+    INSERT INTO InventoryTotals(kind, currency, total)
+        SELECT 'cost', purchase_currency, purchase_value * NEW.quantity
+        FROM Products WHERE id = NEW.product
+        UNION ALL
+        SELECT 'value', sell_currency, sell_value * NEW.quantity
+        FROM Products WHERE id = NEW.product
+    ON CONFLICT DO UPDATE SET total = total + excluded.total;
+END;
+""",
+    """\
+CREATE TRIGGER IF NOT EXISTS InventoryTotals_inventory_update
+AFTER UPDATE OF product, quantity ON Inventory
+BEGIN
+    INSERT INTO InventoryTotals(kind, currency, total)
+        SELECT 'cost', purchase_currency, -purchase_value * OLD.quantity
+        FROM Products WHERE id = OLD.product
+        UNION ALL
+        SELECT 'value', sell_currency, -sell_value * OLD.quantity
+        FROM Products WHERE id = OLD.product
+        UNION ALL
+        SELECT 'cost', purchase_currency, purchase_value * NEW.quantity
+        FROM Products WHERE id = NEW.product
+        UNION ALL
+        SELECT 'value', sell_currency, sell_value * NEW.quantity
+        FROM Products WHERE id = NEW.product
+    ON CONFLICT DO UPDATE SET total = total + excluded.total;
+END;
+""",
+    # When the product itself is deleted the cascaded delete no longer sees the
+    # product row, its share is taken out by InventoryTotals_products_delete
+    """\
+CREATE TRIGGER IF NOT EXISTS InventoryTotals_inventory_delete
+AFTER DELETE ON Inventory
+BEGIN
+    INSERT INTO InventoryTotals(kind, currency, total)
+        SELECT 'cost', purchase_currency, -purchase_value * OLD.quantity
+        FROM Products WHERE id = OLD.product
+        UNION ALL
+        SELECT 'value', sell_currency, -sell_value * OLD.quantity
+        FROM Products WHERE id = OLD.product
+    ON CONFLICT DO UPDATE SET total = total + excluded.total;
+END;
+""",
+    """\
+CREATE TRIGGER IF NOT EXISTS InventoryTotals_products_update
+AFTER UPDATE OF purchase_currency, purchase_value, sell_currency, sell_value
+ON Products
+BEGIN
+    INSERT INTO InventoryTotals(kind, currency, total)
+        SELECT 'cost', OLD.purchase_currency, -OLD.purchase_value * quantity
+        FROM Inventory WHERE product = OLD.id
+        UNION ALL
+        SELECT 'value', OLD.sell_currency, -OLD.sell_value * quantity
+        FROM Inventory WHERE product = OLD.id
+        UNION ALL
+        SELECT 'cost', NEW.purchase_currency, NEW.purchase_value * quantity
+        FROM Inventory WHERE product = NEW.id
+        UNION ALL
+        SELECT 'value', NEW.sell_currency, NEW.sell_value * quantity
+        FROM Inventory WHERE product = NEW.id
+    ON CONFLICT DO UPDATE SET total = total + excluded.total;
+END;
+""",
+    """\
+CREATE TRIGGER IF NOT EXISTS InventoryTotals_products_delete
+BEFORE DELETE ON Products
+BEGIN
+    INSERT INTO InventoryTotals(kind, currency, total)
+        SELECT 'cost', OLD.purchase_currency, -OLD.purchase_value * quantity
+        FROM Inventory WHERE product = OLD.id
+        UNION ALL
+        SELECT 'value', OLD.sell_currency, -OLD.sell_value * quantity
+        FROM Inventory WHERE product = OLD.id
+    ON CONFLICT DO UPDATE SET total = total + excluded.total;
+END;
+""",
+    """\
+CREATE TABLE IF NOT EXISTS Sales (
+    id INTEGER PRIMARY KEY NOT NULL,
+    time INTEGER NOT NULL DEFAULT (unixepoch()),
+    rate TEXT NOT NULL
+);
+""",
+    # Products are copied over so sales stay as they were when made, cost is the
+    # purchase value of the line converted to the sell currency
+    """\
+CREATE TABLE IF NOT EXISTS SaleItems (
+    sale INTEGER NOT NULL,
+    product INTEGER,
+    name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    purchase_currency TEXT NOT NULL,
+    purchase_value INTEGER NOT NULL,
+    sell_currency TEXT NOT NULL,
+    sell_value INTEGER NOT NULL,
+    cost INTEGER NOT NULL,
+    FOREIGN KEY (sale) REFERENCES Sales(id)
+        ON DELETE CASCADE,
+    FOREIGN KEY (product) REFERENCES Products(id)
+        ON DELETE SET NULL
+);
+""",
+    "CREATE INDEX IF NOT EXISTS SaleItems_sale ON SaleItems(sale);",
+    "CREATE INDEX IF NOT EXISTS SaleItems_product ON SaleItems(product);",
+    # Sales totals by day, week and month, added to by sales.record_sale.
+    # start is the first day of the period as YYYY-MM-DD in local time, values
+    # are in units of 1 / (CURRENCY_FACTOR * QUANTITY_FACTOR)
+    """\
+CREATE TABLE IF NOT EXISTS SalesRollup (
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    revenue INTEGER NOT NULL,
+    cost INTEGER NOT NULL,
+    PRIMARY KEY (period, start, currency)
+) WITHOUT ROWID;
+""",
+    """\
+CREATE TABLE IF NOT EXISTS ProductSalesRollup (
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    product INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    units INTEGER NOT NULL,
+    PRIMARY KEY (period, start, product)
+) WITHOUT ROWID;
+""",
+    # Exchange rate history, each rate applies from effective_at onwards
+    """\
+CREATE TABLE IF NOT EXISTS Rates (
+    effective_at INTEGER PRIMARY KEY NOT NULL,
+    rate TEXT NOT NULL
+);
+""",
+    # Row level changes, so every connection (in this or another process) can
+    # tell what to reload. Read and pruned by changes.ChangeMonitor
+    """\
+CREATE TABLE IF NOT EXISTS ChangeLog (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tbl TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    op TEXT NOT NULL
+);
+""",
+    *change_log_triggers(),
+]
+
+# Each entry upgrades a database from `PRAGMA user_version` N to N + 1.
+# Fresh databases are created directly from SCHEMA and skip these.
+MIGRATIONS: list[list[str]] = [
+    # 1: Cart sessions, every cart item belongs to a cart in Carts
+    [
+        """\
+CREATE TABLE IF NOT EXISTS Carts (
+    id INTEGER PRIMARY KEY NOT NULL,
+    created INTEGER NOT NULL DEFAULT (unixepoch())
+);
+""",
+        "INSERT INTO Carts(id) VALUES (1);",
+        "ALTER TABLE Cart RENAME TO Cart_old;",
+        """\
+CREATE TABLE Cart (
+    cart INTEGER NOT NULL,
+    product INTEGER NOT NULL,
     quantity INTEGER NOT NULL,
+    PRIMARY KEY (cart, product),
+    FOREIGN KEY (cart) REFERENCES Carts(id)
+        ON DELETE CASCADE,
     FOREIGN KEY (product) REFERENCES Products(id)
         ON DELETE RESTRICT
 );
 """,
+        "INSERT INTO Cart(cart, product, quantity) SELECT 1, product, quantity FROM Cart_old;",
+        "DROP TABLE Cart_old;",
+    ],
+    # 2: Inventory totals, triggers are created afterwards from SCHEMA
+    [
+        """\
+CREATE TABLE IF NOT EXISTS InventoryTotals (
+    kind TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (kind, currency)
+) WITHOUT ROWID;
+""",
+        """\
+INSERT INTO InventoryTotals(kind, currency, total)
+    SELECT 'cost', purchase_currency, sum(purchase_value * quantity)
+    FROM Products p
+        INNER JOIN Inventory i
+        ON p.id = i.product
+    GROUP BY purchase_currency
+    UNION ALL
+    SELECT 'value', sell_currency, sum(sell_value * quantity)
+    FROM Products p
+        INNER JOIN Inventory i
+        ON p.id = i.product
+    GROUP BY sell_currency;
+""",
+    ],
+    # 3: Name trigrams, triggers are created afterwards from SCHEMA
+    [
+        """\
+CREATE TABLE IF NOT EXISTS GramPositions (
+    i INTEGER PRIMARY KEY NOT NULL
+);
+""",
+        """\
+INSERT OR IGNORE INTO GramPositions(i)
+    WITH RECURSIVE positions(i) AS (
+        SELECT 1 UNION ALL SELECT i + 1 FROM positions WHERE i < 256
+    )
+    SELECT i FROM positions;
+""",
+        """\
+CREATE TABLE IF NOT EXISTS NameGrams (
+    gram TEXT NOT NULL,
+    product INTEGER NOT NULL,
+    PRIMARY KEY (gram, product)
+) WITHOUT ROWID;
+""",
+        """\
+INSERT OR IGNORE INTO NameGrams(gram, product)
+    SELECT substr(' ' || name_simplified || ' ', i, 3), id
+    FROM Products
+        INNER JOIN GramPositions
+        ON i <= length(name_simplified)
+    ORDER BY 1, 2;
+""",
+    ],
 ]
 
 
+def load_resources() -> None:
+    """Make the assets available under ":/", from the binary bundle if built."""
+    bundle = Path(__file__).with_name("resources.rcc")
+
+    if bundle.exists() and QtCore.QResource.registerResource(str(bundle)):
+        return
+
+    from . import resources as resources  # Only for the side effects
+
+
 def build_database() -> None:
+    query = QtSql.QSqlQuery()
+
+    with checked_query(query) as check:
+        check.exec("SELECT count(name) FROM sqlite_schema WHERE name = 'Products'")
+        check(query.next())
+        is_new = query.value(0) == 0
+
+        check.exec("PRAGMA user_version")
+        check(query.next())
+        version = query.value(0)
+
+    # An unfinished statement keeps a transaction open, blocking the WAL switch
+    query.finish()
+
+    if not is_new:
+        db = QtSql.QSqlDatabase.database()
+
+        for target_version, migration in enumerate(
+            MIGRATIONS[version:], start=version + 1
+        ):
+            db.transaction()
+
+            try:
+                with checked_query(query) as check:
+                    for statement in migration:
+                        check.exec(statement)
+                    check.exec(f"PRAGMA user_version = {target_version}")
+            except QueryCheckFail:
+                db.rollback()
+                raise
+
+            db.commit()
+
     for statement in SCHEMA:
         schema_query = QtSql.QSqlQuery()
         with checked_query(schema_query) as check:
-            check(schema_query.exec(statement))
+            check.exec(statement)
+
+    if is_new:
+        with checked_query(query) as check:
+            check.exec(f"PRAGMA user_version = {len(MIGRATIONS)}")
 
 
 def main() -> None:
@@ -212,6 +737,8 @@ def main() -> None:
     app.setOrganizationName("mamg22")
     app.setApplicationName("pypos")
 
+    load_resources()
+
     translator = QtCore.QTranslator()
     translator.load(
         QtCore.QLocale(),
@@ -255,8 +782,12 @@ def main() -> None:
 
     main_window.resize(800, 600)
     main_window.show()
+    startup.mark("window shown")
+
+    status = app.exec()
+    tracing.save_startup_trace()
 
-    sys.exit(app.exec())
+    sys.exit(status)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from decimal import Decimal
+from functools import partial
 from typing import cast
 
 from PySide6 import QtCore, QtGui, QtSql, QtWidgets
@@ -6,13 +7,26 @@ from PySide6.QtCore import Qt
 
 from .common import (
     FP_SHORTEST,
+    ColumnSizer,
     QUANTITY_FACTOR,
     DecimalInputDialog,
     adjust_value,
     CURRENCY_SYMBOL,
     CURRENCY_FACTOR,
+    carted_products,
     checked_query,
+    clear_carted,
+    current_cart,
+    set_carted,
+    set_current_cart,
+    take_table_items,
+    uncart,
 )
+from .db_executor import DbJob, db_executor
+from .read_cache import cached_rows
+from .refresh import CART, invalidate, refresh_coordinator
+from .sales import record_sale
+from .tracing import traced
 
 SB = QtWidgets.QMessageBox.StandardButton
 
@@ -26,6 +40,7 @@ class CartTable(QtWidgets.QTableWidget):
     FROM Cart c
         INNER JOIN Products p
         ON c.product = p.id
+    WHERE c.cart = :cart
     """
 
     def __init__(self) -> None:
@@ -41,11 +56,10 @@ class CartTable(QtWidgets.QTableWidget):
         self.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
 
         h_header = self.horizontalHeader()
-
-        h_header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.ResizeToContents)
-        h_header.setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeMode.Stretch)
         h_header.setMinimumSectionSize(h_header.defaultSectionSize())
 
+        self.column_sizer = ColumnSizer(self)
+
         self.verticalHeader().setSectionResizeMode(
             QtWidgets.QHeaderView.ResizeMode.Fixed
         )
@@ -53,25 +67,39 @@ class CartTable(QtWidgets.QTableWidget):
         self.itemSelectionChanged.connect(self.row_selected)
         self.itemDoubleClicked.connect(self.item_double_clicked)
 
+        self.loading: DbJob | None = None
+        self.focus_after_load: int | None = None
+
         self.refresh()
 
     @QtCore.Slot()
+    @traced
     def refresh(self) -> None:
-        db = QtSql.QSqlDatabase.database()
-        query = QtSql.QSqlQuery()
+        self.loading = db_executor().call(
+            partial(self.load_rows, current_cart()), key="cart-table"
+        )
+        self.loading.done.connect(self.show_rows)
+        self.loading.failed.connect(self.load_failed)
 
-        with checked_query(query) as check:
-            check(query.prepare(self.CART_QUERY))
-            check(query.exec())
+    @classmethod
+    def load_rows(cls, cart_id: int, db: QtSql.QSqlDatabase) -> list[tuple]:
+        # Runs on an executor lane
+        return cached_rows(cls.CART_QUERY, {":cart": cart_id}, db)
 
-        if db.driver().hasFeature(QtSql.QSqlDriver.DriverFeature.QuerySize):
-            n_rows = query.size()
-        else:
-            query.last()
-            n_rows = max(query.at() + 1, 0)
-            query.seek(QtSql.QSql.Location.BeforeFirstRow.value)
+    @QtCore.Slot()
+    def load_failed(self) -> None:
+        if self.sender() is self.loading:
+            self.loading = None
+            self.focus_after_load = None
 
-        self.setRowCount(n_rows)
+    @QtCore.Slot(object)
+    @traced
+    def show_rows(self, rows: list[tuple]) -> None:
+        # Older loads are cancelled, only the latest one gets here
+        self.loading = None
+
+        take_table_items(self)
+        self.setRowCount(len(rows))
 
         ItemFlag = Qt.ItemFlag
         row_flags = ItemFlag.ItemIsSelectable | ItemFlag.ItemIsEnabled
@@ -79,11 +107,13 @@ class CartTable(QtWidgets.QTableWidget):
 
         locale = QtCore.QLocale()
 
-        for row_num in range(n_rows):
-            query.next()
-            row_id, name, quantity, sell_currency, int_sell_value = (
-                query.value(i) for i in range(query.record().count())
-            )
+        for row_num, (
+            row_id,
+            name,
+            quantity,
+            sell_currency,
+            int_sell_value,
+        ) in enumerate(rows):
             sell_value = Decimal(int_sell_value) / CURRENCY_FACTOR
             quantity = Decimal(quantity) / QUANTITY_FACTOR
 
@@ -119,9 +149,15 @@ class CartTable(QtWidgets.QTableWidget):
             ):
                 self.setItem(row_num, idx, item)
 
+        self.column_sizer.fit()
+
         self.clearSelection()
         self.row_selected()
 
+        if self.focus_after_load is not None:
+            self.focus_item(self.focus_after_load)
+            self.focus_after_load = None
+
     @QtCore.Slot()
     def row_selected(self) -> None:
         try:
@@ -132,6 +168,11 @@ class CartTable(QtWidgets.QTableWidget):
 
     @QtCore.Slot(int)
     def focus_item(self, product_id: int) -> None:
+        if self.loading is not None:
+            # Focused once the rows being loaded are shown
+            self.focus_after_load = product_id
+            return
+
         model = self.model()
 
         if model.hasIndex(0, 0):
@@ -153,6 +194,14 @@ class CartTable(QtWidgets.QTableWidget):
 
 
 class CartTotals(QtWidgets.QFrame):
+    TOTALS_QUERY = """\
+    SELECT sell_currency, sell_value, quantity
+    FROM Cart c
+        INNER JOIN Products p
+        ON c.product = p.id
+    WHERE c.cart = :cart
+    """
+
     def __init__(self) -> None:
         super().__init__()
 
@@ -185,30 +234,38 @@ class CartTotals(QtWidgets.QFrame):
         self.refresh()
 
     @QtCore.Slot()
+    @traced
     def refresh(self) -> None:
-        query = QtSql.QSqlQuery()
+        rate = Decimal(cast(str, QtCore.QSettings().value("USD-VED-rate", 1, type=str)))
 
-        with checked_query(query) as check:
-            check(
-                query.prepare("""\
-            SELECT sell_currency, sell_value, quantity
-            FROM Cart c
-                INNER JOIN Products p
-                ON c.product = p.id
-            """)
-            )
-            check(query.exec())
+        job = db_executor().call(
+            partial(self.compute_totals, current_cart(), rate), key="cart-totals"
+        )
+        job.done.connect(self.show_totals)
+
+    @classmethod
+    def compute_totals(
+        cls, cart_id: int, rate: Decimal, db: QtSql.QSqlDatabase
+    ) -> tuple[Decimal, Decimal]:
+        # Runs on an executor lane, settings are read beforehand on the GUI thread
+        rows = cached_rows(cls.TOTALS_QUERY, {":cart": cart_id}, db)
 
         total_VED = Decimal(0)
         total_USD = Decimal(0)
 
-        while query.next():
-            sell_currency = query.value(0)
-            sell_value = Decimal(query.value(1)) / CURRENCY_FACTOR
-            quantity = Decimal(query.value(2)) / QUANTITY_FACTOR
+        for sell_currency, int_sell_value, int_quantity in rows:
+            sell_value = Decimal(int_sell_value) / CURRENCY_FACTOR
+            quantity = Decimal(int_quantity) / QUANTITY_FACTOR
 
-            total_VED += adjust_value(sell_currency, "VED", sell_value * quantity)
-            total_USD += adjust_value(sell_currency, "USD", sell_value * quantity)
+            total_VED += adjust_value(sell_currency, "VED", sell_value * quantity, rate)
+            total_USD += adjust_value(sell_currency, "USD", sell_value * quantity, rate)
+
+        return total_VED, total_USD
+
+    @QtCore.Slot(object)
+    @traced
+    def show_totals(self, totals: tuple[Decimal, Decimal]) -> None:
+        total_VED, total_USD = totals
 
         locale = QtCore.QLocale()
 
@@ -221,6 +278,7 @@ class CartTotals(QtWidgets.QFrame):
 class CartActions(QtWidgets.QWidget):
     sale_completed = QtCore.Signal()
     sale_discarded = QtCore.Signal()
+    cart_switched = QtCore.Signal()
     item_deleted = QtCore.Signal(int)
     item_updated = QtCore.Signal(int)
     view_in_inventory = QtCore.Signal(int)
@@ -251,13 +309,18 @@ class CartActions(QtWidgets.QWidget):
         item_actions.setLayout(item_layout)
 
         cart_actions = QtWidgets.QGroupBox("Carrito")
+        self.cart_actions = cart_actions
 
         self.accept_button = QtWidgets.QPushButton("&Aceptar venta")
         self.discard_button = QtWidgets.QPushButton("&Descartar todo")
+        self.park_button = QtWidgets.QPushButton("A&partar")
+        self.switch_button = QtWidgets.QPushButton("Ca&mbiar...")
 
         cart_layout = QtWidgets.QHBoxLayout()
         cart_layout.addWidget(self.accept_button)
         cart_layout.addWidget(self.discard_button)
+        cart_layout.addWidget(self.park_button)
+        cart_layout.addWidget(self.switch_button)
 
         cart_actions.setLayout(cart_layout)
 
@@ -272,8 +335,11 @@ class CartActions(QtWidgets.QWidget):
         self.delete_button.clicked.connect(self.delete)
         self.accept_button.clicked.connect(self.accept_sale)
         self.discard_button.clicked.connect(self.discard_sale)
+        self.park_button.clicked.connect(self.park_cart)
+        self.switch_button.clicked.connect(self.switch_cart)
 
         self.set_current_id(None)
+        self.update_cart_status()
 
     @QtCore.Slot(object)
     def set_current_id(self, product_id: int | None) -> None:
@@ -283,6 +349,7 @@ class CartActions(QtWidgets.QWidget):
         self.item_actions.setEnabled(enable)
 
     @QtCore.Slot()
+    @traced
     def accept_sale(self) -> None:
         confirm = QtWidgets.QMessageBox.question(
             self, "Confirmar venta", "¿Está seguro de que desea completar esta venta?"
@@ -291,19 +358,36 @@ class CartActions(QtWidgets.QWidget):
         if confirm != SB.Yes:
             return
 
+        db = QtSql.QSqlDatabase.database()
+        db.transaction()
+
         query = QtSql.QSqlQuery()
 
-        with checked_query(query) as check:
-            check(
-                query.prepare("""\
-            UPDATE Inventory AS i SET quantity = i.quantity - c.quantity
-            FROM Cart c
-                WHERE i.product = c.product
-            """)
-            )
-            check(query.exec())
+        try:
+            record_sale(current_cart())
 
-            check(query.exec("DELETE FROM Cart"))
+            with checked_query(query) as check:
+                check(
+                    query.prepare("""\
+                UPDATE Inventory AS i SET quantity = i.quantity - c.quantity
+                FROM Cart c
+                    WHERE i.product = c.product AND c.cart = :cart
+                """)
+                )
+                query.bindValue(":cart", current_cart())
+                check.exec()
+
+                check(query.prepare("DELETE FROM Cart WHERE cart = :cart"))
+                query.bindValue(":cart", current_cart())
+                check.exec()
+        except BaseException:
+            # Whatever failed, later writes mustn't end up in this transaction
+            db.rollback()
+            raise
+
+        db.commit()
+
+        clear_carted()
 
         self.sale_completed.emit()
 
@@ -322,7 +406,11 @@ class CartActions(QtWidgets.QWidget):
         query = QtSql.QSqlQuery()
 
         with checked_query(query) as check:
-            check(query.exec("DELETE FROM Cart"))
+            check(query.prepare("DELETE FROM Cart WHERE cart = :cart"))
+            query.bindValue(":cart", current_cart())
+            check.exec()
+
+        clear_carted()
 
         self.sale_discarded.emit()
 
@@ -344,15 +432,23 @@ class CartActions(QtWidgets.QWidget):
         query = QtSql.QSqlQuery()
 
         with checked_query(query) as check:
-            check(query.prepare("DELETE FROM Cart WHERE product = :product"))
+            check(
+                query.prepare(
+                    "DELETE FROM Cart WHERE cart = :cart AND product = :product"
+                )
+            )
+            query.bindValue(":cart", current_cart())
             query.bindValue(":product", self.current_id)
 
-            check(query.exec())
+            check.exec()
+
+        uncart(self.current_id)
 
         self.item_deleted.emit(self.current_id)
         self.set_current_id(None)
 
     @QtCore.Slot()
+    @traced
     def units(self) -> None:
         if self.current_id is None:
             return
@@ -362,19 +458,27 @@ class CartActions(QtWidgets.QWidget):
         with checked_query(query) as check:
             check(
                 query.prepare("""\
-            SELECT p.name, i.quantity as available, coalesce(c.quantity, 0) as in_cart
+            SELECT
+                p.name,
+                i.quantity - coalesce(
+                    (SELECT sum(o.quantity) FROM Cart o
+                     WHERE o.product = c.product AND o.cart != c.cart),
+                    0
+                ) as available,
+                coalesce(c.quantity, 0) as in_cart
             FROM Cart c
                 INNER JOIN Products p
                 ON c.product = p.id
                 INNER JOIN Inventory i
                 USING (product)
-            WHERE c.product = :id
+            WHERE c.cart = :cart AND c.product = :id
             """)
             )
 
+            query.bindValue(":cart", current_cart())
             query.bindValue(":id", self.current_id)
 
-            check(query.exec())
+            check.exec()
 
             check(query.next())
 
@@ -399,15 +503,19 @@ class CartActions(QtWidgets.QWidget):
         if ok:
             with checked_query(query) as check:
                 check(
-                    query.prepare(
-                        "UPDATE Cart SET quantity = :quantity WHERE product = :product"
-                    )
+                    query.prepare("""\
+                UPDATE Cart SET quantity = :quantity
+                WHERE cart = :cart AND product = :product
+                """)
                 )
 
+                query.bindValue(":cart", current_cart())
                 query.bindValue(":product", self.current_id)
                 query.bindValue(":quantity", int(quantity * QUANTITY_FACTOR))
 
-                check(query.exec())
+                check.exec()
+
+            set_carted(self.current_id, int(quantity * QUANTITY_FACTOR))
 
             self.item_updated.emit(self.current_id)
 
@@ -416,10 +524,189 @@ class CartActions(QtWidgets.QWidget):
         if self.current_id is not None:
             self.view_in_inventory.emit(self.current_id)
 
+    @QtCore.Slot()
+    def park_cart(self) -> None:
+        if not carted_products():
+            QtWidgets.QMessageBox.information(
+                self,
+                "Carrito vacío",
+                "El carrito actual está vacío, no hay nada que apartar.",
+            )
+            return
+
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check.exec("INSERT INTO Carts DEFAULT VALUES")
+            new_cart = query.lastInsertId()
+
+        set_current_cart(new_cart)
+        self.set_current_id(None)
+        self.cart_switched.emit()
+
+    @QtCore.Slot()
+    def switch_cart(self) -> None:
+        dialog = CartSwitchDialog(self)
+        result = dialog.exec()
+
+        if result != CartSwitchDialog.DialogCode.Accepted:
+            return
+
+        target = dialog.selected_cart()
+
+        if target is None or target == current_cart():
+            return
+
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            # The cart being left behind is only kept if something was parked in it
+            check(
+                query.prepare("""\
+            DELETE FROM Carts
+            WHERE id = :cart
+                AND NOT EXISTS (SELECT 1 FROM Cart WHERE cart = :cart)
+            """)
+            )
+            query.bindValue(":cart", current_cart())
+            check.exec()
+
+        set_current_cart(target)
+        self.set_current_id(None)
+        self.cart_switched.emit()
+
+    @QtCore.Slot()
+    def update_cart_status(self) -> None:
+        self.cart_actions.setTitle(f"Carrito #{current_cart()}")
+
+        job = db_executor().call(
+            partial(self.count_parked, current_cart()), key="cart-status"
+        )
+        job.done.connect(self.show_parked)
+
+    @staticmethod
+    def count_parked(cart_id: int, db: QtSql.QSqlDatabase) -> int:
+        # Runs on an executor lane
+        query = QtSql.QSqlQuery(db)
+
+        with checked_query(query) as check:
+            check(
+                query.prepare("""\
+            SELECT count(DISTINCT cart) FROM Cart WHERE cart != :cart
+            """)
+            )
+            query.bindValue(":cart", cart_id)
+            check.exec()
+            check(query.next())
+
+        return query.value(0)
+
+    @QtCore.Slot(object)
+    def show_parked(self, parked: int) -> None:
+        self.switch_button.setText(f"Ca&mbiar ({parked})...")
+        self.switch_button.setEnabled(parked > 0)
+
+
+class CartSwitchDialog(QtWidgets.QDialog):
+    PARKED_QUERY = """\
+    SELECT k.id, k.created, count(c.product), group_concat(p.name, ', ')
+    FROM Carts k
+        INNER JOIN Cart c
+        ON c.cart = k.id
+        INNER JOIN Products p
+        ON c.product = p.id
+    WHERE k.id != :cart
+    GROUP BY k.id
+    ORDER BY k.id
+    """
+
+    def __init__(self, parent: QtWidgets.QWidget | None = None) -> None:
+        super().__init__(parent)
+
+        self.setWindowTitle("Carritos apartados")
+
+        self.carts = QtWidgets.QTableWidget()
+
+        header_labels = ["Carrito", "Creado", "Productos", "Contenido"]
+        self.carts.setColumnCount(len(header_labels))
+        self.carts.setHorizontalHeaderLabels(header_labels)
+        self.carts.setSelectionBehavior(
+            QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows
+        )
+        self.carts.setSelectionMode(
+            QtWidgets.QAbstractItemView.SelectionMode.SingleSelection
+        )
+        self.carts.verticalHeader().hide()
+
+        h_header = self.carts.horizontalHeader()
+        h_header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.ResizeToContents)
+        h_header.setSectionResizeMode(3, QtWidgets.QHeaderView.ResizeMode.Stretch)
+
+        SB = QtWidgets.QDialogButtonBox.StandardButton
+        buttons = QtWidgets.QDialogButtonBox(SB.Ok | SB.Cancel)
+        buttons.button(SB.Ok).setText("&Retomar")
+
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        self.carts.itemDoubleClicked.connect(self.accept)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.carts)
+        layout.addWidget(buttons)
+        self.setLayout(layout)
+
+        self.resize(600, 300)
+
+        self.load_carts()
+
+    def load_carts(self) -> None:
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check(query.prepare(self.PARKED_QUERY))
+            query.bindValue(":cart", current_cart())
+            check.exec()
+
+        ItemFlag = Qt.ItemFlag
+        row_flags = ItemFlag.ItemIsSelectable | ItemFlag.ItemIsEnabled
+
+        locale = QtCore.QLocale()
+
+        while query.next():
+            cart_id, created, n_products, contents = (
+                query.value(i) for i in range(query.record().count())
+            )
+
+            created_date = locale.toString(
+                QtCore.QDateTime.fromSecsSinceEpoch(created),
+                QtCore.QLocale.FormatType.ShortFormat,
+            )
+
+            row_num = self.carts.rowCount()
+            self.carts.insertRow(row_num)
+
+            for idx, text in enumerate(
+                (f"#{cart_id}", created_date, str(n_products), contents)
+            ):
+                item = QtWidgets.QTableWidgetItem(text)
+                item.setFlags(row_flags)
+                item.setData(Qt.ItemDataRole.UserRole, cart_id)
+                self.carts.setItem(row_num, idx, item)
+
+        if self.carts.rowCount() > 0:
+            self.carts.selectRow(0)
+
+    def selected_cart(self) -> int | None:
+        try:
+            return self.carts.selectedItems()[0].data(Qt.ItemDataRole.UserRole)
+        except IndexError:
+            return None
+
 
 class CartWidget(QtWidgets.QWidget):
     refresh = QtCore.Signal()
     sale_completed = QtCore.Signal()
+    cart_switched = QtCore.Signal()
     item_deleted = QtCore.Signal(int)
     item_updated = QtCore.Signal(int)
     view_in_inventory = QtCore.Signal(int)
@@ -456,19 +743,25 @@ class CartWidget(QtWidgets.QWidget):
 
         self.refresh.connect(self.cart_table.refresh)
         self.refresh.connect(self.cart_totals.refresh)
+        self.refresh.connect(self.cart_actions.update_cart_status)
 
-        self.cart_actions.sale_completed.connect(self.refresh)
+        self.cart_actions.sale_completed.connect(self.do_refresh)
         self.cart_actions.sale_completed.connect(self.sale_completed)
 
-        self.cart_actions.sale_discarded.connect(self.refresh)
+        self.cart_actions.sale_discarded.connect(self.do_refresh)
         self.cart_actions.sale_discarded.connect(self.sale_completed)
 
-        self.cart_actions.item_deleted.connect(self.refresh)
+        self.cart_actions.item_deleted.connect(self.do_refresh)
         self.cart_actions.item_deleted.connect(self.item_deleted)
-        self.cart_actions.item_updated.connect(self.refresh)
-        self.cart_actions.item_updated.connect(self.cart_table.focus_item)
+        self.cart_actions.item_updated.connect(self.refresh_and_focus)
         self.cart_actions.item_updated.connect(self.item_updated)
 
+        self.cart_actions.cart_switched.connect(self.do_refresh)
+        self.cart_actions.cart_switched.connect(self.cart_switched)
+
+        self.focus_after_refresh = None
+        refresh_coordinator().register(CART, self.reload)
+
         self.cart_actions.view_in_inventory.connect(self.view_in_inventory)
 
         self.cart_table.selected.connect(self.cart_actions.set_current_id)
@@ -480,4 +773,17 @@ class CartWidget(QtWidgets.QWidget):
 
     @QtCore.Slot()
     def do_refresh(self) -> None:
+        invalidate(CART)
+
+    @QtCore.Slot(int)
+    def refresh_and_focus(self, product_id: int) -> None:
+        self.focus_after_refresh = product_id
+        invalidate(CART)
+
+    @traced
+    def reload(self, _: set) -> None:
         self.refresh.emit()
+
+        if self.focus_after_refresh is not None:
+            self.cart_table.focus_item(self.focus_after_refresh)
+            self.focus_after_refresh = None
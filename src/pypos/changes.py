@@ -0,0 +1,340 @@
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from typing import Self
+
+from PySide6 import QtCore, QtSql
+
+from .common import checked_query
+from .db_executor import BACKGROUND, DbJob, db_executor
+
+
+class ChangeMonitor(QtCore.QObject):
+    """Notices changes made to the database by other connections.
+
+    `PRAGMA data_version` tells cheaply whether anyone else committed since the
+    last check, only then is ChangeLog read to find out which rows changed.
+    Entries written through this connection meanwhile are skipped, whoever made
+    those changes already updated what they affect.
+    """
+
+    # Sets of product ids
+    products_changed = QtCore.Signal(object)
+    products_added = QtCore.Signal(object)
+    products_removed = QtCore.Signal(object)
+    cart_changed = QtCore.Signal(object)
+    rates_changed = QtCore.Signal()
+    # Changes were lost, everything must be reloaded
+    reset = QtCore.Signal()
+
+    POLL_INTERVAL = 1000
+    # Log entries kept for other instances to catch up on
+    KEEP_ENTRIES = 10_000
+    # Entries left past KEEP_ENTRIES before pruning, so there is no delete on
+    # every poll
+    PRUNE_BATCH = 1_000
+
+    def __init__(self, parent: QtCore.QObject | None = None) -> None:
+        super().__init__(parent)
+
+        self.last_seq = self.max_seq()
+        self.pruned_seq = 0
+        self.data_version = self.read_data_version()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(self.POLL_INTERVAL)
+
+    def max_seq(self) -> int:
+        return last_change_seq()
+
+    def read_data_version(self) -> int:
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check.exec("PRAGMA data_version")
+            check(query.next())
+
+        return query.value(0)
+
+    @QtCore.Slot()
+    def poll(self) -> None:
+        # Read before data_version: if that didn't change, nobody else wrote
+        # before this point and every entry up to here is our own
+        max_seq = self.max_seq()
+        data_version = self.read_data_version()
+
+        if data_version == self.data_version:
+            self.last_seq = max_seq
+            self.prune()
+            return
+
+        self.data_version = data_version
+        self.read_changes()
+
+    def read_changes(self) -> None:
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check(
+                query.prepare("""\
+            SELECT seq, tbl, row_id, op FROM ChangeLog
+            WHERE seq > :seq
+            ORDER BY seq
+            """)
+            )
+            query.bindValue(":seq", self.last_seq)
+            check.exec()
+
+        changed: set[int] = set()
+        added: set[int] = set()
+        removed: set[int] = set()
+        cart: set[int] = set()
+        rates = False
+
+        # Sequence numbers are handed out without gaps, the first entry read
+        # follows the last one seen unless it was pruned before we got to it
+        expected_seq = self.last_seq + 1
+        first_seq = None
+
+        while query.next():
+            seq, table, row_id, op = (query.value(i) for i in range(4))
+
+            if first_seq is None:
+                first_seq = seq
+
+            self.last_seq = seq
+
+            match table, op:
+                case "Products", "I":
+                    added.add(row_id)
+                case "Products", "D":
+                    removed.add(row_id)
+                case "Products" | "Inventory", _:
+                    changed.add(row_id)
+                case "Cart", _:
+                    cart.add(row_id)
+                case "Rates", _:
+                    rates = True
+
+        if first_seq is not None and first_seq > expected_seq:
+            self.reset.emit()
+            return
+
+        # Products created and removed since the last poll never existed here
+        added -= removed
+        changed -= added | removed
+
+        if added:
+            self.products_added.emit(added)
+        if removed:
+            self.products_removed.emit(removed)
+        if changed:
+            self.products_changed.emit(changed)
+        if cart:
+            self.cart_changed.emit(cart)
+        if rates:
+            self.rates_changed.emit()
+
+        if first_seq is not None:
+            self.prune()
+
+    def prune(self) -> None:
+        prune_seq = self.last_seq - self.KEEP_ENTRIES
+
+        if prune_seq - self.pruned_seq < self.PRUNE_BATCH:
+            return
+
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check(query.prepare("DELETE FROM ChangeLog WHERE seq <= :seq"))
+            query.bindValue(":seq", prune_seq)
+            check.exec()
+
+        self.pruned_seq = prune_seq
+
+
+def last_change_seq(db: QtSql.QSqlDatabase | None = None) -> int:
+    """Sequence number of the last entry written to ChangeLog."""
+    query = QtSql.QSqlQuery() if db is None else QtSql.QSqlQuery(db)
+
+    with checked_query(query) as check:
+        # Unlike max(seq), still right after everything was pruned
+        check.exec(
+            "SELECT coalesce(max(seq), 0) FROM sqlite_sequence WHERE name = 'ChangeLog'"
+        )
+        check(query.next())
+
+    return query.value(0)
+
+
+def product_changes(since: int) -> tuple[int, set[int], set[int]] | None:
+    """Products written and removed after ChangeLog entry `since`.
+
+    Returns the last entry read along the ids, or None if some of the entries
+    were already pruned and what changed can't be known.
+    """
+    query = QtSql.QSqlQuery()
+
+    with checked_query(query) as check:
+        check(
+            query.prepare(
+                "SELECT seq, tbl, row_id, op FROM ChangeLog "
+                "WHERE seq > :seq ORDER BY seq"
+            )
+        )
+        query.bindValue(":seq", since)
+        check.exec()
+
+    last_seq = since
+    written: set[int] = set()
+    removed: set[int] = set()
+
+    while query.next():
+        seq, table, row_id, op = (query.value(i) for i in range(4))
+
+        if seq > last_seq + 1:
+            return None
+
+        last_seq = seq
+
+        if table != "Products":
+            continue
+
+        if op == "D":
+            written.discard(row_id)
+            removed.add(row_id)
+        else:
+            removed.discard(row_id)
+            written.add(row_id)
+
+    return last_seq, written, removed
+
+
+class ProductNameIndex(ABC):
+    """Base of the indexes keeping product names in memory.
+
+    Subclasses are built from (id, name_simplified) pairs and the last
+    ChangeLog entry reflected in them, and keep the names through `add`,
+    `remove` and `update`. Loading them and bringing them up to date with
+    ChangeLog is done here.
+    """
+
+    # Appended to the query loading the names, for indexes needing them sorted
+    LOAD_ORDER = ""
+
+    # Last ChangeLog entry reflected in the index
+    seq: int
+
+    def __init__(self, products: Iterable[tuple[int, str]] = (), seq: int = 0) -> None:
+        """Index `products`, (id, name_simplified) pairs, left to subclasses.
+
+        `seq` is the last ChangeLog entry already reflected in `products`.
+        """
+        self.seq = seq
+
+    @classmethod
+    def load(cls, db: QtSql.QSqlDatabase) -> Self:
+        # Runs on an executor lane, in a transaction so the products read
+        # match the sequence number read along them
+        db.transaction()
+
+        try:
+            query = QtSql.QSqlQuery(db)
+
+            seq = last_change_seq(db)
+
+            with checked_query(query) as check:
+                check.exec("SELECT id, name_simplified FROM Products" + cls.LOAD_ORDER)
+
+            def products():
+                while query.next():
+                    yield query.value(0), query.value(1)
+
+            return cls(products(), seq)
+        finally:
+            db.rollback()
+
+    @abstractmethod
+    def add(self, product_id: int, name: str) -> None: ...
+
+    @abstractmethod
+    def remove(self, product_id: int) -> None: ...
+
+    @abstractmethod
+    def update(self, product_id: int, name: str) -> None: ...
+
+    def catch_up(self) -> bool:
+        """Apply the product changes logged since the index was loaded.
+
+        False if some of them were already pruned from the log, the index
+        can't be brought up to date and must be loaded again.
+        """
+        changes = product_changes(self.seq)
+
+        if changes is None:
+            return False
+
+        self.seq, written, removed = changes
+
+        for product_id in removed:
+            self.remove(product_id)
+
+        if written:
+            self.reload_names(written)
+
+        return True
+
+    def reload_names(self, product_ids: set[int]) -> None:
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check.exec(
+                "SELECT id, name_simplified FROM Products "
+                f"WHERE id IN ({','.join(map(str, product_ids))})"
+            )
+
+        while query.next():
+            self.update(query.value(0), query.value(1))
+
+
+class IndexLoader[T: ProductNameIndex]:
+    """Loads an index in the background and keeps it up to date while enabled."""
+
+    index: T | None
+    loading: DbJob | None
+
+    def __init__(self, index_type: type[T], key: str, enabled: Callable[[], bool]):
+        self.index_type = index_type
+        self.key = key
+        self.enabled = enabled
+        self.index = None
+        self.loading = None
+
+    def load(self) -> None:
+        """Load the index if enabled, drop it otherwise."""
+        if self.loading is not None:
+            self.loading.cancel()
+            self.loading = None
+
+        if not self.enabled():
+            self.index = None
+            return
+
+        self.loading = db_executor().call(self.index_type.load, self.key, BACKGROUND)
+        self.loading.done.connect(self.loaded)
+
+    def loaded(self, index: T) -> None:
+        self.index = index
+        self.loading = None
+
+    def current(self) -> T | None:
+        """The up to date index, None while there is none loaded."""
+        if self.index is None:
+            return None
+
+        if not self.index.catch_up():
+            self.index = None
+            self.load()
+
+        return self.index
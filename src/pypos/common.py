@@ -1,4 +1,5 @@
-from collections.abc import Callable, Generator
+from collections import OrderedDict
+from collections.abc import Generator
 from contextlib import contextmanager
 from decimal import Decimal, DecimalException
 import logging
@@ -8,6 +9,8 @@ from typing import Any, cast
 from PySide6 import QtCore, QtWidgets, QtSql
 from PySide6.QtCore import Qt
 
+from .query_log import timed_exec
+
 MAX_SAFE_DOUBLE = 10 ** (float_info.dig - 3)
 
 CURRENCY_SYMBOL = {
@@ -124,17 +127,210 @@ def calculate_margin(sell_value: Decimal, purchase_value: Decimal) -> Decimal:
         return Decimal(0)
 
 
-def is_product_in_cart(product_id: int) -> bool:
+_current_cart: int | None = None
+
+
+def current_cart() -> int:
+    """Id of the cart being worked on, all other carts are considered parked."""
+    if _current_cart is not None:
+        return _current_cart
+
+    stored_id = cast(int, QtCore.QSettings().value("current-cart", 0, type=int))
+
+    query = QtSql.QSqlQuery()
+
+    with checked_query(query) as check:
+        # Prefer the stored cart, then the latest one, creating one if none exist
+        check(
+            query.prepare("""\
+            SELECT id FROM Carts
+            ORDER BY id = :id DESC, id DESC
+            LIMIT 1
+            """)
+        )
+        query.bindValue(":id", stored_id)
+        check.exec()
+
+        if query.next():
+            cart_id = query.value(0)
+        else:
+            check.exec("INSERT INTO Carts DEFAULT VALUES")
+            cart_id = query.lastInsertId()
+
+    set_current_cart(cart_id)
+
+    return cart_id
+
+
+def set_current_cart(cart_id: int) -> None:
+    global _current_cart
+
+    _current_cart = cart_id
+    QtCore.QSettings().setValue("current-cart", cart_id)
+
+    forget_carted()
+
+
+# Quantities (in QUANTITY_FACTOR units) by product of the items in the current
+# cart, kept in step with the Cart table by everything that changes it
+_carted: dict[int, int] | None = None
+
+
+def carted_products() -> dict[int, int]:
+    global _carted
+
+    if _carted is not None:
+        return _carted
+
     query = QtSql.QSqlQuery()
 
     with checked_query(query) as check:
-        check(query.prepare("SELECT count(product) FROM Cart WHERE product = :product"))
-        query.bindValue(":product", product_id)
+        check(query.prepare("SELECT product, quantity FROM Cart WHERE cart = :cart"))
+        query.bindValue(":cart", current_cart())
+        check.exec()
+
+    _carted = {}
+
+    while query.next():
+        _carted[query.value(0)] = query.value(1)
+
+    return _carted
+
+
+def set_carted(product_id: int, quantity: int) -> None:
+    carted_products()[product_id] = quantity
+
+
+def uncart(product_id: int) -> None:
+    carted_products().pop(product_id, None)
+
+
+def clear_carted() -> None:
+    global _carted
+
+    _carted = {}
+
+
+def forget_carted() -> None:
+    """Reload the cart contents from the database when next needed."""
+    global _carted
+
+    _carted = None
+
+
+def is_product_in_cart(product_id: int) -> bool:
+    return product_id in carted_products()
+
+
+class LRUCache[K, V]:
+    """Mapping holding up to `capacity` items, dropping the least recently used."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.items: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        try:
+            self.items.move_to_end(key)
+        except KeyError:
+            return None
+
+        return self.items[key]
 
-        check(query.exec())
-        check(query.next())
+    def put(self, key: K, value: V) -> None:
+        self.items[key] = value
+        self.items.move_to_end(key)
 
-    return query.value(0) != 0
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self.items.pop(key, None)
+
+    def clear(self) -> None:
+        self.items.clear()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class ColumnSizer(QtCore.QObject):
+    """Sizes the columns of a table to fit a sample of its rows.
+
+    Measuring every row, as `ResizeToContents` does, gets slow with large
+    tables and is repeated whenever rows are added. Only the first rows and
+    those in view are measured, when `fit` is called or on request from the
+    header's context menu, the widths are kept as is otherwise.
+    """
+
+    SAMPLE_ROWS = 50
+
+    def __init__(
+        self, view: QtWidgets.QTableView, stretch_column: int | None = 0
+    ) -> None:
+        super().__init__(view)
+
+        self.view = view
+        self.stretch_column = stretch_column
+
+        header = view.horizontalHeader()
+        header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.Interactive)
+
+        if stretch_column is not None:
+            header.setSectionResizeMode(
+                stretch_column, QtWidgets.QHeaderView.ResizeMode.Stretch
+            )
+
+        header.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        header.customContextMenuRequested.connect(self.show_menu)
+
+    def sample_rows(self) -> set[int]:
+        row_count = self.view.model().rowCount()
+
+        rows = set(range(min(self.SAMPLE_ROWS, row_count)))
+
+        first_visible = self.view.rowAt(0)
+
+        if first_visible >= 0:
+            last_visible = self.view.rowAt(self.view.viewport().height() - 1)
+
+            if last_visible < 0:
+                last_visible = row_count - 1
+
+            rows.update(range(first_visible, last_visible + 1))
+
+        return rows
+
+    @QtCore.Slot()
+    def fit(self) -> None:
+        model = self.view.model()
+        header = self.view.horizontalHeader()
+        rows = self.sample_rows()
+
+        for column in range(model.columnCount()):
+            if column == self.stretch_column or header.isSectionHidden(column):
+                continue
+
+            width = header.sectionSizeFromContents(column).width()
+
+            for row in rows:
+                index = model.index(row, column)
+                width = max(width, self.view.sizeHintForIndex(index).width())
+
+            header.resizeSection(column, width)
+
+    @QtCore.Slot(QtCore.QPoint)
+    def show_menu(self, position: QtCore.QPoint) -> None:
+        header = self.view.horizontalHeader()
+
+        menu = QtWidgets.QMenu(header)
+        fit_action = menu.addAction("&Ajustar columnas")
+        fit_action.triggered.connect(self.fit)
+
+        menu.exec(header.mapToGlobal(position))
 
 
 def make_separator(orientation: str = "h") -> QtWidgets.QFrame:
@@ -152,6 +348,19 @@ def make_separator(orientation: str = "h") -> QtWidgets.QFrame:
     return separator
 
 
+def take_table_items(table: QtWidgets.QTableWidget) -> None:
+    """Remove every item from `table`, to fill it again.
+
+    PySide keeps the wrappers of items given to a table for as long as the
+    table lives and isn't told when Qt deletes the items, so replacing them
+    leaves stale wrappers behind, later mistaken for whatever Qt allocates at
+    the same address. Taken back, the items are deleted along their wrappers.
+    """
+    for row in range(table.rowCount()):
+        for column in range(table.columnCount()):
+            table.takeItem(row, column)
+
+
 @contextmanager
 def settings_group(settings: QtCore.QSettings, group_name: str):
     settings.beginGroup(group_name)
@@ -180,24 +389,33 @@ class QueryCheckFail(Exception):
     pass
 
 
-@contextmanager
-def checked_query(
-    query: QtSql.QSqlQuery,
-) -> Generator[Callable[[bool], None], None, None]:
-    def checker(result: bool) -> None:
+class QueryChecker:
+    """Checks the steps of a query, raising QueryCheckFail if one fails.
+
+    Statements are best run through `exec`, which also times them.
+    """
+
+    def __init__(self, query: QtSql.QSqlQuery) -> None:
+        self.query = query
+
+    def __call__(self, result: bool) -> None:
         if not result:
-            print(result)
-            err = query.lastError()
+            err = self.query.lastError()
             code = err.nativeErrorCode()
             err_type = err.type()
             text = err.text()
-            failed_query = query.lastQuery()
+            failed_query = self.query.lastQuery()
 
             logger.error(f"Query Error: {code=} {err_type=}\n{text=}\n{failed_query=}")
 
-            raise QueryCheckFail(query)
+            raise QueryCheckFail(self.query)
 
-    try:
-        yield checker
-    finally:
-        pass
+    def exec(self, statement: str | None = None) -> None:
+        self(timed_exec(self.query, statement))
+
+
+@contextmanager
+def checked_query(
+    query: QtSql.QSqlQuery,
+) -> Generator[QueryChecker, None, None]:
+    yield QueryChecker(query)
@@ -0,0 +1,150 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from collections.abc import Iterable
+import time
+from typing import cast
+
+from PySide6 import QtCore
+
+from .changes import IndexLoader, ProductNameIndex
+
+MAX_COMPLETIONS = 10
+# Seconds between looks at ChangeLog, so most keystrokes don't query at all
+CATCH_UP_INTERVAL = 1.0
+
+
+class SortedKeys:
+    """Distinct strings kept sorted, counting how many times each was added."""
+
+    def __init__(self, keys: Iterable[str] = ()) -> None:
+        self.counts = Counter(keys)
+        self.keys = sorted(self.counts)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str) -> None:
+        if key not in self.counts:
+            insort(self.keys, key)
+
+        self.counts[key] += 1
+
+    def remove(self, key: str) -> None:
+        self.counts[key] -= 1
+
+        if self.counts[key] <= 0:
+            del self.counts[key]
+            del self.keys[bisect_left(self.keys, key)]
+
+    def starting_with(self, prefix: str, limit: int) -> list[str]:
+        start = bisect_left(self.keys, prefix)
+
+        return [
+            key for key in self.keys[start : start + limit] if key.startswith(prefix)
+        ]
+
+
+class CompletionIndex(ProductNameIndex):
+    """Simplified product names and the words in them, for completing searches.
+
+    Both are kept in sorted lists, so the completions of a prefix are found by
+    bisecting and reading the few entries following it.
+    """
+
+    product_names: dict[int, str]
+
+    def __init__(self, products: Iterable[tuple[int, str]] = (), seq: int = 0) -> None:
+        """Index `products`, (id, name_simplified) pairs."""
+        self.product_names = dict(products)
+        self.names = SortedKeys(self.product_names.values())
+        self.words = SortedKeys(
+            word for name in self.product_names.values() for word in set(name.split())
+        )
+        super().__init__(products, seq)
+        self.checked_at = time.monotonic()
+
+    def add(self, product_id: int, name: str) -> None:
+        self.product_names[product_id] = name
+        self.names.add(name)
+
+        for word in set(name.split()):
+            self.words.add(word)
+
+    def remove(self, product_id: int) -> None:
+        name = self.product_names.pop(product_id, None)
+
+        if name is None:
+            return
+
+        self.names.remove(name)
+
+        for word in set(name.split()):
+            self.words.remove(word)
+
+    def update(self, product_id: int, name: str) -> None:
+        if self.product_names.get(product_id) == name:
+            return
+
+        self.remove(product_id)
+        self.add(product_id, name)
+
+    def complete(self, text: str, limit: int = MAX_COMPLETIONS) -> list[str]:
+        """Searches completing `text`, a simplified query.
+
+        `text` with its last word completed to each word starting with it come
+        first, then the names starting with the whole of `text`.
+        """
+        head, _, last_word = text.rpartition(" ")
+
+        if not last_word:
+            return []
+
+        prefix = head + " " if head else ""
+        completions = [
+            prefix + word
+            for word in self.words.starting_with(last_word, limit)
+            if word != last_word
+        ]
+
+        for name in self.names.starting_with(text, limit):
+            if len(completions) == limit:
+                break
+
+            if name not in completions:
+                completions.append(name)
+
+        return completions
+
+    def catch_up(self) -> bool:
+        # Most keystrokes don't look at ChangeLog at all
+        if time.monotonic() - self.checked_at < CATCH_UP_INTERVAL:
+            return True
+
+        self.checked_at = time.monotonic()
+
+        return super().catch_up()
+
+
+def completion_enabled() -> bool:
+    return cast(bool, QtCore.QSettings().value("search_completion", True, type=bool))
+
+
+_loader = IndexLoader(CompletionIndex, "completion-index", completion_enabled)
+
+
+def load_completion_index() -> None:
+    """Load the index in the background if enabled, drop it otherwise."""
+    _loader.load()
+
+
+def completions(text: str) -> list[str]:
+    # Built when first needed, most of its memory goes unused otherwise
+    if _loader.index is None and _loader.loading is None:
+        load_completion_index()
+
+    index = _loader.current()
+
+    if index is None:
+        return []
+
+    return index.complete(text)
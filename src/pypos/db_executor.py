@@ -0,0 +1,250 @@
+from collections import deque
+from collections.abc import Callable
+from functools import partial
+import logging
+import threading
+from typing import Any
+
+from PySide6 import QtCore, QtSql
+
+from .common import QueryCheckFail
+from .read_cache import forget_connection
+from .tracing import span, traced
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class DbJob(QtCore.QObject):
+    """A unit of database work, run on one of the executor lanes.
+
+    `run` is called on the lane's thread with the lane's connection, either
+    override it or pass `fn`. Its result is delivered through `done` on the
+    thread the job was created in, unless the job was cancelled meanwhile.
+    """
+
+    # Queued jobs have no other owner until their result is delivered
+    pending: set["DbJob"] = set()
+
+    done = QtCore.Signal(object)
+    failed = QtCore.Signal()
+    progress = QtCore.Signal(int, int)
+
+    # Internal, emitted from the lane thread and received on the job's thread
+    _finished = QtCore.Signal(object)
+    _errored = QtCore.Signal()
+
+    def __init__(
+        self,
+        fn: Callable[[QtSql.QSqlDatabase], Any] | None = None,
+        key: str | None = None,
+        parent: QtCore.QObject | None = None,
+    ) -> None:
+        super().__init__(parent)
+
+        self.fn = fn
+        self.key = key
+        self.cancelled = False
+
+        self._finished.connect(self._deliver)
+        self._errored.connect(self._fail)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def run(self, db: QtSql.QSqlDatabase) -> Any:
+        assert self.fn is not None
+        return self.fn(db)
+
+    def name(self) -> str:
+        """What the job is called in traces and logs."""
+        if self.key is not None:
+            return self.key
+
+        fn = self.fn
+
+        while isinstance(fn, partial):
+            fn = fn.func
+
+        return getattr(fn, "__qualname__", type(self).__qualname__)
+
+    @QtCore.Slot(object)
+    @traced
+    def _deliver(self, result: Any) -> None:
+        DbJob.pending.discard(self)
+
+        if not self.cancelled:
+            self.done.emit(result)
+
+    @QtCore.Slot()
+    def _fail(self) -> None:
+        DbJob.pending.discard(self)
+
+        if not self.cancelled:
+            self.failed.emit()
+
+
+class DbLane(QtCore.QThread):
+    """Thread running jobs one at a time on its own database connection."""
+
+    def __init__(self, name: str, database_name: str) -> None:
+        super().__init__()
+        # Names the thread in traces
+        self.setObjectName(f"db-lane-{name}")
+
+        self.name = name
+        self.database_name = database_name
+        self.jobs: deque[DbJob] = deque()
+        self.current: DbJob | None = None
+        self.condition = threading.Condition()
+        self.stopping = False
+
+    def submit(self, job: DbJob) -> None:
+        with self.condition:
+            if job.key is not None:
+                # A newer request for the same thing makes older ones useless
+                for pending in self.jobs:
+                    if pending.key == job.key:
+                        pending.cancel()
+                        DbJob.pending.discard(pending)
+
+                self.jobs = deque(
+                    pending for pending in self.jobs if pending.key != job.key
+                )
+
+                if self.current is not None and self.current.key == job.key:
+                    self.current.cancel()
+
+            DbJob.pending.add(job)
+            self.jobs.append(job)
+            self.condition.notify()
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopping = True
+
+            for job in self.jobs:
+                job.cancel()
+                DbJob.pending.discard(job)
+            self.jobs.clear()
+
+            if self.current is not None:
+                self.current.cancel()
+
+            self.condition.notify()
+
+    def next_job(self) -> DbJob | None:
+        with self.condition:
+            self.current = None
+
+            while not self.jobs and not self.stopping:
+                self.condition.wait()
+
+            if self.stopping:
+                return None
+
+            self.current = self.jobs.popleft()
+            return self.current
+
+    def run(self) -> None:
+        connection_name = f"db-lane-{self.name}"
+
+        db = QtSql.QSqlDatabase.addDatabase("QSQLITE", connection_name)
+        db.setDatabaseName(self.database_name)
+
+        try:
+            if not db.open():
+                logger.error(f"Lane {self.name} could not open the database")
+                return
+
+            # Connection specific, must be enabled on every connection
+            QtSql.QSqlQuery("PRAGMA foreign_keys = on", db).finish()
+
+            while (job := self.next_job()) is not None:
+                result = None
+
+                try:
+                    if not job.cancelled:
+                        with span(job.name(), "db-job"):
+                            result = job.run(db)
+                except QueryCheckFail:
+                    # Already logged by the query check
+                    job._errored.emit()
+                except Exception:
+                    # A failing job mustn't take the lane, and every job
+                    # queued after it, down with it
+                    logger.exception(f"Job {job.name()} failed on lane {self.name}")
+                    job._errored.emit()
+                else:
+                    job._finished.emit(result)
+        finally:
+            forget_connection(connection_name)
+            db.close()
+            del db
+            QtSql.QSqlDatabase.removeDatabase(connection_name)
+
+
+class DbExecutor(QtCore.QObject):
+    """Runs database work away from the GUI thread.
+
+    Interactive jobs (previews, totals) and background jobs (reports) have
+    their own lanes, so a long report never delays what the user is looking at.
+    """
+
+    def __init__(self, parent: QtCore.QObject | None = None) -> None:
+        super().__init__(parent)
+
+        database_name = QtSql.QSqlDatabase.database().databaseName()
+
+        self.lanes = {
+            name: DbLane(name, database_name) for name in (INTERACTIVE, BACKGROUND)
+        }
+
+        for lane in self.lanes.values():
+            lane.start()
+
+    def submit(self, job: DbJob, lane: str = INTERACTIVE) -> DbJob:
+        self.lanes[lane].submit(job)
+        return job
+
+    def call(
+        self,
+        fn: Callable[[QtSql.QSqlDatabase], Any],
+        key: str | None = None,
+        lane: str = INTERACTIVE,
+    ) -> DbJob:
+        return self.submit(DbJob(fn, key), lane)
+
+    def shutdown(self) -> None:
+        for lane in self.lanes.values():
+            lane.stop()
+
+        for lane in self.lanes.values():
+            lane.wait()
+
+
+_executor: DbExecutor | None = None
+
+
+def db_executor() -> DbExecutor:
+    """Executor for the default database, started on first use."""
+    global _executor
+
+    if _executor is None:
+        _executor = DbExecutor()
+
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(shutdown_executor)
+
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
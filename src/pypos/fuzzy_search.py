@@ -0,0 +1,63 @@
+from math import ceil
+
+from .read_cache import cached_rows
+
+# Part of the grams of the query a name must have to be shown
+MIN_SIMILARITY = 0.5
+MAX_RESULTS = 100
+
+
+def word_grams(text: str) -> set[str]:
+    """Trigrams of the words of `text`, padded like the names in NameGrams.
+
+    Grams spanning two words are left out, so words can be given in any order.
+    """
+    grams = set()
+
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+
+    return grams
+
+
+def fuzzy_search(text: str) -> list[int]:
+    """Ids of the products with names similar to `text`, most similar first.
+
+    `text` is a simplified query. Names are scored by the trigrams they share
+    with it, ties go to the names with fewer other trigrams, so typos and words
+    out of order still find the product.
+    """
+    grams = sorted(word_grams(text))
+
+    if not grams:
+        return []
+
+    placeholders = ", ".join(f":gram{n}" for n in range(len(grams)))
+    bindings: dict[str, str | int] = {f":gram{n}": gram for n, gram in enumerate(grams)}
+    bindings[":grams"] = len(grams)
+    bindings[":min_shared"] = ceil(len(grams) * MIN_SIMILARITY)
+    bindings[":limit"] = MAX_RESULTS
+
+    rows = cached_rows(
+        f"""\
+    SELECT p.id
+    FROM (
+        SELECT product, count(*) AS shared
+        FROM NameGrams
+        WHERE gram IN ({placeholders})
+        GROUP BY product
+        HAVING shared >= :min_shared
+    ) m
+        INNER JOIN Products p
+        ON p.id = m.product
+    ORDER BY
+        m.shared DESC,
+        m.shared * 1.0 / (length(p.name_simplified) + :grams - m.shared) DESC,
+        p.name_simplified
+    LIMIT :limit
+    """,
+        bindings,
+    )
+
+    return [row_id for (row_id,) in rows]
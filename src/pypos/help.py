@@ -125,7 +125,21 @@ CART_HELP = """\
         <kbd>Descartar todo</kbd>: Vaciará la lista del carrito sin afectar el
         inventario.
     </li>
+    <li>
+        <kbd>Apartar</kbd>: Guarda el carrito actual para retomarlo más tarde y
+        comienza uno nuevo vacío, permitiendo atender a otro cliente mientras
+        tanto.
+    </li>
+    <li>
+        <kbd>Cambiar...</kbd>: Muestra los carritos apartados y permite retomar
+        uno de ellos. El número entre paréntesis indica cuántos carritos hay
+        apartados.
+    </li>
 </ul>
+<p>
+    Las unidades de un producto apartadas en otros carritos no se cuentan como
+    disponibles al agregarlo al carrito actual.
+</p>
 <p>
     Al seleccionar un producto en el carrito, se habilitan las siguientes:
 </p>
@@ -177,6 +191,10 @@ GENERAL_HELP = """\
     <li>
         Ganancia esperada: Suma del estimado de ganancia de todos los productos.
     </li>
+</ul>
+En la pestaña de <kbd>Ventas</kbd> se muestran las ventas completadas y su
+ganancia en cada moneda para el rango de fechas indicado, agrupadas por día,
+semana o mes, junto con los productos más vendidos.
 </p>
 <p>
 <kbd>Convertidor de moneda</kbd>: Utilidad para rápidamente convertir montos entre dólares y bolivares.
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from decimal import Decimal
+from functools import partial
 from typing import cast
 
 from PySide6 import QtCore, QtWidgets, QtSql, QtGui
@@ -11,12 +12,15 @@ from unidecode import unidecode
 from .common import (
     DecimalInputDialog,
     DecimalSpinBox,
+    LRUCache,
     MAX_SAFE_DOUBLE,
     QueryCheckFail,
     adjust_value,
     calculate_margin,
     checked_query,
+    current_cart,
     is_product_in_cart,
+    set_carted,
     CURRENCY_SYMBOL,
     CURRENCY_FACTOR,
     QUANTITY_FACTOR,
@@ -24,8 +28,21 @@ from .common import (
     settings_group,
     FP_SHORTEST,
 )
-from .help import HelpDialog
+from .completion import completions
+from .db_executor import DbJob, db_executor
+from .read_cache import cached_rows
+from .refresh import (
+    INVENTORY,
+    INVENTORY_ITEM,
+    PREVIEW,
+    PRODUCT_ACTIONS,
+    RATES,
+    invalidate,
+    refresh_coordinator,
+)
 from .inventory_table import InventoryTable
+from .query_log import timed_exec
+from .tracing import traced
 
 
 class InventoryTopBar(QtWidgets.QWidget):
@@ -53,8 +70,18 @@ class InventoryTopBar(QtWidgets.QWidget):
         search_bar = QtWidgets.QLineEdit()
         self.search_bar = search_bar
         search_bar.textEdited.connect(self.search_submitted)
+        search_bar.textEdited.connect(self.update_completions)
         search_bar.setClearButtonEnabled(True)
 
+        # Filled on every keystroke, shown as is
+        self.completions = QtCore.QStringListModel(self)
+        completer = QtWidgets.QCompleter(self.completions, self)
+        completer.setCompletionMode(
+            QtWidgets.QCompleter.CompletionMode.UnfilteredPopupCompletion
+        )
+        completer.activated[str].connect(self.search_submitted)
+        search_bar.setCompleter(completer)
+
         self.search_label.setBuddy(search_bar)
 
         layout.addWidget(new_button)
@@ -66,6 +93,11 @@ class InventoryTopBar(QtWidgets.QWidget):
     def clear_search(self):
         self.search_bar.clear()
 
+    @QtCore.Slot(str)
+    @traced
+    def update_completions(self, text: str) -> None:
+        self.completions.setStringList(completions(unidecode(text).lower()))
+
 
 class ProductInfoDialog(QtWidgets.QDialog):
     product_id: int | None
@@ -217,7 +249,7 @@ class ProductInfoDialog(QtWidgets.QDialog):
             check(query.prepare(self.LOAD_QUERY))
             query.bindValue(":id", id)
 
-            check(query.exec())
+            check.exec()
 
         if query.next():
             name = query.value(0)
@@ -262,6 +294,8 @@ class ProductInfoDialog(QtWidgets.QDialog):
 
     @QtCore.Slot()
     def help(self):
+        from .help import HelpDialog
+
         HelpDialog.product_help()
 
     @QtCore.Slot()
@@ -310,7 +344,7 @@ class ProductInfoDialog(QtWidgets.QDialog):
                 if is_update:
                     query.bindValue(":id", self.product_id)
 
-                if not query.exec():
+                if not timed_exec(query):
                     # 2067 SQLITE_CONSTRAINT_UNIQUE
                     if query.lastError().nativeErrorCode() == "2067":
                         QtWidgets.QMessageBox.information(
@@ -339,7 +373,7 @@ class ProductInfoDialog(QtWidgets.QDialog):
                 query.bindValue(":id", self.product_id)
                 query.bindValue(":quantity", int(quantity * QUANTITY_FACTOR))
 
-                check(query.exec())
+                check.exec()
         except QueryCheckFail:
             db.rollback()
             return
@@ -477,6 +511,13 @@ class ProductInfoDialog(QtWidgets.QDialog):
 
 class ProductPreviewWidget(QtWidgets.QFrame):
     current_id: int | None
+    loading_id: int | None
+    preview_job: DbJob | None
+    cache: LRUCache[int, tuple]
+
+    CACHE_SIZE = 256
+    # Milliseconds without selection changes before loading the product shown
+    DEBOUNCE_INTERVAL = 80
 
     PRODUCT_QUERY = """\
         SELECT name, purchase_currency, purchase_value, sell_currency,
@@ -485,13 +526,21 @@ class ProductPreviewWidget(QtWidgets.QFrame):
             INNER JOIN Inventory i
             ON p.id = i.product
             LEFT JOIN Cart c
-            ON p.id = c.product
+            ON p.id = c.product AND c.cart = :cart
         WHERE p.id = :id"""
 
     def __init__(self) -> None:
         super().__init__()
 
         self.current_id = None
+        self.preview_job = None
+        self.loading_id = None
+        self.cache = LRUCache(self.CACHE_SIZE)
+
+        self.debounce_timer = QtCore.QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(self.DEBOUNCE_INTERVAL)
+        self.debounce_timer.timeout.connect(self.selection_settled)
 
         self.setLineWidth(1)
         self.setFrameShape(type(self).Shape.StyledPanel)
@@ -583,19 +632,81 @@ class ProductPreviewWidget(QtWidgets.QFrame):
 
     @QtCore.Slot(int)
     @QtCore.Slot(type(None))
+    @traced
     def show_product(self, id: int | None):
         self.current_id = id
-        self.show()
 
-        product_query = QtSql.QSqlQuery()
+        if id is None:
+            self.cancel_load()
+            self.hide()
+            return
+
+        cached = self.cache.get(id)
+
+        if cached is not None:
+            self.cancel_load()
+            self.display_product(cached)
+            return
 
-        with checked_query(product_query) as check:
-            check(product_query.prepare(self.PRODUCT_QUERY))
-            product_query.bindValue(":id", id)
+        # Load right away when the selection starts moving, then only once it
+        # stops, instead of once for every row passed by
+        if not self.debounce_timer.isActive():
+            self.load(id)
 
-            check(product_query.exec())
+        self.debounce_timer.start()
 
-        if product_query.next():
+    @QtCore.Slot()
+    def selection_settled(self) -> None:
+        id = self.current_id
+
+        if id is not None and id != self.loading_id and id not in self.cache:
+            self.load(id)
+
+    def load(self, id: int) -> None:
+        self.cancel_load()
+
+        self.loading_id = id
+        self.preview_job = db_executor().call(
+            partial(self.load_product, id, current_cart()), key="product-preview"
+        )
+        self.preview_job.done.connect(partial(self.product_loaded, id))
+
+    def cancel_load(self) -> None:
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+            self.preview_job = None
+            self.loading_id = None
+
+    @traced
+    def product_loaded(self, id: int, product: tuple | None) -> None:
+        self.preview_job = None
+        self.loading_id = None
+
+        if product is not None:
+            self.cache.put(id, product)
+
+        if id == self.current_id:
+            self.display_product(product)
+
+    def invalidate(self, id: int | None = None) -> None:
+        """Forget the stored data of product `id`, or of every product."""
+        if id is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(id)
+
+    @classmethod
+    def load_product(
+        cls, id: int, cart_id: int, db: QtSql.QSqlDatabase
+    ) -> tuple | None:
+        # Runs on an executor lane, away from the widgets
+        rows = cached_rows(cls.PRODUCT_QUERY, {":id": id, ":cart": cart_id}, db)
+
+        return rows[0] if rows else None
+
+    @traced
+    def display_product(self, product: tuple | None) -> None:
+        if product is not None:
             (
                 name,
                 purchase_currency,
@@ -605,7 +716,7 @@ class ProductPreviewWidget(QtWidgets.QFrame):
                 last_update,
                 quantity,
                 in_cart,
-            ) = (product_query.value(i) for i in range(product_query.record().count()))
+            ) = product
 
             purchase_symbol = CURRENCY_SYMBOL[purchase_currency]
             purchase_value = Decimal(purchase_value) / CURRENCY_FACTOR
@@ -673,6 +784,9 @@ class ProductPreviewWidget(QtWidgets.QFrame):
 
     @QtCore.Slot()
     def refresh(self) -> None:
+        if self.current_id is not None:
+            self.invalidate(self.current_id)
+
         self.show_product(self.current_id)
 
 
@@ -744,7 +858,7 @@ class ProductQuantityDialog(QtWidgets.QDialog):
 
             query.bindValue(":product", self.product_id)
 
-            check(query.exec())
+            check.exec()
 
             check(query.next())
 
@@ -777,7 +891,7 @@ class ProductQuantityDialog(QtWidgets.QDialog):
             query.bindValue(":product", self.product_id)
             query.bindValue(":quantity", int(quantity * QUANTITY_FACTOR))
 
-            check(query.exec())
+            check.exec()
 
         super().accept()
 
@@ -857,6 +971,7 @@ class InventoryProductActions(QtWidgets.QWidget):
         self.view_in_cart_button.setEnabled(in_cart)
 
     @QtCore.Slot()
+    @traced
     def product_carted(self) -> None:
         if self.product_id is None:
             return
@@ -866,19 +981,27 @@ class InventoryProductActions(QtWidgets.QWidget):
         with checked_query(query) as check:
             check(
                 query.prepare("""\
-            SELECT name, i.quantity as available, coalesce(c.quantity, 0) as in_cart
+            SELECT
+                name,
+                i.quantity - coalesce(
+                    (SELECT sum(o.quantity) FROM Cart o
+                     WHERE o.product = p.id AND o.cart != :cart),
+                    0
+                ) as available,
+                coalesce(c.quantity, 0) as in_cart
             FROM Products p
                 INNER JOIN Inventory i
                 ON i.product = p.id
                 LEFT JOIN Cart c
-                ON c.product = p.id
+                ON c.product = p.id AND c.cart = :cart
             WHERE p.id = :id
             """)
             )
 
             query.bindValue(":id", self.product_id)
+            query.bindValue(":cart", current_cart())
 
-            check(query.exec())
+            check.exec()
             check(query.next())
 
         name = query.value(0)
@@ -913,16 +1036,20 @@ class InventoryProductActions(QtWidgets.QWidget):
             with checked_query(query) as check:
                 check(
                     query.prepare("""\
-                INSERT INTO Cart(product, quantity) VALUES (:product, :quantity)
-                ON CONFLICT(product)
+                INSERT INTO Cart(cart, product, quantity)
+                    VALUES (:cart, :product, :quantity)
+                ON CONFLICT(cart, product)
                     DO UPDATE SET quantity = :quantity
                 """)
                 )
 
+                query.bindValue(":cart", current_cart())
                 query.bindValue(":product", self.product_id)
                 query.bindValue(":quantity", int(quantity * QUANTITY_FACTOR))
 
-                check(query.exec())
+                check.exec()
+
+            set_carted(self.product_id, int(quantity * QUANTITY_FACTOR))
 
             self.cart_item.emit(self.product_id, quantity)
 
@@ -960,7 +1087,18 @@ class InventoryProductActions(QtWidgets.QWidget):
                     check(query.prepare("DELETE FROM Products WHERE id = :id"))
                     query.bindValue(":id", self.product_id)
 
-                    check(query.exec())
+                    if not timed_exec(query):
+                        # 1811 SQLITE_CONSTRAINT_TRIGGER, from ON DELETE RESTRICT
+                        if query.lastError().nativeErrorCode() in ("787", "1811"):
+                            QtWidgets.QMessageBox.information(
+                                self,
+                                "Producto en carrito",
+                                "Este producto se encuentra en un carrito apartado, "
+                                "retírelo de ese carrito antes de eliminarlo.",
+                            )
+                            return
+
+                        check(False)
 
                 self.deleted.emit()
 
@@ -1021,14 +1159,27 @@ class InventoryWidget(QtWidgets.QWidget):
         self.product_actions.deleted.connect(self.inventory_table.handle_deleted)
         self.product_actions.edit_requested.connect(self.edit)
         self.product_actions.cart_item.connect(self.cart_item)
-        self.product_actions.cart_item.connect(self.inventory_table.update_item)
-        self.product_actions.cart_item.connect(self.preview.show_product)
-        self.product_actions.cart_item.connect(self.product_actions.set_product)
+        self.product_actions.cart_item.connect(self.invalidate_product)
         self.product_actions.view_in_cart.connect(self.view_in_cart)
-        self.product_actions.product_updated.connect(self.inventory_table.update_item)
-        self.product_actions.product_updated.connect(self.preview.show_product)
+        self.product_actions.product_updated.connect(self.invalidate_product)
+
+        self.update_item.connect(self.invalidate_product)
 
-        self.update_item.connect(self.inventory_table.update_item)
+        coordinator = refresh_coordinator()
+        coordinator.register(
+            INVENTORY,
+            lambda _: self.refresh(),
+            supersedes=(INVENTORY_ITEM, PREVIEW, PRODUCT_ACTIONS, RATES),
+        )
+        coordinator.register(INVENTORY_ITEM, self.update_items, keyed=True)
+        coordinator.register(
+            RATES, lambda _: self.inventory_table.model.refresh_values()
+        )
+        coordinator.register(PREVIEW, lambda _: self.preview.refresh())
+        coordinator.register(
+            PRODUCT_ACTIONS,
+            lambda _: self.product_actions.set_product(self.product_actions.product_id),
+        )
 
         self.toggle_bottom(None)
 
@@ -1052,6 +1203,7 @@ class InventoryWidget(QtWidgets.QWidget):
         dialog = ProductInfoDialog(product_id)
         result = dialog.exec()
         if result == ProductInfoDialog.DialogCode.Accepted:
+            self.preview.invalidate(product_id)
             self.inventory_table.refresh_table()
             self.inventory_table.focus_product(product_id)
             self.preview.show_product(product_id)
@@ -1059,9 +1211,38 @@ class InventoryWidget(QtWidgets.QWidget):
     @QtCore.Slot()
     def refresh(self) -> None:
         current_id = self.preview.current_id
+        self.preview.invalidate()
         self.inventory_table.refresh_table()
-        self.inventory_table.focus_product(current_id)
-        self.preview.refresh()
+
+        # Selecting the product again updates the preview and actions
+        if current_id is not None:
+            self.inventory_table.focus_product(current_id)
+
+    @QtCore.Slot(int)
+    def invalidate_product(self, product_id: int) -> None:
+        invalidate(INVENTORY_ITEM, product_id)
+        self.preview.invalidate(product_id)
+
+        if product_id == self.preview.current_id:
+            invalidate(PREVIEW)
+
+        if product_id == self.product_actions.product_id:
+            invalidate(PRODUCT_ACTIONS)
+
+    @QtCore.Slot(object)
+    def update_products(self, product_ids: set[int]) -> None:
+        for product_id in product_ids:
+            self.invalidate_product(product_id)
+
+    def update_items(self, product_ids: set[int]) -> None:
+        for product_id in product_ids:
+            self.inventory_table.update_item(product_id)
+
+    @QtCore.Slot(object)
+    def remove_products(self, product_ids: set[int]) -> None:
+        for product_id in product_ids:
+            self.preview.invalidate(product_id)
+            self.inventory_table.remove_item(product_id)
 
     @QtCore.Slot()
     def focus_inventory_item(self, product_id: int) -> None:
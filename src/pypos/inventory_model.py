@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from array import array
 from decimal import Decimal
+import time
 from typing import Any, cast
 
 from PySide6 import QtCore, QtGui, QtSql
@@ -13,24 +14,110 @@ from .common import (
     adjust_value,
     FP_SHORTEST,
     checked_query,
+    current_cart,
 )
+from .fuzzy_search import fuzzy_search
+from .read_cache import cached_rows
+from .search_index import search_index
+from .tracing import traced
 
 
-@dataclass(frozen=True, slots=True)
-class Product:
-    id: int
-    name: str
-    sell_currency: str
-    sell_value: Decimal
-    quantity: Decimal
-    in_cart: Decimal | None
+class ProductRows:
+    """Loaded products, kept as one array per column.
+
+    A row costs its name plus a few machine integers, where a dataclass per row
+    held three Decimal objects and a currency string besides. Values stay in
+    their stored form, cents and thousandths, and are converted when displayed.
+    """
+
+    CURRENCIES = tuple(CURRENCY_SYMBOL)
+
+    ids: array[int]
+    names: list[str]
+    quantities: array[int]
+    sell_values: array[int]
+    currencies: bytearray  # Index into CURRENCIES
+    in_cart: array[int]  # 0 if not in the cart
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.ids = array("q")
+        self.names = []
+        self.quantities = array("q")
+        self.sell_values = array("q")
+        self.currencies = bytearray()
+        self.in_cart = array("q")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(
+        self,
+        row_id: int,
+        name: str,
+        quantity: int,
+        sell_currency: str,
+        sell_value: int,
+        in_cart: int | None,
+    ) -> None:
+        self.ids.append(row_id)
+        self.names.append(name)
+        self.quantities.append(quantity)
+        self.sell_values.append(sell_value)
+        self.currencies.append(self.CURRENCIES.index(sell_currency))
+        self.in_cart.append(in_cart or 0)
+
+    def replace(
+        self,
+        idx: int,
+        row_id: int,
+        name: str,
+        quantity: int,
+        sell_currency: str,
+        sell_value: int,
+        in_cart: int | None,
+    ) -> None:
+        self.ids[idx] = row_id
+        self.names[idx] = name
+        self.quantities[idx] = quantity
+        self.sell_values[idx] = sell_value
+        self.currencies[idx] = self.CURRENCIES.index(sell_currency)
+        self.in_cart[idx] = in_cart or 0
+
+    def __delitem__(self, idx: int) -> None:
+        for column in (
+            self.ids,
+            self.names,
+            self.quantities,
+            self.sell_values,
+            self.currencies,
+            self.in_cart,
+        ):
+            del column[idx]
+
+    def currency(self, idx: int) -> str:
+        return self.CURRENCIES[self.currencies[idx]]
 
 
 class InventoryModel(QtCore.QAbstractTableModel):
-    products: list[Product]
+    rows: ProductRows
     id_index_map: dict[int, int]
     query: str | None
+    search_text: str | None
+    # Ids of the search results in order, if found through the search index
+    matches: list[int] | None
+    # Nothing matched the query as typed, results are names similar to it
+    fuzzy: bool
     result_size: int
+    visible_rows: int
+
+    # Rows fetched before any timing is known
+    INITIAL_BATCH = 64
+    MAX_BATCH = 4096
+    # A fetch taking longer than this is noticeable while scrolling
+    FETCH_TIME_TARGET = 0.015
 
     # If there's a query
     #      Rank prefix matches first,
@@ -44,59 +131,80 @@ class InventoryModel(QtCore.QAbstractTableModel):
         INNER JOIN Inventory i
         ON p.id = i.product
         LEFT JOIN Cart c
-        ON p.id = c.product
+        ON p.id = c.product AND c.cart = :cart
     """
     WHERE_CLAUSE = """\
     WHERE name_simplified LIKE concat('%', :name_simplified, '%') ESCAPE '\\'
     """
     ORDER_CLAUSE = """\
     ORDER BY
-        iif(length(:name_simplified),
-            CASE
-                WHEN like(:name_simplified || '%', name_simplified, '\\')
-                    THEN 1
-                WHEN like(concat('% ', :name_simplified, '%'), name_simplified, '\\')
-                    THEN 2
-                ELSE 3
-            END,
-            NULL
-        ),
+        CASE
+            WHEN like(:name_simplified || '%', name_simplified, '\\')
+                THEN 1
+            WHEN like(concat('% ', :name_simplified, '%'), name_simplified, '\\')
+                THEN 2
+            ELSE 3
+        END,
         name_simplified
     """
+    # Plain column, so SQLite walks the name index instead of sorting everything
+    # on every fetch
+    NAME_ORDER_CLAUSE = """\
+    ORDER BY name_simplified
+    """
 
     def __init__(self, parent: QtCore.QObject | None = None) -> None:
         super().__init__(parent)
 
-        self.products = []
+        self.rows = ProductRows()
         self.id_index_map = {}
         self.query = None
+        self.search_text = None
+        self.matches = None
+        self.fuzzy = False
         self.result_size = 0
+        self.visible_rows = 0
+
+        # Seconds spent per fetch before getting the first row, and per row
+        self.query_cost: float | None = None
+        self.row_cost: float | None = None
 
         self.cart_icon_dark = QtGui.QIcon(":/assets/Cart-64-dark.png")
         self.cart_icon_light = QtGui.QIcon(":/assets/Cart-64-light.png")
 
-        self.load_data()
-
+    @traced
     def load_data(self):
         try:
             self.beginResetModel()
-            self.products.clear()
+            self.rows.clear()
             self.id_index_map.clear()
 
-            query = QtSql.QSqlQuery()
-            with checked_query(query) as check:
+            self.matches = None
+            index = search_index() if self.search_text is not None else None
+
+            if index is not None:
+                self.matches = index.search(cast(str, self.search_text))
+
+            if self.matches is not None:
+                self.result_size = len(self.matches)
+            else:
                 query_str = "SELECT count(id) FROM Products "
+                bindings = {}
 
                 if self.query is not None:
                     query_str += self.WHERE_CLAUSE
+                    bindings[":name_simplified"] = self.query
 
-                check(query.prepare(query_str))
-                query.bindValue(":name_simplified", self.query)
+                # Counting matches scans the whole table, and the same searches
+                # come back as the user types and deletes
+                ((self.result_size,),) = cached_rows(query_str, bindings)
 
-                check(query.exec())
-                check(query.next())
+            self.fuzzy = False
 
-                self.result_size = query.value(0)
+            if self.result_size == 0 and self.search_text is not None:
+                self.matches = fuzzy_search(cast(str, self.search_text))
+                self.result_size = len(self.matches)
+                self.fuzzy = self.result_size > 0
 
             self.fetchMore(QtCore.QModelIndex())
         finally:
@@ -108,68 +216,126 @@ class InventoryModel(QtCore.QAbstractTableModel):
         if parent.isValid():
             return False
 
-        return len(self.products) < self.result_size
+        return len(self.rows) < self.result_size
 
+    @traced
     def fetchMore(
         self, parent: QtCore.QModelIndex | QtCore.QPersistentModelIndex
     ) -> None:
         if parent.isValid():
             return
 
-        start = len(self.products)
-        to_fetch = min(self.result_size - start, 64)
+        start = len(self.rows)
+        to_fetch = min(self.result_size - start, self.batch_size())
 
         query = QtSql.QSqlQuery()
         query_str = self.LOAD_QUERY
 
-        if self.query is not None:
+        if self.matches is not None:
+            ids = self.matches[start : start + to_fetch]
+            query_str += f"WHERE p.id IN ({','.join(map(str, ids))})"
+        elif self.query is not None:
             query_str += self.WHERE_CLAUSE
+            query_str += self.ORDER_CLAUSE
+            query_str += f"LIMIT {to_fetch} OFFSET {start}"
+        else:
+            query_str += self.NAME_ORDER_CLAUSE
+            query_str += f"LIMIT {to_fetch} OFFSET {start}"
 
-        query_str += self.ORDER_CLAUSE
-        query_str += f"LIMIT {to_fetch} OFFSET {start}"
+        started = time.perf_counter()
 
         with checked_query(query) as check:
             check(query.prepare(query_str))
-            query.bindValue(":name_simplified", self.query)
+            if self.query is not None and self.matches is None:
+                query.bindValue(":name_simplified", self.query)
+            query.bindValue(":cart", current_cart())
+
+            check.exec()
 
-            check(query.exec())
+        executed = time.perf_counter()
 
         n_recs = query.record().count()
 
-        self.beginInsertRows(QtCore.QModelIndex(), start, start + to_fetch - 1)
+        fetched = []
 
         while query.next():
-            row_id, name, quantity, sell_currency, int_sell_value, in_cart = (
-                query.value(i) for i in range(n_recs)
-            )
-            sell_value = Decimal(int_sell_value) / CURRENCY_FACTOR
-            quantity = Decimal(quantity) / QUANTITY_FACTOR
+            fetched.append(tuple(query.value(i) for i in range(n_recs)))
 
-            if in_cart:
-                in_cart = Decimal(in_cart) / QUANTITY_FACTOR
-            else:
-                in_cart = None
+        self.record_timing(executed - started, time.perf_counter() - executed, fetched)
 
-            product = Product(
-                row_id, name, sell_currency, sell_value, quantity, in_cart
-            )
+        if self.matches is not None:
+            # Rows come in no particular order
+            by_id = {row[0]: row for row in fetched}
+            fetched = [by_id[row_id] for row_id in ids if row_id in by_id]
+
+            if len(fetched) < len(ids):
+                # Products were removed since they were searched
+                self.matches[start : start + to_fetch] = [row[0] for row in fetched]
+                self.result_size = len(self.matches)
+        elif len(fetched) < to_fetch:
+            # Products were removed since they were counted
+            self.result_size = start + len(fetched)
+
+        if not fetched:
+            return
+
+        self.beginInsertRows(QtCore.QModelIndex(), start, start + len(fetched) - 1)
 
-            self.id_index_map[row_id] = len(self.products)
-            self.products.append(product)
+        for row in fetched:
+            self.id_index_map[row[0]] = len(self.rows)
+            self.rows.append(*row)
 
         self.endInsertRows()
 
+    def batch_size(self) -> int:
+        """Rows to get on the next fetch.
+
+        Sorting and skipping to the offset is paid once per fetch, while reading
+        rows is paid per row. Batches grow until that fixed part is no more than
+        half of a fetch, and while a fetch stays under `FETCH_TIME_TARGET`, but
+        always cover a couple of screens and are never under `INITIAL_BATCH`,
+        even before the view knows its size or when rows are slow to read.
+        """
+        least = max(self.INITIAL_BATCH, 2 * self.visible_rows)
+
+        if self.query_cost is None or not self.row_cost:
+            return least
+
+        amortized = self.query_cost / self.row_cost
+        in_budget = (self.FETCH_TIME_TARGET - self.query_cost) / self.row_cost
+
+        return int(min(max(least, amortized, in_budget), self.MAX_BATCH))
+
+    def record_timing(
+        self, query_time: float, read_time: float, fetched: list[tuple]
+    ) -> None:
+        if not fetched:
+            return
+
+        row_time = read_time / len(fetched)
+
+        if self.query_cost is None or self.row_cost is None:
+            self.query_cost = query_time
+            self.row_cost = row_time
+        else:
+            # Smoothed, a single slow fetch shouldn't swing the batch size
+            self.query_cost = (self.query_cost + query_time) / 2
+            self.row_cost = (self.row_cost + row_time) / 2
+
+    def set_visible_rows(self, rows: int) -> None:
+        self.visible_rows = rows
+
     def set_query(self, query: str | None):
         if query is not None and query != "":
+            self.search_text = unidecode(query).lower()
             self.query = (
-                unidecode(query)
-                .lower()
-                .replace("\\", "\\\\")
+                self.search_text.replace("\\", "\\\\")
                 .replace("%", "\\%")
                 .replace("_", "\\_")
                 .replace(" ", "%")
             )
         else:
+            self.search_text = None
             self.query = None
 
         self.load_data()
@@ -181,7 +347,7 @@ class InventoryModel(QtCore.QAbstractTableModel):
     ) -> int:
         if parent.isValid():
             return 0
-        return len(self.products)
+        return len(self.rows)
 
     def columnCount(
         self,
@@ -202,37 +368,43 @@ class InventoryModel(QtCore.QAbstractTableModel):
 
         IDR = Qt.ItemDataRole
 
-        product = self.products[index.row()]
+        rows = self.rows
+        row = index.row()
+
+        in_cart = rows.in_cart[row]
 
         if role == IDR.DisplayRole:
             match index.column():
                 case 0:
-                    return product.name
+                    return rows.names[row]
                 case 1:
                     locale = QtCore.QLocale()
 
                     quantity = locale.toString(
-                        float(product.quantity), "f", FP_SHORTEST
+                        rows.quantities[row] / QUANTITY_FACTOR, "f", FP_SHORTEST
                     )
 
-                    if product.in_cart:
-                        in_cart = locale.toString(
-                            float(product.in_cart), "f", FP_SHORTEST
+                    if in_cart:
+                        in_cart_text = locale.toString(
+                            in_cart / QUANTITY_FACTOR, "f", FP_SHORTEST
                         )
-                        return f"({in_cart}) {quantity}"
+                        return f"({in_cart_text}) {quantity}"
 
                     return quantity
                 case 2:
                     locale = QtCore.QLocale()
                     return locale.toCurrencyString(
-                        float(product.sell_value),
-                        CURRENCY_SYMBOL[product.sell_currency] + " ",
+                        rows.sell_values[row] / CURRENCY_FACTOR,
+                        CURRENCY_SYMBOL[rows.currency(row)] + " ",
                         2,
                     )
                 case 3:
-                    sell_currency = "VED" if product.sell_currency == "USD" else "USD"
+                    product_currency = rows.currency(row)
+                    sell_currency = "VED" if product_currency == "USD" else "USD"
                     sell_value = adjust_value(
-                        product.sell_currency, sell_currency, product.sell_value
+                        product_currency,
+                        sell_currency,
+                        Decimal(rows.sell_values[row]) / CURRENCY_FACTOR,
                     )
                     locale = QtCore.QLocale()
                     return locale.toCurrencyString(
@@ -241,10 +413,10 @@ class InventoryModel(QtCore.QAbstractTableModel):
                         2,
                     )
 
-        elif role == IDR.BackgroundRole and product.in_cart:
+        elif role == IDR.BackgroundRole and in_cart:
             return QtGui.QBrush(QtGui.QPalette().alternateBase().color().darker(105))
 
-        elif role == IDR.DecorationRole and index.column() == 1 and product.in_cart:
+        elif role == IDR.DecorationRole and index.column() == 1 and in_cart:
             app = cast(QtGui.QGuiApplication, QtGui.QGuiApplication.instance())
 
             if app.styleHints().colorScheme() == Qt.ColorScheme.Dark:
@@ -263,7 +435,7 @@ class InventoryModel(QtCore.QAbstractTableModel):
             return align
 
         elif role == IDR.UserRole:
-            return product.id
+            return rows.ids[row]
 
     HEADERS = ["Producto", "Existencias", "Precio", "Equivalente"]
 
@@ -289,33 +461,46 @@ class InventoryModel(QtCore.QAbstractTableModel):
             return QtCore.QModelIndex()
 
     def update_item(self, product_id: int):
+        index_row = self.id_index_map.get(product_id)
+
+        if index_row is None:
+            # Not loaded yet, it will be up to date when it is
+            return
+
         query = QtSql.QSqlQuery()
 
         with checked_query(query) as check:
             check(query.prepare(self.LOAD_QUERY + " WHERE id = :id"))
             query.bindValue(":id", product_id)
+            query.bindValue(":cart", current_cart())
 
-            check(query.exec())
+            check.exec()
 
         n_recs = query.record().count()
 
         if query.next():
-            row_id, name, quantity, sell_currency, int_sell_value, in_cart = (
-                query.value(i) for i in range(n_recs)
-            )
-            sell_value = Decimal(int_sell_value) / CURRENCY_FACTOR
-            quantity = Decimal(quantity) / QUANTITY_FACTOR
+            self.rows.replace(index_row, *(query.value(i) for i in range(n_recs)))
 
-            if in_cart:
-                in_cart = Decimal(in_cart) / QUANTITY_FACTOR
-            else:
-                in_cart = None
+            self.dataChanged.emit(self.index(index_row, 0), self.index(index_row, 3))
 
-            product = Product(
-                row_id, name, sell_currency, sell_value, quantity, in_cart
-            )
+    def remove_item(self, product_id: int) -> None:
+        index_row = self.id_index_map.pop(product_id, None)
 
-            index_row = self.id_index_map[row_id]
-            self.products[index_row] = product
+        if index_row is None:
+            return
 
-            self.dataChanged.emit(self.index(index_row, 0), self.index(index_row, 3))
+        self.beginRemoveRows(QtCore.QModelIndex(), index_row, index_row)
+
+        del self.rows[index_row]
+
+        for row_id in self.rows.ids[index_row:]:
+            self.id_index_map[row_id] -= 1
+
+        self.result_size -= 1
+
+        self.endRemoveRows()
+
+    def refresh_values(self) -> None:
+        """Repaint the values that depend on the exchange rate."""
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 3), self.index(len(self.rows) - 1, 3))
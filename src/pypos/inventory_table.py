@@ -3,8 +3,9 @@ from typing import cast
 from PySide6 import QtCore, QtGui, QtWidgets
 from PySide6.QtCore import Qt
 
-from .common import waiting_cursor
+from .common import ColumnSizer, waiting_cursor
 from .inventory_model import InventoryModel
+from .tracing import traced
 
 
 class InventoryTable(QtWidgets.QWidget):
@@ -13,6 +14,9 @@ class InventoryTable(QtWidgets.QWidget):
     selected = QtCore.Signal(object)  # Actually `int | None`
     double_clicked = QtCore.Signal(int)
 
+    # Screens of rows kept loaded below the visible ones
+    PREFETCH_SCREENS = 3
+
     def __init__(self, parent=None) -> None:
         super().__init__(parent)
 
@@ -24,11 +28,12 @@ class InventoryTable(QtWidgets.QWidget):
         self.table.setModel(self.model)
 
         h_header = self.table.horizontalHeader()
-
-        h_header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.ResizeToContents)
-        h_header.setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeMode.Stretch)
         h_header.setMinimumSectionSize(h_header.defaultSectionSize())
 
+        self.column_sizer = ColumnSizer(self.table)
+        self.column_sizer.fit()
+        self.model.modelReset.connect(self.column_sizer.fit)
+
         self.table.verticalHeader().hide()
 
         self.table.setSelectionMode(
@@ -39,8 +44,14 @@ class InventoryTable(QtWidgets.QWidget):
         )
         self.table.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOn)
 
+        self.fuzzy_notice = QtWidgets.QLabel(
+            "Sin coincidencias exactas, mostrando productos con nombres parecidos"
+        )
+        self.fuzzy_notice.hide()
+
         layout = QtWidgets.QVBoxLayout()
         self.setLayout(layout)
+        layout.addWidget(self.fuzzy_notice)
         layout.addWidget(self.table)
 
         layout.setContentsMargins(0, 0, 0, 0)
@@ -49,23 +60,65 @@ class InventoryTable(QtWidgets.QWidget):
 
         self.table.doubleClicked.connect(self.item_double_clicked)
 
+        # Zero timeout: runs once pending events are handled, one batch at a
+        # time so input is never held up for long
+        self.prefetch_timer = QtCore.QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(0)
+        self.prefetch_timer.timeout.connect(self.prefetch)
+
+        self.table.verticalScrollBar().valueChanged.connect(self.prefetch_timer.start)
+        self.model.rowsInserted.connect(self.prefetch_timer.start)
+        self.model.modelReset.connect(self.prefetch_timer.start)
+
+    def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
+        super().resizeEvent(event)
+
+        row_height = self.table.verticalHeader().defaultSectionSize()
+        self.model.set_visible_rows(self.table.viewport().height() // row_height + 1)
+        self.prefetch_timer.start()
+
+    @QtCore.Slot()
+    @traced
+    def prefetch(self) -> None:
+        root = QtCore.QModelIndex()
+
+        if not self.model.canFetchMore(root):
+            return
+
+        last_visible = self.table.rowAt(self.table.viewport().height() - 1)
+
+        if last_visible == -1:
+            last_visible = self.model.rowCount()
+
+        ahead = self.model.rowCount() - last_visible
+
+        if ahead < self.PREFETCH_SCREENS * self.model.visible_rows:
+            # Continues through rowsInserted until far enough ahead
+            self.model.fetchMore(root)
+
     def keyPressEvent(self, event: QtGui.QKeyEvent):
         if event.key() == Qt.Key.Key_Escape:
             self.table.selectionModel().clearSelection()
 
     @QtCore.Slot(str)
+    @traced
     def set_query(self, query: str | None) -> None:
         with waiting_cursor():
             self.model.set_query(query)
             self.auto_focus()
 
     @QtCore.Slot()
+    @traced
     def refresh_table(self):
         with waiting_cursor():
             self.model.load_data()
             self.auto_focus()
 
+    @traced
     def auto_focus(self):
+        self.fuzzy_notice.setVisible(self.model.fuzzy)
+
         sel_model = self.table.selectionModel()
 
         if self.model.rowCount() > 0 and self.model.query:
@@ -86,6 +139,7 @@ class InventoryTable(QtWidgets.QWidget):
             self.selected.emit(None)
 
     @QtCore.Slot(int)
+    @traced
     def focus_product(self, product_id: int) -> None:
         with waiting_cursor():
             found = self.model.index_for_id(product_id)
@@ -102,6 +156,10 @@ class InventoryTable(QtWidgets.QWidget):
     def update_item(self, product_id: int) -> None:
         self.model.update_item(product_id)
 
+    @QtCore.Slot(int)
+    def remove_item(self, product_id: int) -> None:
+        self.model.remove_item(product_id)
+
     @QtCore.Slot()
     def handle_deleted(self) -> None:
         try:
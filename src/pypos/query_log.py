@@ -0,0 +1,167 @@
+from collections import deque
+from dataclasses import dataclass
+import logging
+import re
+import threading
+import time
+from typing import cast
+import zlib
+
+from PySide6 import QtCore, QtSql
+
+from .tracing import add_span
+
+# Statements taking longer than this many milliseconds are logged with their plan
+SLOW_QUERY_SETTING = "slow_query_ms"
+DEFAULT_SLOW_QUERY_MS = 100
+RECENT_QUERIES = 500
+
+# Lists of ids written into statements, so each list doesn't count apart. Other
+# numbers, such as limits, are left alone, they tell statements apart
+ID_LISTS = re.compile(r"\bIN\s*\(\s*\d+(?:\s*,\s*\d+)*\s*\)", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class QueryRecord:
+    statement: str
+    # Checksum of the bound values, tells runs with the same values apart
+    # without keeping them around
+    bindings: int
+    # Changed by writes, None for reads, whose rows are only known once read,
+    # and for failed statements
+    rows: int | None
+    duration: float
+    ok: bool
+    finished_at: float
+
+
+@dataclass(slots=True)
+class StatementStats:
+    count: int = 0
+    failed: int = 0
+    total: float = 0
+    slowest: float = 0
+
+
+_lock = threading.Lock()
+_recent: deque[QueryRecord] = deque(maxlen=RECENT_QUERIES)
+_stats: dict[str, StatementStats] = {}
+_slow_query_threshold: float | None = None
+
+
+def slow_query_threshold() -> float:
+    """Seconds after which a statement is logged as slow."""
+    global _slow_query_threshold
+
+    if _slow_query_threshold is None:
+        milliseconds = cast(
+            float,
+            QtCore.QSettings().value(
+                SLOW_QUERY_SETTING, DEFAULT_SLOW_QUERY_MS, type=float
+            ),
+        )
+        _slow_query_threshold = milliseconds / 1000
+
+    return _slow_query_threshold
+
+
+def set_slow_query_threshold(milliseconds: float) -> None:
+    global _slow_query_threshold
+
+    QtCore.QSettings().setValue(SLOW_QUERY_SETTING, milliseconds)
+    _slow_query_threshold = milliseconds / 1000
+
+
+def timed_exec(query: QtSql.QSqlQuery, statement: str | None = None) -> bool:
+    """Execute `query`, or `statement` with it, and record how it went."""
+    start = time.perf_counter()
+    ok = query.exec() if statement is None else query.exec(statement)
+    duration = time.perf_counter() - start
+
+    bound_values = query.boundValues()
+    record = QueryRecord(
+        statement=ID_LISTS.sub("IN (?)", query.lastQuery()),
+        bindings=zlib.crc32(repr(bound_values).encode()),
+        rows=query.numRowsAffected() if ok and not query.isSelect() else None,
+        duration=duration,
+        ok=ok,
+        finished_at=time.time(),
+    )
+
+    with _lock:
+        _recent.append(record)
+
+        stats = _stats.get(record.statement)
+
+        if stats is None:
+            stats = _stats[record.statement] = StatementStats()
+
+        stats.count += 1
+        stats.failed += not ok
+        stats.total += duration
+        stats.slowest = max(stats.slowest, duration)
+
+    add_span(record.statement, "sql", start, start + duration)
+
+    if ok and duration >= slow_query_threshold():
+        plan = "\n".join(query_plan(query, bound_values))
+        logger.warning(
+            f"Slow query: {duration * 1000:.1f} ms\n{query.lastQuery()}\n{plan}"
+        )
+
+    return ok
+
+
+def query_plan(query: QtSql.QSqlQuery, bound_values: list) -> list[str]:
+    """Steps of the plan SQLite follows for the statement last run by `query`."""
+    # A query made from the same driver runs on the same connection
+    explain = QtSql.QSqlQuery(query.driver().createResult())
+
+    if not explain.prepare("EXPLAIN QUERY PLAN " + query.lastQuery()):
+        return []
+
+    for position, value in enumerate(bound_values):
+        explain.bindValue(position, value)
+
+    if not explain.exec():
+        return []
+
+    steps = []
+
+    while explain.next():
+        # Rows are (id, parent, unused, detail), nested under their parent
+        steps.append((explain.value(0), explain.value(1), explain.value(3)))
+
+    depths = {0: -1}
+    lines = []
+
+    for step_id, parent, detail in steps:
+        depths[step_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[step_id] + detail)
+
+    return lines
+
+
+def recent_queries() -> list[QueryRecord]:
+    """The last RECENT_QUERIES statements run, oldest first."""
+    with _lock:
+        return list(_recent)
+
+
+def statement_stats() -> dict[str, StatementStats]:
+    """Runs of every statement since starting or the last reset."""
+    with _lock:
+        return {
+            statement: StatementStats(
+                stats.count, stats.failed, stats.total, stats.slowest
+            )
+            for statement, stats in _stats.items()
+        }
+
+
+def reset_query_log() -> None:
+    with _lock:
+        _recent.clear()
+        _stats.clear()
@@ -0,0 +1,107 @@
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+from typing import cast
+
+from PySide6 import QtCore, QtSql
+
+from .common import adjust_value, checked_query
+
+
+class RateHistory:
+    """USD-VED exchange rates over time, cached in memory ordered by time.
+
+    A rate applies from its `effective_at` timestamp until the next one, times
+    before the first known rate use that first rate.
+    """
+
+    times: list[int]
+    rates: list[Decimal]
+
+    def __init__(self) -> None:
+        self.times = []
+        self.rates = []
+        self.loaded = False
+
+    def load(self) -> None:
+        self.times.clear()
+        self.rates.clear()
+
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check.exec("SELECT effective_at, rate FROM Rates ORDER BY effective_at")
+
+        while query.next():
+            self.times.append(query.value(0))
+            self.rates.append(Decimal(query.value(1)))
+
+        self.loaded = True
+
+        if not self.times:
+            self._seed_from_settings()
+
+    def _seed_from_settings(self) -> None:
+        # Rates set before the history existed only live in the settings
+        settings = QtCore.QSettings()
+        last_update = settings.value("last-rate-update", None)
+
+        if last_update is not None:
+            rate = cast(str, settings.value("USD-VED-rate", 1, type=str))
+            self.add(Decimal(rate), int(last_update))
+
+    def ensure_loaded(self) -> None:
+        if not self.loaded:
+            self.load()
+
+    def add(self, rate: Decimal, effective_at: int | None = None) -> None:
+        self.ensure_loaded()
+
+        if effective_at is None:
+            effective_at = int(datetime.now().timestamp())
+
+        query = QtSql.QSqlQuery()
+
+        with checked_query(query) as check:
+            check(
+                query.prepare(
+                    "INSERT OR REPLACE INTO Rates(effective_at, rate) VALUES (:at, :rate)"
+                )
+            )
+            query.bindValue(":at", effective_at)
+            query.bindValue(":rate", str(rate))
+            check.exec()
+
+        idx = bisect_right(self.times, effective_at)
+
+        if idx > 0 and self.times[idx - 1] == effective_at:
+            self.rates[idx - 1] = rate
+        else:
+            self.times.insert(idx, effective_at)
+            self.rates.insert(idx, rate)
+
+    def rate_at(self, timestamp: int | float) -> Decimal | None:
+        """Rate in effect at `timestamp`, None if no rate was ever set."""
+        self.ensure_loaded()
+
+        if not self.times:
+            return None
+
+        idx = max(bisect_right(self.times, timestamp) - 1, 0)
+
+        return self.rates[idx]
+
+
+rate_history = RateHistory()
+
+
+def adjust_value_at(
+    source_currency: str,
+    target_currency: str,
+    value: Decimal,
+    timestamp: int | float,
+) -> Decimal:
+    """Like `adjust_value`, using the rate that was in effect at `timestamp`."""
+    return adjust_value(
+        source_currency, target_currency, value, rate_history.rate_at(timestamp)
+    )
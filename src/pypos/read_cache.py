@@ -0,0 +1,114 @@
+from collections.abc import Mapping
+import threading
+from typing import Any
+
+from PySide6 import QtSql
+
+from .common import LRUCache, checked_query
+
+
+class ReadCache:
+    """Results of recent reads made through one connection.
+
+    Entries are keyed by statement and bindings and are only good while the
+    database stays the same. `PRAGMA data_version` changes when another
+    connection commits, and `total_changes()` when this one writes. Both are
+    checked on every read, and any change drops every entry at once.
+
+    Rolling back doesn't undo `total_changes()`, so reads made inside a
+    transaction that may be rolled back must not go through the cache.
+    """
+
+    CAPACITY = 128
+
+    VERSION_QUERY = "SELECT data_version, total_changes() FROM pragma_data_version"
+
+    def __init__(self, db: QtSql.QSqlDatabase) -> None:
+        self.db = db
+        self.results: LRUCache[tuple, tuple[tuple, ...]] = LRUCache(self.CAPACITY)
+        self.version: tuple[int, int] | None = None
+
+    def current_version(self) -> tuple[int, int]:
+        query = QtSql.QSqlQuery(self.db)
+
+        with checked_query(query) as check:
+            check.exec(self.VERSION_QUERY)
+            check(query.next())
+
+        return query.value(0), query.value(1)
+
+    def rows(
+        self, statement: str, bindings: Mapping[str, Any] | None = None
+    ) -> tuple[tuple, ...]:
+        """Rows returned by `statement`, from memory if nothing was written since."""
+        bindings = bindings or {}
+
+        version = self.current_version()
+
+        if version != self.version:
+            self.results.clear()
+            self.version = version
+
+        key = (statement, tuple(sorted(bindings.items())))
+        rows = self.results.get(key)
+
+        if rows is None:
+            rows = self.read(statement, bindings)
+            self.results.put(key, rows)
+
+        return rows
+
+    def read(self, statement: str, bindings: Mapping[str, Any]) -> tuple[tuple, ...]:
+        query = QtSql.QSqlQuery(self.db)
+
+        with checked_query(query) as check:
+            check(query.prepare(statement))
+
+            for name, value in bindings.items():
+                query.bindValue(name, value)
+
+            check.exec()
+
+        n_recs = query.record().count()
+        rows = []
+
+        while query.next():
+            rows.append(tuple(query.value(i) for i in range(n_recs)))
+
+        return tuple(rows)
+
+
+# One per connection, each only used from the thread owning its connection
+_caches: dict[str, ReadCache] = {}
+_caches_lock = threading.Lock()
+
+
+def read_cache(db: QtSql.QSqlDatabase | None = None) -> ReadCache:
+    if db is None:
+        db = QtSql.QSqlDatabase.database()
+
+    with _caches_lock:
+        cache = _caches.get(db.connectionName())
+
+        if cache is None:
+            cache = _caches[db.connectionName()] = ReadCache(db)
+
+    return cache
+
+
+def cached_rows(
+    statement: str,
+    bindings: Mapping[str, Any] | None = None,
+    db: QtSql.QSqlDatabase | None = None,
+) -> tuple[tuple, ...]:
+    return read_cache(db).rows(statement, bindings)
+
+
+def forget_connection(connection_name: str) -> None:
+    """Drop the cache of a connection that is being closed.
+
+    A new connection by the same name starts counting its changes from zero,
+    so the old entries could look current to it.
+    """
+    with _caches_lock:
+        _caches.pop(connection_name, None)
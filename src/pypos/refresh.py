@@ -0,0 +1,108 @@
+from collections.abc import Callable, Hashable
+
+from PySide6 import QtCore
+
+from .tracing import traced
+
+# Scopes used by the application
+INVENTORY = "inventory"  # The whole inventory table
+INVENTORY_ITEM = "inventory-item"  # Single inventory rows, keyed by product id
+PREVIEW = "preview"  # The product preview
+PRODUCT_ACTIONS = "product-actions"  # Buttons for the selected product
+CART = "cart"  # Cart contents, totals and status
+RATES = "rates"  # Inventory values converted at the current rate
+
+
+class RefreshCoordinator(QtCore.QObject):
+    """Collects what needs reloading and reloads each thing once.
+
+    One action usually invalidates the same things from several places, so
+    invalidations are only recorded, and handled together once control gets
+    back to the event loop. A handler gets the keys invalidated in its scope,
+    a scope also invalidated as a whole gets an empty set. Keyed scopes are
+    only ever handled a few keys at a time, invalidating one as a whole
+    invalidates the scope superseding it instead.
+    """
+
+    def __init__(self, parent: QtCore.QObject | None = None) -> None:
+        super().__init__(parent)
+
+        self.handlers: dict[str, Callable[[set[Hashable]], None]] = {}
+        self.supersedes: dict[str, tuple[str, ...]] = {}
+        self.keyed: set[str] = set()
+        self.pending: dict[str, set[Hashable]] = {}
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.flush)
+
+    def register(
+        self,
+        scope: str,
+        handler: Callable[[set[Hashable]], None],
+        supersedes: tuple[str, ...] = (),
+        keyed: bool = False,
+    ) -> None:
+        """Handle invalidations of `scope`, handling also those of `supersedes`."""
+        self.handlers[scope] = handler
+        self.supersedes[scope] = supersedes
+
+        if keyed:
+            self.keyed.add(scope)
+
+    def superseding(self, scope: str) -> str:
+        for other, superseded in self.supersedes.items():
+            if scope in superseded:
+                return other
+
+        raise ValueError(f"Scope {scope} can't be invalidated as a whole")
+
+    def invalidate(self, scope: str, key: Hashable | None = None) -> None:
+        if key is None and scope in self.keyed:
+            scope = self.superseding(scope)
+
+        keys = self.pending.setdefault(scope, set())
+
+        if key is not None:
+            keys.add(key)
+        else:
+            # Whole scope, no point in keeping track of parts of it
+            keys.add(None)
+
+        self.timer.start()
+
+    @QtCore.Slot()
+    @traced
+    def flush(self) -> None:
+        pending, self.pending = self.pending, {}
+
+        for scope in list(pending):
+            for superseded in self.supersedes.get(scope, ()):
+                pending.pop(superseded, None)
+
+        # Handlers run in registration order, so parts are reloaded after the
+        # things containing them
+        for scope, handler in self.handlers.items():
+            if scope not in pending:
+                continue
+
+            keys = pending[scope]
+
+            handler(set() if None in keys else keys)
+
+
+_coordinator: RefreshCoordinator | None = None
+
+
+def refresh_coordinator() -> RefreshCoordinator:
+    global _coordinator
+
+    if _coordinator is None:
+        _coordinator = RefreshCoordinator()
+
+    return _coordinator
+
+
+def invalidate(scope: str, key: Hashable | None = None) -> None:
+    refresh_coordinator().invalidate(scope, key)
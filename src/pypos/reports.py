@@ -1,22 +1,243 @@
+from datetime import date, datetime, time
 from decimal import Decimal
+from typing import cast
 
 from PySide6 import QtCore, QtGui, QtSql, QtWidgets
 from PySide6.QtCore import Qt
 
 from .common import (
+    FP_SHORTEST,
     QUANTITY_FACTOR,
     adjust_value,
     CURRENCY_SYMBOL,
     CURRENCY_FACTOR,
     checked_query,
     make_separator,
+    take_table_items,
+)
+from .db_executor import BACKGROUND, DbJob, db_executor
+from .rates import adjust_value_at, rate_history
+from .sales import PeriodSales, bucket_end, sales_by_period, units_by_product
+from .tracing import traced
+
+
+TOTALS_QUERY = "SELECT kind, currency, total FROM InventoryTotals"
+
+# Same result as TOTALS_QUERY, computed from the inventory itself
+_AGGREGATE_QUERY = """\
+SELECT 'cost', purchase_currency, sum(purchase_value * quantity)
+FROM Products p
+    INNER JOIN Inventory i
+    ON p.id = i.product
+{where}
+GROUP BY purchase_currency
+UNION ALL
+SELECT 'value', sell_currency, sum(sell_value * quantity)
+FROM Products p
+    INNER JOIN Inventory i
+    ON p.id = i.product
+{where}
+GROUP BY sell_currency
+"""
+AGGREGATE_QUERY = _AGGREGATE_QUERY.format(where="")
+AGGREGATE_RANGE_QUERY = _AGGREGATE_QUERY.format(
+    where="WHERE p.id BETWEEN :low AND :high"
 )
 
+RawTotals = dict[tuple[str, str], int]
 
-class ReportsWindow(QtWidgets.QDialog):
-    def __init__(self) -> None:
+
+def raw_inventory_totals(
+    query_str: str = TOTALS_QUERY,
+    bindings: dict[str, int] | None = None,
+    db: QtSql.QSqlDatabase | None = None,
+) -> RawTotals:
+    """Inventory totals by kind and currency, as stored in InventoryTotals."""
+    query = QtSql.QSqlQuery() if db is None else QtSql.QSqlQuery(db)
+
+    with checked_query(query) as check:
+        check(query.prepare(query_str))
+
+        for name, value in (bindings or {}).items():
+            query.bindValue(name, value)
+
+        check.exec()
+
+    totals = {}
+
+    while query.next():
+        totals[query.value(0), query.value(1)] = query.value(2)
+
+    return totals
+
+
+def totals_in_VED(totals: RawTotals) -> tuple[Decimal, Decimal]:
+    """Total purchase cost and sell value in VED from raw inventory totals.
+
+    Totals are summed exactly as integers by SQLite, so converting each currency
+    total once gives the same result as converting every product on its own.
+    """
+    total_cost_VED = Decimal(0)
+    total_value_VED = Decimal(0)
+
+    for (kind, currency), raw_total in totals.items():
+        total = Decimal(raw_total) / (CURRENCY_FACTOR * QUANTITY_FACTOR)
+
+        if kind == "cost":
+            total_cost_VED += adjust_value(currency, "VED", total)
+        else:
+            total_value_VED += adjust_value(currency, "VED", total)
+
+    return total_cost_VED, total_value_VED
+
+
+def inventory_totals(
+    aggregate: bool = False, db: QtSql.QSqlDatabase | None = None
+) -> tuple[Decimal, Decimal]:
+    """Total purchase cost and sell value of the inventory, in VED."""
+    query_str = AGGREGATE_QUERY if aggregate else TOTALS_QUERY
+    return totals_in_VED(raw_inventory_totals(query_str, db=db))
+
+
+def rebuild_inventory_totals(db: QtSql.QSqlDatabase | None = None) -> None:
+    """Recompute InventoryTotals from the inventory."""
+    if db is None:
+        db = QtSql.QSqlDatabase.database()
+
+    db.transaction()
+
+    query = QtSql.QSqlQuery(db)
+
+    try:
+        with checked_query(query) as check:
+            check.exec("DELETE FROM InventoryTotals")
+            check.exec(
+                "INSERT INTO InventoryTotals(kind, currency, total) " + AGGREGATE_QUERY
+            )
+    except BaseException:
+        db.rollback()
+        raise
+
+    db.commit()
+
+
+class ReportJob(DbJob):
+    """Computes the reports on a background lane, inside one read transaction.
+
+    Everything is read from the same snapshot of the database, which with WAL
+    doesn't keep the rest of the application from writing meanwhile.
+    """
+
+    inventory_ready = QtCore.Signal(object)  # (cost, value) in VED
+    sales_ready = QtCore.Signal(object)  # list[PeriodSales]
+    products_ready = QtCore.Signal(object)  # list[(id, name, units)]
+
+    CHUNK_SIZE = 20_000
+
+    def __init__(
+        self,
+        start: date,
+        end: date,
+        period: str,
+        recalculate: bool = False,
+    ) -> None:
         super().__init__()
 
+        self.start_date = start
+        self.end_date = end
+        self.period = period
+        self.recalculate = recalculate
+
+        # Loaded here, as it would otherwise load through the lane connection
+        rate_history.ensure_loaded()
+
+    def run(self, db: QtSql.QSqlDatabase) -> None:
+        self.compute(db)
+
+    def compute(self, db: QtSql.QSqlDatabase) -> None:
+        needs_rebuild = False
+
+        db.transaction()
+
+        try:
+            if self.recalculate:
+                totals = self.aggregate_in_chunks(db)
+
+                if totals is None:
+                    return
+
+                needs_rebuild = totals != raw_inventory_totals(db=db)
+            else:
+                totals = raw_inventory_totals(db=db)
+
+            self.inventory_ready.emit(totals_in_VED(totals))
+
+            if self.cancelled:
+                return
+
+            self.sales_ready.emit(
+                sales_by_period(self.start_date, self.end_date, self.period, db)
+            )
+
+            if self.cancelled:
+                return
+
+            self.products_ready.emit(
+                units_by_product(self.start_date, self.end_date, db=db)
+            )
+        finally:
+            db.rollback()
+
+        if needs_rebuild:
+            rebuild_inventory_totals(db)
+
+    def aggregate_in_chunks(self, db: QtSql.QSqlDatabase) -> RawTotals | None:
+        """Compute inventory totals from every product a range of ids at a time.
+
+        Partial totals are emitted as they are computed, returns None if the
+        computation was cancelled.
+        """
+        query = QtSql.QSqlQuery(db)
+
+        with checked_query(query) as check:
+            check.exec(
+                "SELECT coalesce(min(id), 0), coalesce(max(id), 0) FROM Products"
+            )
+            check(query.next())
+
+        low_id, high_id = query.value(0), query.value(1)
+        n_chunks = (high_id - low_id) // self.CHUNK_SIZE + 1
+
+        totals: RawTotals = {}
+
+        for chunk in range(n_chunks):
+            if self.cancelled:
+                return None
+
+            low = low_id + chunk * self.CHUNK_SIZE
+            chunk_totals = raw_inventory_totals(
+                AGGREGATE_RANGE_QUERY,
+                {":low": low, ":high": low + self.CHUNK_SIZE - 1},
+                db,
+            )
+
+            for key, value in chunk_totals.items():
+                totals[key] = totals.get(key, 0) + value
+
+            self.inventory_ready.emit(totals_in_VED(totals))
+            self.progress.emit(chunk + 1, n_chunks)
+
+        return totals
+
+
+class ReportsWindow(QtWidgets.QDialog):
+    job: ReportJob | None
+
+    def __init__(self, parent: QtWidgets.QWidget | None = None) -> None:
+        super().__init__(parent)
+
+        self.setWindowTitle("Reportes")
+
         layout = QtWidgets.QGridLayout()
         layout.setHorizontalSpacing(40)
 
@@ -42,6 +263,11 @@ class ReportsWindow(QtWidgets.QDialog):
         SB = QtWidgets.QDialogButtonBox.StandardButton
         buttons = QtWidgets.QDialogButtonBox(SB.Ok)
 
+        recalculate_button = buttons.addButton(
+            "&Recalcular", QtWidgets.QDialogButtonBox.ButtonRole.ResetRole
+        )
+        recalculate_button.clicked.connect(self.recalculate)
+
         layout.addWidget(QLabel("Total valor de inventario:"), 0, 0)
         layout.addWidget(self.total_value_VED, 0, 1)
         layout.addWidget(self.total_value_USD, 0, 2)
@@ -58,48 +284,113 @@ class ReportsWindow(QtWidgets.QDialog):
         layout.addWidget(self.total_profit_VED, 3, 1)
         layout.addWidget(self.total_profit_USD, 3, 2)
 
-        layout.addWidget(
-            buttons,
-            layout.rowCount(),
-            0,
-            1,
-            layout.columnCount(),
-        )
+        layout.setRowStretch(layout.rowCount(), 1)
 
-        self.setLayout(layout)
+        inventory_tab = QtWidgets.QWidget()
+        inventory_tab.setLayout(layout)
 
-        self.load_report()
+        self.sales_report = SalesReportWidget()
+
+        tabs = QtWidgets.QTabWidget()
+        tabs.addTab(inventory_tab, "&Inventario")
+        tabs.addTab(self.sales_report, "&Ventas")
+
+        self.progress = QtWidgets.QProgressBar()
+        self.progress.setTextVisible(False)
+        self.progress.hide()
+
+        bottom_layout = QtWidgets.QHBoxLayout()
+        bottom_layout.addWidget(self.progress, 1)
+        bottom_layout.addWidget(buttons)
+
+        main_layout = QtWidgets.QVBoxLayout()
+        main_layout.addWidget(tabs)
+        main_layout.addLayout(bottom_layout)
+
+        self.setLayout(main_layout)
 
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
 
-    def load_report(self) -> None:
-        query = QtSql.QSqlQuery()
+        self.sales_report.parameters_changed.connect(self.load_report)
 
-        with checked_query(query) as check:
-            check(
-                query.exec("""\
-            SELECT purchase_currency, purchase_value, sell_currency, sell_value, quantity
-            FROM Products p
-                INNER JOIN Inventory i
-                ON p.id = i.product
-            """)
+        self.job = None
+        self.load_report()
+
+    @QtCore.Slot()
+    @traced
+    def load_report(self, recalculate: bool = False) -> None:
+        self.cancel_report()
+
+        start, end, period = self.sales_report.parameters()
+
+        self.job = ReportJob(start, end, period, recalculate)
+
+        self.job.progress.connect(self.show_progress)
+        self.job.inventory_ready.connect(self.show_inventory_totals)
+        self.job.sales_ready.connect(self.show_sales)
+        self.job.products_ready.connect(self.show_products)
+        self.job.failed.connect(self.report_failed)
+        self.job.done.connect(self.report_finished)
+
+        self.progress.setRange(0, 0)
+        self.progress.show()
+
+        db_executor().submit(self.job, BACKGROUND)
+
+    def cancel_report(self) -> None:
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+
+    def done(self, result: int) -> None:
+        self.cancel_report()
+        super().done(result)
+
+    def is_current(self) -> bool:
+        # Results from cancelled jobs may still be waiting in the event queue
+        return self.job is not None and self.sender() is self.job
+
+    @QtCore.Slot(int, int)
+    def show_progress(self, done: int, total: int) -> None:
+        if self.is_current():
+            self.progress.setRange(0, total)
+            self.progress.setValue(done)
+
+    @QtCore.Slot()
+    def report_finished(self) -> None:
+        if self.is_current():
+            self.progress.hide()
+
+    @QtCore.Slot()
+    def report_failed(self) -> None:
+        if self.is_current():
+            self.progress.hide()
+            QtWidgets.QMessageBox.warning(
+                self, "Error", "No se pudo generar el reporte."
             )
 
-        total_cost_VED = Decimal(0)
-        total_value_VED = Decimal(0)
+    @QtCore.Slot(object)
+    @traced
+    def show_sales(self, sales: list[PeriodSales]) -> None:
+        if self.is_current():
+            assert self.job is not None
+            self.sales_report.show_sales(
+                sales, self.job.start_date, self.job.end_date, self.job.period
+            )
 
-        while query.next():
-            purchase_currency = query.value(0)
-            purchase_value = Decimal(query.value(1)) / CURRENCY_FACTOR
-            sell_currency = query.value(2)
-            sell_value = Decimal(query.value(3)) / CURRENCY_FACTOR
-            quantity = Decimal(query.value(4)) / QUANTITY_FACTOR
+    @QtCore.Slot(object)
+    @traced
+    def show_products(self, products: list[tuple[int, str, Decimal]]) -> None:
+        if self.is_current():
+            self.sales_report.show_products(products)
 
-            total_cost_VED += (
-                adjust_value(purchase_currency, "VED", purchase_value) * quantity
-            )
-            total_value_VED += adjust_value(sell_currency, "VED", sell_value) * quantity
+    @QtCore.Slot(object)
+    def show_inventory_totals(self, totals: tuple[Decimal, Decimal]) -> None:
+        if not self.is_current():
+            return
+
+        total_cost_VED, total_value_VED = totals
 
         total_profit_VED = total_value_VED - total_cost_VED
 
@@ -124,3 +415,213 @@ class ReportsWindow(QtWidgets.QDialog):
         self.total_cost_USD.setText(format_currency(total_cost_USD, symbol, 2))
         self.total_value_USD.setText(format_currency(total_value_USD, symbol, 2))
         self.total_profit_USD.setText(format_currency(total_profit_USD, symbol, 2))
+
+    @QtCore.Slot()
+    def recalculate(self) -> None:
+        self.load_report(recalculate=True)
+
+
+class SalesReportWidget(QtWidgets.QWidget):
+    parameters_changed = QtCore.Signal()
+
+    PERIODS = {"day": "Día", "week": "Semana", "month": "Mes"}
+    CURRENCIES = ("VED", "USD")
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        today = QtCore.QDate.currentDate()
+
+        self.from_date = QtWidgets.QDateEdit(
+            QtCore.QDate(today.year(), today.month(), 1)
+        )
+        self.to_date = QtWidgets.QDateEdit(today)
+
+        for date_edit in (self.from_date, self.to_date):
+            date_edit.setCalendarPopup(True)
+
+        self.period = QtWidgets.QComboBox()
+
+        for period, label in self.PERIODS.items():
+            self.period.addItem(label, period)
+
+        self.period.setCurrentIndex(self.period.findData("day"))
+
+        controls = QtWidgets.QHBoxLayout()
+
+        from_label = QtWidgets.QLabel("&Desde:")
+        from_label.setBuddy(self.from_date)
+        to_label = QtWidgets.QLabel("&Hasta:")
+        to_label.setBuddy(self.to_date)
+        period_label = QtWidgets.QLabel("&Agrupar por:")
+        period_label.setBuddy(self.period)
+
+        controls.addWidget(from_label)
+        controls.addWidget(self.from_date)
+        controls.addWidget(to_label)
+        controls.addWidget(self.to_date)
+        controls.addStretch()
+        controls.addWidget(period_label)
+        controls.addWidget(self.period)
+
+        header_labels = ["Periodo"]
+        for currency in self.CURRENCIES:
+            symbol = CURRENCY_SYMBOL[currency]
+            header_labels += [f"Ventas {symbol}", f"Ganancia {symbol}"]
+        header_labels += [
+            f"Total ventas {CURRENCY_SYMBOL[currency]}" for currency in self.CURRENCIES
+        ]
+
+        self.sales_table = QtWidgets.QTableWidget()
+        self.sales_table.setColumnCount(len(header_labels))
+        self.sales_table.setHorizontalHeaderLabels(header_labels)
+
+        self.products_table = QtWidgets.QTableWidget()
+        self.products_table.setColumnCount(2)
+        self.products_table.setHorizontalHeaderLabels(["Producto", "Unidades"])
+
+        for table in (self.sales_table, self.products_table):
+            table.setEditTriggers(
+                QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers
+            )
+            table.verticalHeader().hide()
+            h_header = table.horizontalHeader()
+            h_header.setSectionResizeMode(
+                QtWidgets.QHeaderView.ResizeMode.ResizeToContents
+            )
+            h_header.setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeMode.Stretch)
+
+        tables = QtWidgets.QHBoxLayout()
+        tables.addWidget(self.sales_table, 3)
+        tables.addWidget(self.products_table, 2)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addLayout(tables)
+
+        self.setLayout(layout)
+
+        self.from_date.dateChanged.connect(self.parameters_changed)
+        self.to_date.dateChanged.connect(self.parameters_changed)
+        self.period.currentIndexChanged.connect(self.parameters_changed)
+
+    def parameters(self) -> tuple[date, date, str]:
+        start = cast(date, self.from_date.date().toPython())
+        end = cast(date, self.to_date.date().toPython())
+        period = self.period.currentData()
+
+        return start, end, period
+
+    @traced
+    def show_sales(
+        self, sales: list[PeriodSales], start: date, end: date, period: str
+    ) -> None:
+        locale = QtCore.QLocale()
+        number_align = Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight
+
+        def period_label(period_start: date) -> str:
+            q_date = QtCore.QDate(period_start)
+
+            match period:
+                case "day":
+                    return locale.toString(
+                        q_date, QtCore.QLocale.FormatType.ShortFormat
+                    )
+                case "week":
+                    short_date = locale.toString(
+                        q_date, QtCore.QLocale.FormatType.ShortFormat
+                    )
+                    return f"Semana del {short_date}"
+                case _:
+                    return locale.toString(q_date, "MMMM yyyy")
+
+        def value_item(value: Decimal, currency: str) -> QtWidgets.QTableWidgetItem:
+            symbol = CURRENCY_SYMBOL[currency] + " "
+            item = QtWidgets.QTableWidgetItem(
+                locale.toCurrencyString(float(value), symbol, 2)
+            )
+            item.setTextAlignment(number_align)
+            return item
+
+        def value_items(revenue: dict, cost: dict) -> list[QtWidgets.QTableWidgetItem]:
+            items = []
+
+            for currency in self.CURRENCIES:
+                currency_revenue = revenue.get(currency, Decimal(0))
+                currency_profit = currency_revenue - cost.get(currency, Decimal(0))
+
+                items.append(value_item(currency_revenue, currency))
+                items.append(value_item(currency_profit, currency))
+
+            return items
+
+        def equivalent_items(totals: dict) -> list[QtWidgets.QTableWidgetItem]:
+            return [
+                value_item(totals.get(currency, Decimal(0)), currency)
+                for currency in self.CURRENCIES
+            ]
+
+        take_table_items(self.sales_table)
+        self.sales_table.setRowCount(len(sales) + 1)
+
+        total_revenue: dict[str, Decimal] = {}
+        total_cost: dict[str, Decimal] = {}
+        total_equivalent: dict[str, Decimal] = {}
+
+        for row_num, period_sales in enumerate(sales):
+            # All sales of the period at the rate in effect when the period ended
+            period_end = min(bucket_end(period_sales.start, period), end)
+            rate_time = datetime.combine(period_end, time.max).timestamp()
+
+            equivalent = {
+                target: sum(
+                    (
+                        adjust_value_at(currency, target, value, rate_time)
+                        for currency, value in period_sales.revenue.items()
+                    ),
+                    Decimal(0),
+                )
+                for target in self.CURRENCIES
+            }
+
+            row = [QtWidgets.QTableWidgetItem(period_label(period_sales.start))]
+            row += value_items(period_sales.revenue, period_sales.cost)
+            row += equivalent_items(equivalent)
+
+            for column, item in enumerate(row):
+                self.sales_table.setItem(row_num, column, item)
+
+            for currency, value in period_sales.revenue.items():
+                total_revenue[currency] = total_revenue.get(currency, 0) + value
+            for currency, value in period_sales.cost.items():
+                total_cost[currency] = total_cost.get(currency, 0) + value
+            for currency, value in equivalent.items():
+                total_equivalent[currency] = total_equivalent.get(currency, 0) + value
+
+        total_row = [QtWidgets.QTableWidgetItem("Total")]
+        total_row += value_items(total_revenue, total_cost)
+        total_row += equivalent_items(total_equivalent)
+
+        bold_font = total_row[0].font()
+        bold_font.setBold(True)
+
+        for column, item in enumerate(total_row):
+            item.setFont(bold_font)
+            self.sales_table.setItem(len(sales), column, item)
+
+    @traced
+    def show_products(self, products: list[tuple[int, str, Decimal]]) -> None:
+        locale = QtCore.QLocale()
+        number_align = Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight
+
+        take_table_items(self.products_table)
+        self.products_table.setRowCount(len(products))
+
+        for row_num, (_, name, units) in enumerate(products):
+            units_item = QtWidgets.QTableWidgetItem(
+                locale.toString(float(units), "f", FP_SHORTEST)
+            )
+            units_item.setTextAlignment(number_align)
+
+            self.products_table.setItem(row_num, 0, QtWidgets.QTableWidgetItem(name))
+            self.products_table.setItem(row_num, 1, units_item)
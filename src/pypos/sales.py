@@ -0,0 +1,305 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import cast
+
+from PySide6 import QtCore, QtSql
+
+from .common import (
+    CURRENCY_FACTOR,
+    QUANTITY_FACTOR,
+    adjust_value,
+    checked_query,
+)
+
+PERIODS = ("day", "week", "month")
+
+CART_LINES_QUERY = """\
+SELECT p.id, p.name, c.quantity, purchase_currency, purchase_value,
+       sell_currency, sell_value
+FROM Cart c
+    INNER JOIN Products p
+    ON c.product = p.id
+WHERE c.cart = :cart
+"""
+
+INSERT_ITEM_QUERY = """\
+INSERT INTO SaleItems(sale, product, name, quantity, purchase_currency,
+    purchase_value, sell_currency, sell_value, cost)
+VALUES (:sale, :product, :name, :quantity, :purchase_currency,
+    :purchase_value, :sell_currency, :sell_value, :cost)
+"""
+
+# First day of the day, week (starting on monday) and month buckets of a sale
+_BUCKETS = """\
+    SELECT 'day' AS period, date(time, 'unixepoch', 'localtime') AS start
+    FROM Sales WHERE id = :sale
+    UNION ALL
+    SELECT 'week', date(time, 'unixepoch', 'localtime', 'weekday 0', '-6 days')
+    FROM Sales WHERE id = :sale
+    UNION ALL
+    SELECT 'month', date(time, 'unixepoch', 'localtime', 'start of month')
+    FROM Sales WHERE id = :sale
+"""
+
+ROLLUP_QUERY = f"""\
+INSERT INTO SalesRollup(period, start, currency, revenue, cost)
+    SELECT b.period, b.start, i.sell_currency,
+           sum(i.sell_value * i.quantity), sum(i.cost)
+    FROM SaleItems i
+        CROSS JOIN ({_BUCKETS}) b
+    WHERE i.sale = :sale
+    GROUP BY b.period, b.start, i.sell_currency
+ON CONFLICT DO UPDATE SET
+    revenue = revenue + excluded.revenue,
+    cost = cost + excluded.cost
+"""
+
+PRODUCT_ROLLUP_QUERY = f"""\
+INSERT INTO ProductSalesRollup(period, start, product, name, units)
+    SELECT b.period, b.start, i.product, i.name, sum(i.quantity)
+    FROM SaleItems i
+        CROSS JOIN ({_BUCKETS}) b
+    WHERE i.sale = :sale
+    GROUP BY b.period, b.start, i.product
+ON CONFLICT DO UPDATE SET
+    name = excluded.name,
+    units = units + excluded.units
+"""
+
+
+def record_sale(cart_id: int) -> int:
+    """Store the contents of a cart as a sale and add it to the sales rollups.
+
+    Must be called inside a transaction, the cart itself is left untouched.
+    """
+    rate = cast(str, QtCore.QSettings().value("USD-VED-rate", 1, type=str))
+
+    query = QtSql.QSqlQuery()
+    item_query = QtSql.QSqlQuery()
+
+    with checked_query(query) as check:
+        check(query.prepare("INSERT INTO Sales(rate) VALUES (:rate)"))
+        query.bindValue(":rate", rate)
+        check.exec()
+
+        sale_id = query.lastInsertId()
+
+        check(query.prepare(CART_LINES_QUERY))
+        query.bindValue(":cart", cart_id)
+        check.exec()
+
+        with checked_query(item_query) as check_item:
+            check_item(item_query.prepare(INSERT_ITEM_QUERY))
+
+            while query.next():
+                (
+                    product_id,
+                    name,
+                    quantity,
+                    purchase_currency,
+                    purchase_value,
+                    sell_currency,
+                    sell_value,
+                ) = (query.value(i) for i in range(query.record().count()))
+
+                # Purchase cost of the line in the sell currency, at today's rate
+                cost = adjust_value(
+                    purchase_currency,
+                    sell_currency,
+                    Decimal(purchase_value * quantity),
+                    Decimal(rate),
+                ).to_integral_value()
+
+                item_query.bindValue(":sale", sale_id)
+                item_query.bindValue(":product", product_id)
+                item_query.bindValue(":name", name)
+                item_query.bindValue(":quantity", quantity)
+                item_query.bindValue(":purchase_currency", purchase_currency)
+                item_query.bindValue(":purchase_value", purchase_value)
+                item_query.bindValue(":sell_currency", sell_currency)
+                item_query.bindValue(":sell_value", sell_value)
+                item_query.bindValue(":cost", int(cost))
+
+                check_item.exec()
+
+        for rollup_query in (ROLLUP_QUERY, PRODUCT_ROLLUP_QUERY):
+            check(query.prepare(rollup_query))
+            query.bindValue(":sale", sale_id)
+            check.exec()
+
+    return sale_id
+
+
+def bucket_start(day: date, period: str) -> date:
+    match period:
+        case "day":
+            return day
+        case "week":
+            return day - timedelta(days=day.weekday())
+        case "month":
+            return day.replace(day=1)
+        case _:
+            raise ValueError(f"Unknown period {repr(period)}")
+
+
+def bucket_end(start: date, period: str) -> date:
+    """Last day of the bucket starting at `start`."""
+    match period:
+        case "day":
+            return start
+        case "week":
+            return start + timedelta(days=6)
+        case "month":
+            next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            return next_month - timedelta(days=1)
+        case _:
+            raise ValueError(f"Unknown period {repr(period)}")
+
+
+def rollup_buckets(start: date, end: date, coarsest: str) -> list[tuple[str, date]]:
+    """Fewest rollup buckets that exactly cover `start` to `end`, both inclusive.
+
+    Buckets are never coarser than `coarsest`, so each of them is fully contained
+    in one `coarsest` bucket.
+    """
+    allowed = PERIODS[: PERIODS.index(coarsest) + 1]
+    buckets = []
+
+    def fits(day: date, period: str) -> bool:
+        last = bucket_end(day, period)
+
+        # A week may not span two months if months are in use
+        crosses_coarser = any(
+            bucket_start(day, coarser) != bucket_start(last, coarser)
+            for coarser in allowed[allowed.index(period) + 1 :]
+        )
+
+        return bucket_start(day, period) == day and last <= end and not crosses_coarser
+
+    day = start
+
+    while day <= end:
+        period = next(period for period in reversed(allowed) if fits(day, period))
+        buckets.append((period, day))
+        day = bucket_end(day, period) + timedelta(days=1)
+
+    return buckets
+
+
+def _bucket_condition(
+    buckets: list[tuple[str, date]],
+) -> tuple[str, dict[str, str]]:
+    """WHERE condition matching `buckets`, consecutive ones merged in ranges."""
+    ranges: list[list] = []
+
+    for period, start in buckets:
+        if ranges and ranges[-1][0] == period:
+            ranges[-1][2] = start
+        else:
+            ranges.append([period, start, start])
+
+    conditions = []
+    bindings = {}
+
+    for n, (period, first, last) in enumerate(ranges):
+        conditions.append(
+            f"(period = :period{n} AND start BETWEEN :first{n} AND :last{n})"
+        )
+        bindings[f":period{n}"] = period
+        bindings[f":first{n}"] = first.isoformat()
+        bindings[f":last{n}"] = last.isoformat()
+
+    return " OR ".join(conditions) or "FALSE", bindings
+
+
+@dataclass(slots=True)
+class PeriodSales:
+    start: date
+    revenue: dict[str, Decimal]
+    cost: dict[str, Decimal]
+
+
+def sales_by_period(
+    start: date, end: date, period: str, db: QtSql.QSqlDatabase | None = None
+) -> list[PeriodSales]:
+    """Revenue and cost by sell currency for each `period` from `start` to `end`.
+
+    Partial periods at either end only include the days inside the range.
+    """
+    condition, bindings = _bucket_condition(rollup_buckets(start, end, period))
+
+    query = QtSql.QSqlQuery() if db is None else QtSql.QSqlQuery(db)
+
+    with checked_query(query) as check:
+        check(
+            query.prepare(
+                "SELECT start, currency, revenue, cost FROM SalesRollup "
+                f"WHERE {condition}"
+            )
+        )
+
+        for name, value in bindings.items():
+            query.bindValue(name, value)
+
+        check.exec()
+
+    factor = CURRENCY_FACTOR * QUANTITY_FACTOR
+    results: dict[date, PeriodSales] = {}
+
+    while query.next():
+        row_start = date.fromisoformat(query.value(0))
+        currency = query.value(1)
+        revenue = Decimal(query.value(2)) / factor
+        cost = Decimal(query.value(3)) / factor
+
+        # Rollups are never coarser than `period`, so each falls in a single one
+        display_start = max(bucket_start(row_start, period), start)
+
+        sales = results.setdefault(display_start, PeriodSales(display_start, {}, {}))
+        sales.revenue[currency] = sales.revenue.get(currency, Decimal(0)) + revenue
+        sales.cost[currency] = sales.cost.get(currency, Decimal(0)) + cost
+
+    return sorted(results.values(), key=lambda sales: sales.start)
+
+
+def units_by_product(
+    start: date, end: date, limit: int = 50, db: QtSql.QSqlDatabase | None = None
+) -> list[tuple[int, str, Decimal]]:
+    """Best selling products from `start` to `end` as (id, name, units)."""
+    condition, bindings = _bucket_condition(rollup_buckets(start, end, "month"))
+
+    query = QtSql.QSqlQuery() if db is None else QtSql.QSqlQuery(db)
+
+    with checked_query(query) as check:
+        check(
+            query.prepare(
+                f"""\
+            SELECT product, max(name), sum(units) AS total_units
+            FROM ProductSalesRollup
+            WHERE {condition}
+            GROUP BY product
+            ORDER BY total_units DESC
+            LIMIT :limit
+            """
+            )
+        )
+
+        for name, value in bindings.items():
+            query.bindValue(name, value)
+        query.bindValue(":limit", limit)
+
+        check.exec()
+
+    products = []
+
+    while query.next():
+        products.append(
+            (
+                query.value(0),
+                query.value(1),
+                Decimal(query.value(2)) / QUANTITY_FACTOR,
+            )
+        )
+
+    return products
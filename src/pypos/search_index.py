@@ -0,0 +1,174 @@
+from array import array
+from collections.abc import Iterable
+import re
+from typing import cast
+
+from PySide6 import QtCore
+
+from .changes import IndexLoader, ProductNameIndex
+
+GRAM_SIZE = 3
+
+
+def grams(text: str) -> set[str]:
+    return {text[i : i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class SearchIndex(ProductNameIndex):
+    """Product names held in memory with an inverted trigram index.
+
+    Answers the same searches as the SQL path of InventoryModel, in the same
+    order: the words of the query must appear in the name in that order, names
+    starting with the query first, then those with a word starting with it,
+    then the rest, each group sorted by name.
+
+    Names are numbered in name order when the index is built, so matches come
+    out sorted by just following the numbers. Names added later are numbered
+    after those, and groups holding any of them are sorted when searching.
+    Removed names are only blanked, their numbers are reused by nothing until
+    the index is built again.
+    """
+
+    LOAD_ORDER = " ORDER BY name_simplified"
+
+    ids: array[int]
+    names: list[str | None]
+    docs: dict[int, int]
+    postings: dict[str, array[int]]
+
+    def __init__(self, products: Iterable[tuple[int, str]] = (), seq: int = 0) -> None:
+        """Index `products`, (id, name_simplified) pairs sorted by name."""
+        self.ids = array("q")
+        self.names = []
+        self.docs = {}
+        self.postings = {}
+        super().__init__(products, seq)
+
+        for product_id, name in products:
+            self.add(product_id, name)
+
+        self.sorted_docs = len(self.names)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, product_id: int, name: str) -> None:
+        doc = len(self.names)
+
+        self.ids.append(product_id)
+        self.names.append(name)
+        self.docs[product_id] = doc
+
+        postings = self.postings
+
+        for gram in grams(name):
+            posting = postings.get(gram)
+
+            if posting is None:
+                posting = postings[gram] = array("i")
+
+            posting.append(doc)
+
+    def remove(self, product_id: int) -> None:
+        doc = self.docs.pop(product_id, None)
+
+        if doc is not None:
+            self.names[doc] = None
+
+    def update(self, product_id: int, name: str) -> None:
+        doc = self.docs.get(product_id)
+
+        if doc is not None and self.names[doc] == name:
+            return
+
+        self.remove(product_id)
+        self.add(product_id, name)
+
+    def search(self, text: str) -> list[int] | None:
+        """Ids of the products matching `text`, a simplified query, in order.
+
+        None if no word of `text` is long enough to narrow down the names to
+        check, scanning them all is faster in SQLite.
+        """
+        candidates = self.candidates(text)
+
+        if candidates is None:
+            return None
+
+        in_order = ".*?".join(re.escape(word) for word in text.split(" "))
+        matches = re.compile(in_order, re.DOTALL).search
+        # Same as the pattern, anchored at the start of the name
+        starts = re.compile(in_order, re.DOTALL).match
+        word_starts = re.compile(" " + in_order, re.DOTALL).search
+
+        names = self.names
+        ranked: tuple[list[int], list[int], list[int]] = ([], [], [])
+
+        for doc in candidates:
+            name = names[doc]
+
+            if name is None or not matches(name):
+                continue
+
+            if starts(name):
+                ranked[0].append(doc)
+            elif word_starts(name):
+                ranked[1].append(doc)
+            else:
+                ranked[2].append(doc)
+
+        ids = self.ids
+        result = []
+
+        for docs in ranked:
+            if docs and docs[-1] >= self.sorted_docs:
+                docs.sort(key=lambda doc: cast(str, names[doc]))
+
+            result.extend(ids[doc] for doc in docs)
+
+        return result
+
+    def candidates(self, text: str) -> Iterable[int] | None:
+        """Ascending numbers of the names holding every gram of `text`."""
+        query_grams = set().union(*(grams(word) for word in text.split(" ")))
+
+        if not query_grams:
+            return None
+
+        empty = array("i")
+        postings = sorted(
+            (self.postings.get(gram, empty) for gram in query_grams), key=len
+        )
+
+        docs = postings[0]
+
+        if len(postings) == 1 or not docs:
+            return docs
+
+        # Narrow down while that's cheaper than checking the extra names
+        found = set(docs)
+
+        for posting in postings[1:]:
+            if len(posting) > 16 * len(found):
+                break
+
+            found.intersection_update(posting)
+
+        return sorted(found)
+
+
+def search_index_enabled() -> bool:
+    return cast(bool, QtCore.QSettings().value("search_index", False, type=bool))
+
+
+_loader = IndexLoader(SearchIndex, "search-index", search_index_enabled)
+
+
+def search_index() -> SearchIndex | None:
+    """The up to date index, None if searches must go through SQL for now."""
+    return _loader.current()
+
+
+def load_search_index() -> None:
+    """Load the index in the background if enabled, drop it otherwise."""
+    _loader.load()
@@ -11,6 +11,10 @@ from .common import (
     make_separator,
     settings_group,
 )
+from .completion import completion_enabled
+from .query_log import set_slow_query_threshold, slow_query_threshold
+from .rates import rate_history
+from .search_index import search_index_enabled
 
 
 class SettingsWindow(QtWidgets.QDialog):
@@ -33,6 +37,19 @@ class SettingsWindow(QtWidgets.QDialog):
             self.default_sell_currency.addItem(symbol, currency)
 
         self.calc_from_purchase = QtWidgets.QCheckBox()
+        self.search_index = QtWidgets.QCheckBox()
+        self.search_index.setToolTip(
+            "Búsquedas más rápidas en inventarios grandes, a cambio de más memoria"
+        )
+        self.search_completion = QtWidgets.QCheckBox()
+        self.search_completion.setToolTip(
+            "Sugerencias al escribir en la búsqueda, a cambio de más memoria"
+        )
+        self.slow_query_ms = QtWidgets.QSpinBox()
+        self.slow_query_ms.setRange(1, 60_000)
+        self.slow_query_ms.setToolTip(
+            "Las consultas que tarden más se registran junto a su plan"
+        )
 
         form_layout.addRow("Margen por defecto:", self.default_margin)
         form_layout.addRow(make_separator())
@@ -44,6 +61,11 @@ class SettingsWindow(QtWidgets.QDialog):
         form_layout.addRow(
             "Calcular precio de venta automaticamente", self.calc_from_purchase
         )
+        form_layout.addRow(make_separator())
+        form_layout.addRow("Buscar con índice en memoria", self.search_index)
+        form_layout.addRow("Sugerir búsquedas", self.search_completion)
+        form_layout.addRow(make_separator())
+        form_layout.addRow("Consultas lentas (ms)", self.slow_query_ms)
 
         layout.addLayout(form_layout)
 
@@ -72,6 +94,9 @@ class SettingsWindow(QtWidgets.QDialog):
             settings.setValue("sell_currency", self.default_sell_currency.currentData())
 
         settings.setValue("calc_from_purchase", self.calc_from_purchase.isChecked())
+        settings.setValue("search_index", self.search_index.isChecked())
+        settings.setValue("search_completion", self.search_completion.isChecked())
+        set_slow_query_threshold(self.slow_query_ms.value())
 
         super().accept()
 
@@ -99,6 +124,10 @@ class SettingsWindow(QtWidgets.QDialog):
         )
         self.calc_from_purchase.setChecked(calc_from_purchase)
 
+        self.search_index.setChecked(search_index_enabled())
+        self.search_completion.setChecked(completion_enabled())
+        self.slow_query_ms.setValue(round(slow_query_threshold() * 1000))
+
 
 class ExchangeRateWindow(QtWidgets.QDialog):
     def __init__(self) -> None:
@@ -130,9 +159,18 @@ class ExchangeRateWindow(QtWidgets.QDialog):
 
     @QtCore.Slot()
     def accept(self) -> None:
+        rate = self.exchange_rate.decimal_value()
+        now = int(datetime.now().timestamp())
+
+        # An empty history is seeded from the settings, that must happen while
+        # they still hold the previous rate
+        rate_history.ensure_loaded()
+
         settings = QtCore.QSettings()
-        settings.setValue("USD-VED-rate", str(self.exchange_rate.decimal_value()))
-        settings.setValue("last-rate-update", int(datetime.now().timestamp()))
+        settings.setValue("USD-VED-rate", str(rate))
+        settings.setValue("last-rate-update", now)
+
+        rate_history.add(rate, now)
 
         super().accept()
 
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+# Set to report how long starting took, "exit" also quits once started
+STARTUP_TIMES_VAR = "PYPOS_STARTUP_TIMES"
+
+_started = time.perf_counter()
+_milestones: list[tuple[str, float]] = []
+
+
+def startup_times_enabled() -> bool:
+    return bool(os.environ.get(STARTUP_TIMES_VAR))
+
+
+def mark(milestone: str) -> None:
+    """Record that startup got to `milestone`."""
+    if startup_times_enabled():
+        _milestones.append((milestone, time.perf_counter()))
+
+
+def report() -> None:
+    """Print the time to each milestone, counted from when pypos was imported.
+
+    The imports themselves are broken down by running with `python -X
+    importtime`.
+    """
+    if not startup_times_enabled() or not _milestones:
+        return
+
+    previous = _started
+
+    for milestone, reached in _milestones:
+        print(
+            f"startup: {(reached - _started) * 1000:8.1f} ms "
+            f"(+{(reached - previous) * 1000:7.1f} ms) {milestone}",
+            file=sys.stderr,
+        )
+        previous = reached
+
+    _milestones.clear()
+
+    if os.environ[STARTUP_TIMES_VAR] == "exit":
+        from PySide6 import QtCore
+
+        # Quitting right away would skip shutting down what startup goes on
+        # to start after reporting
+        QtCore.QTimer.singleShot(0, QtCore.QCoreApplication.quit)
@@ -0,0 +1,172 @@
+from collections.abc import Callable
+import functools
+import inspect
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, cast
+
+from PySide6 import QtCore
+
+# Set to a file to trace from startup, the trace is written to it on exit
+TRACE_VAR = "PYPOS_TRACE"
+
+logger = logging.getLogger(__name__)
+
+# Chrome trace events, None while not tracing
+_events: list[dict] | None = None
+_started = 0.0
+_thread_names: dict[int, str] = {}
+
+
+def tracing_enabled() -> bool:
+    return _events is not None
+
+
+def start_tracing() -> None:
+    global _events, _started
+
+    _thread_names.clear()
+    _started = time.perf_counter()
+    _events = []
+
+
+def stop_tracing(path: Path | str | None = None) -> int:
+    """Stop tracing, writing the spans recorded to `path` if given.
+
+    The file is in the Chrome trace event format, opened by Perfetto or
+    chrome://tracing. Returns how many spans were recorded. If writing fails
+    the OSError is raised and tracing goes on, the trace can be saved again.
+    """
+    global _events
+
+    events = _events
+
+    if events is None:
+        return 0
+
+    if path is not None:
+        pid = os.getpid()
+        thread_names = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in list(_thread_names.items())
+        ]
+
+        with open(path, "w") as trace_file:
+            json.dump(
+                {"traceEvents": thread_names + events, "displayTimeUnit": "ms"},
+                trace_file,
+            )
+
+    _events = None
+
+    return len(events)
+
+
+def save_startup_trace() -> None:
+    """Write the trace started through TRACE_VAR, if still tracing."""
+    path = os.environ.get(TRACE_VAR)
+
+    if not path:
+        return
+
+    try:
+        stop_tracing(path)
+    except OSError as e:
+        logger.error(f"Could not write the trace to {path}: {e.strerror}")
+
+
+def add_span(
+    name: str, category: str, start: float, end: float, args: dict | None = None
+) -> None:
+    """Record a span from `start` to `end`, perf_counter() times, on this thread.
+
+    Spans on the same thread nest by time, no parent needs to be given.
+    """
+    events = _events
+
+    # Not tracing, or started before tracing did
+    if events is None or start < _started:
+        return
+
+    tid = threading.get_native_id()
+
+    if tid not in _thread_names:
+        thread_name = QtCore.QThread.currentThread().objectName()
+        _thread_names[tid] = thread_name or threading.current_thread().name
+
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": (start - _started) * 1e6,
+        "dur": (end - start) * 1e6,
+        "pid": os.getpid(),
+        "tid": tid,
+    }
+
+    if args:
+        event["args"] = args
+
+    events.append(event)
+
+
+class span:
+    """Record the time spent in a `with` block as a span."""
+
+    def __init__(self, name: str, category: str = "app") -> None:
+        self.name = name
+        self.category = category
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        if _events is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *_: object) -> None:
+        if _events is not None:
+            add_span(self.name, self.category, self.start, time.perf_counter())
+
+
+def traced[F: Callable[..., Any]](fn: F) -> F:
+    """Record every call to `fn` as a span while tracing.
+
+    Goes below `QtCore.Slot`, which must see the traced function.
+    """
+    name = fn.__qualname__
+
+    # Signals pass as many arguments as the slot's code takes, PySide can't
+    # see through the wrapper, so the extra ones are dropped here instead
+    code = cast(Any, fn).__code__
+    takes_any = code.co_flags & inspect.CO_VARARGS
+    positional = code.co_argcount
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not takes_any:
+            args = args[:positional]
+
+        if _events is None:
+            return fn(*args, **kwargs)
+
+        start = time.perf_counter()
+
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            add_span(name, "app", start, time.perf_counter())
+
+    return cast(F, wrapper)
+
+
+if os.environ.get(TRACE_VAR):
+    start_tracing()
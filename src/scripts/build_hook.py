@@ -12,9 +12,22 @@ class ResourceBuildHook(BuildHookInterface):
     def initialize(self, version: str, build_data: dict[str, Any]) -> None:
         root_path = Path(self.root)
         resource_file = root_path / "resources.qrc"
-        target_file = root_path / "src" / "pypos" / "resources.py"
+        package_path = root_path / "src" / "pypos"
 
+        # Registered at startup, Qt maps it instead of loading it into memory
         run(
-            ["pyside6-rcc", resource_file, "-o", target_file],
+            [
+                "pyside6-rcc",
+                "--binary",
+                resource_file,
+                "-o",
+                package_path / "resources.rcc",
+            ],
+            check=True,
+        )
+
+        # Imported instead if the bundle can't be registered
+        run(
+            ["pyside6-rcc", resource_file, "-o", package_path / "resources.py"],
             check=True,
         )